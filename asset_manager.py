@@ -0,0 +1,95 @@
+from collections import OrderedDict
+from os import walk
+import pygame
+import os, threading
+from settings import *
+
+class AssetManager:
+    """
+    Cache of loaded, converted and scaled surfaces keyed by path, size and alpha.
+    Cached surfaces are shared by every caller, so draw on a copy if one needs changing.
+    Least recently used entries are dropped once the cache grows past its byte budget.
+    """
+    def __init__(self, max_bytes = ASSET_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.cache = OrderedDict()  # key -> (surface or tuple of frames, size in bytes)
+        self.bytes = 0
+        self.lock = threading.RLock()   # sprites are also created from the llm threads
+
+        # counters for stats()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def image(self, path, size = None, alpha = True):
+        """Image at path, converted for the display and optionally scaled to size"""
+        key = (path, tuple(size) if size else None, alpha)
+        with self.lock:
+            surf = self.lookup(key)
+            if surf is None:
+                if size:
+                    surf = pygame.transform.scale(self.image(path, alpha = alpha), key[1])
+                else:
+                    surf = pygame.image.load(path)
+                    surf = surf.convert_alpha() if alpha else surf.convert()
+                self.store(key, surf, surface_bytes(surf))
+            return surf
+
+    def frames(self, path, size = None, scale = None, alpha = True):
+        """Numbered images of a folder in order (same as support.import_folder), optionally resized"""
+        key = (path, tuple(size) if size else None, scale, alpha)
+        with self.lock:
+            frames = self.lookup(key)
+            if frames is None:
+                frames = []
+                for _, _, img_files in walk(path):
+                    img_files.sort(key = lambda name: int(os.path.splitext(name)[0]))
+                    for image in img_files:
+                        surf = self.image(path + '/' + image, alpha = alpha)
+                        if scale:
+                            surf = pygame.transform.scale(surf, (surf.get_width() * scale, surf.get_height() * scale))
+                        elif size:
+                            surf = pygame.transform.scale(surf, size)
+                        frames.append(surf)
+                frames = tuple(frames)
+                self.store(key, frames, sum(surface_bytes(surf) for surf in frames))
+            return list(frames)
+
+    def lookup(self, key):
+        entry = self.cache.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.cache.move_to_end(key)
+        return entry[0]
+
+    def store(self, key, value, size):
+        self.cache[key] = (value, size)
+        self.bytes += size
+
+        # evict the least recently used entries, but always keep the newest one
+        while self.bytes > self.max_bytes and len(self.cache) > 1:
+            _, (_, evicted_size) = self.cache.popitem(last = False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+            self.bytes = 0
+
+    def stats(self):
+        return {
+            'entries': len(self.cache),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions}
+
+def surface_bytes(surf):
+    return surf.get_width() * surf.get_height() * surf.get_bytesize()
+
+# shared by every module
+asset_manager = AssetManager()
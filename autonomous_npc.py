@@ -6,8 +6,13 @@ from sprites import TextSprite, Interaction, QuestStatusSprite, QuestionMarkSpri
 from quest import TalkQuest, CollectQuest, QuestionQuest, QuestStatus
 from question import Question
 from system_message_template import CONVERSATIONAL_ROLE_TEMPLATE, ASSISTANT_ROLE_TEMPLATE, QUESTIONER_ROLE_TEMPLATE
-from pytmx.util_pygame import load_pygame
-from pathfinding import find_path
+from map_data import load_map
+from world_grid import DYNAMIC_OBSTACLES
+from pathfinding import path_to_waypoints, smooth_path, swept_rows, CooperativePlanner
+from dstar_lite import DStarLite
+from path_engine import PathEngine
+from flow_field import FlowFieldService
+from path_service import PathService
 import json, configparser
 
 from langchain.prompts import PromptTemplate
@@ -16,12 +21,14 @@ from langgraph.prebuilt import create_react_agent
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
 import threading
+from collections import deque
+from concurrent.futures import Future, InvalidStateError, TimeoutError    # not the builtin one before python 3.11
 
 from dotenv import load_dotenv, find_dotenv
 load_dotenv(find_dotenv())
 
 class Autonomous_NPC(pygame.sprite.Sprite):
-    def __init__(self, pos, attributes, group, collision_sprites, tree_sprites, interaction_sprites, soil_layer, get_time, get_weather, get_location, get_locations_with_topic, get_player_level, set_is_buffering):
+    def __init__(self, pos, attributes, group, collision_sprites, tree_sprites, interaction_sprites, soil_layer, world_grid, pathfinder, get_time, get_weather, get_location, get_locations_with_topic, get_player_level, set_is_buffering):
         self.group = group
         super().__init__(group)
 
@@ -35,10 +42,12 @@ class Autonomous_NPC(pygame.sprite.Sprite):
         self.z = LAYERS['main']
 
         # handle npc movements
-        self.create_collision_grid()
-        self.path = []
+        self.world_grid = world_grid     # shared with the soil layer and the game master
+        self.pathfinder = pathfinder     # shared by every npc, a CooperativePlanner or anything with its find_path, release and reserved_by_others
+        self.path = deque()    # waypoints left after the one the npc is walking to, None waits a time step
         self.stepx = 0         # X distance from destination 
         self.stepy = 0         # Y distance from destination 
+        self.step_speed = (0, 0)    # px/s along x and y, so both reach the waypoint together
         
         # movement attributes
         self.direction = pygame.math.Vector2()
@@ -53,11 +62,22 @@ class Autonomous_NPC(pygame.sprite.Sprite):
         # collision
         self.hitbox = self.rect.copy().inflate((-126,-70))
         self.collision_sprites = collision_sprites
+
+        # dynamic obstacles: the route is repaired around trees, crops and events,
+        # other npcs are kept apart by the reservations of the cooperative planner
+        self.destination = None
+        self.route = None               # DStarLite planner, only while dynamic obstacles are in the way
+        self.obstacles_moved = set()    # tiles whose dynamic obstacles changed since the last waypoint
+        self.obstacles_lock = threading.Lock()
+        self.world_grid.subscribe(self.obstacles_changed, DYNAMIC_OBSTACLES)
+        self.arrival = None             # Future of the position the npc stops at, resolved by the main loop
         
         # timers
         self.timers =  {
             'tool use': Timer(1000),
             'seed use': Timer(1000),
+            'wait': Timer(NPC_STEP_TIME),
+            'renew reservations': Timer(NPC_STEP_TIME * COOPERATIVE_WINDOW // 2),
             'generate question': Timer(10000, self.llm_generate_question),
             'generate quest': Timer(10000, self.llm_generate_quest)
         }
@@ -121,23 +141,16 @@ class Autonomous_NPC(pygame.sprite.Sprite):
         return f"NPC Name: {self.npc_attributes['name']}"
     
     def import_assets(self):
-        self.animations = {'up': [],'down': [],'left': [],'right': [],
-                    'right_idle':[],'left_idle':[],'up_idle':[],'down_idle':[],
-                    'right_hoe':[],'left_hoe':[],'up_hoe':[],'down_hoe':[],
-                    'right_axe':[],'left_axe':[],'up_axe':[],'down_axe':[],
-                    'right_water':[],'left_water':[],'up_water':[],'down_water':[]}
-
-        # Import image surface into animations dict
-        for animation in self.animations.keys():
-            full_path = './graphics/character/' + animation
-            self.animations[animation] = import_folder(full_path)
+        # Frames are loaded once and shared by every character
+        self.animations = import_animations('./graphics/character/', CHARACTER_ANIMATIONS)
     
     def get_target_pos(self):
 
         self.target_pos = self.rect.center + PLAYER_TOOL_OFFSET[self.status.split('_')[0]]
     
     def collision(self, direction):
-        for sprite in self.collision_sprites.sprites():
+        # only the blockers around the hitbox can collide with it
+        for sprite in self.collision_sprites.candidates(self.hitbox):
             if hasattr(sprite, 'hitbox'):
                 if sprite.hitbox.colliderect(self.hitbox):
                     if direction == 'horizontal':
@@ -179,15 +192,6 @@ class Autonomous_NPC(pygame.sprite.Sprite):
         for timer in self.timers.values():
             timer.update()
     
-    def create_collision_grid(self):
-        # Use for calculating path for movement
-        tmx_data = load_pygame('./data/map.tmx')
-        h_tiles, v_tiles = tmx_data.width, tmx_data.height
-        
-        self.grid = [[[] for _ in range(h_tiles)] for _ in range(v_tiles)]
-        for x, y, _ in load_pygame('./data/map.tmx').get_layer_by_name('Collision').tiles():
-            self.grid[y][x].append('C')
-    
     def assign_quest(self, quest):
         self.quest = quest
         
@@ -204,13 +208,17 @@ class Autonomous_NPC(pygame.sprite.Sprite):
         """
         Make the character to end position with x and y coordinate in a 2D vector space
         """
-        self.path = find_path(self.grid, start={'x': self.pos.x, 'y': self.pos.y}, end={'x': endx, 'y': endy})
-        # while True:
-        #     if not len(self.path) and not self.stepx and not self.stepy:
-        #         break
-        duration = 500 * len(self.path)
-        self.timer_wrapper(duration)
-        return f"The current position is {self.pos.x}, {self.pos.y}"
+        path = self.pathfinder.find_path(start={'x': self.pos.x, 'y': self.pos.y}, end={'x': endx, 'y': endy}, agent=self)
+        # the main loop starts popping waypoints right after set_path, so self.path can't tell
+        arrival = self.set_path(path, endx, endy)
+        if not path:
+            return f"There is no way to {endx}, {endy}. The current position is {self.pos.x}, {self.pos.y}"
+        # the tool call sleeps until the main loop sees the npc stop
+        try:
+            x, y = arrival.result(timeout = NPC_MOVE_TIMEOUT)
+        except TimeoutError:
+            return f"Still walking to {endx}, {endy}. The current position is {self.pos.x}, {self.pos.y}"
+        return f"The current position is {x}, {y}"
     
     def use_tool(self, tool):
         """
@@ -224,7 +232,8 @@ class Autonomous_NPC(pygame.sprite.Sprite):
         self.timers['tool use'].activate()
         
         if self.selected_tool == 'hoe':
-            self.soil_layer.get_hit(self.target_pos)
+            if not self.soil_layer.get_hit(self.target_pos):
+                return "there is no uncultivated farmable soil here"
             return "soil cultivated successfully"
         
         if self.selected_tool == 'axe':
@@ -233,7 +242,8 @@ class Autonomous_NPC(pygame.sprite.Sprite):
                     tree.damage()
         
         if self.selected_tool == 'water':
-            self.soil_layer.water(self.target_pos)
+            if not self.soil_layer.water(self.target_pos):
+                return "there is no cultivated soil here to water"
             return "soil watered successfully"
     
     def use_seed(self, seed) -> str:
@@ -245,7 +255,8 @@ class Autonomous_NPC(pygame.sprite.Sprite):
         self.timers['seed use'].activate()
         
         if self.seed_inventory[seed] > 0:
-            self.soil_layer.plant_seed(self.target_pos, seed)
+            if not self.soil_layer.plant_seed(self.target_pos, seed):
+                return f"there is no free cultivated soil here to plant {seed}"
             self.seed_inventory[seed] -= 1
             return f"{seed} seed is planted successfully"
         else:
@@ -297,26 +308,126 @@ class Autonomous_NPC(pygame.sprite.Sprite):
         self.messages.append(f"generated a quest: {quantity}, {question_topic}")
         return "quest generated successfully"
     
-    def timer_wrapper(self, duration):
-        # Create delay in lang chain tools calling
-        llm_timer = Timer(duration)
-        llm_timer.activate()
-        while llm_timer.active:
-            llm_timer.update()
-    
+    def set_path(self, path, endx, endy):
+        """
+        Starts walking the waypoints of path to (endx, endy), around dynamic obstacles if they are in the way.
+        Returns a Future of the position the npc stops at, a new path stops the old one where the npc is
+        """
+        arrival = Future()
+        self.destination = {'x': endx, 'y': endy}
+        self.drop_route()
+        self.path = self.smooth(path)
+        self.timers['renew reservations'].activate()
+        if self.path_is_blocked():
+            self.plan_route()
+        # set last, so the main loop never sees the new future with the old path
+        previous, self.arrival = self.arrival, arrival
+        if previous is not None:
+            self.resolve(previous)
+        return arrival
+
+    def resolve(self, arrival):
+        # both the main loop and a new path from an llm thread can get to it first
+        try:
+            arrival.set_result((self.pos.x, self.pos.y))
+        except InvalidStateError:
+            pass
+
+    def check_arrival(self):
+        arrival = self.arrival
+        if arrival is not None and not arrival.done() and not self.path and not self.stepx and not self.stepy and not self.timers['wait'].active:
+            self.resolve(arrival)
+
+    def obstacles_changed(self, flags, tiles):
+        with self.obstacles_lock:
+            self.obstacles_moved.update(tiles)
+
+    def step_end(self):
+        """Where the current step ends, the npc's position between steps"""
+        return (self.pos.x + self.direction.x * self.stepx, self.pos.y + self.direction.y * self.stepy)
+
+    def smooth(self, path):
+        # string pulling: the npc walks straight past every waypoint its hitbox can skip, but not across the tiles of other npcs
+        return smooth_path(self.world_grid, self.step_end(), path, self.hitbox.width / 2, self.hitbox.height / 2, avoid = self.pathfinder.reserved_by_others(self))
+
+    def path_is_blocked(self, tiles = None):
+        """
+        True if a dynamic obstacle stands on a tile the remaining path crosses (on one of tiles, if given).
+        The tile the npc stands on and the destination tile do not count
+        """
+        previous = self.step_end()
+        exempt = (self.world_grid.tile_at(previous), self.world_grid.tile_at((self.destination['x'], self.destination['y'])))
+        for waypoint in self.path:
+            if waypoint is None:
+                continue
+            for row, left, right in swept_rows(previous, waypoint):
+                for x in range(left, right + 1):
+                    tile = (x, row)
+                    if tile not in exempt and (tiles is None or tile in tiles) and self.world_grid.get(tile) & DYNAMIC_OBSTACLES:
+                        return True
+            previous = waypoint
+        return False
+
+    def plan_route(self):
+        """Walks around dynamic obstacles with D* Lite, which repairs its route as they move instead of searching again"""
+        start = self.world_grid.tile_at(self.pos)
+        if self.route is None:
+            self.route = DStarLite(self.world_grid, start, self.world_grid.tile_at((self.destination['x'], self.destination['y'])))
+        else:
+            self.route.repair(start)
+        tiles = self.route.tile_path()
+        path = self.smooth(path_to_waypoints(tiles, self.destination))
+        if path:    # while obstacles wall the destination off, keep walking the old path
+            self.path = path
+            # the other npcs keep planning around the route, where it does not run into their reservations
+            self.pathfinder.hold(self, tiles)
+
+    def drop_route(self):
+        if self.route is not None:
+            self.route.close()
+            self.route = None
+
+    def avoid_obstacles(self):
+        # the static path is kept until a dynamic obstacle steps on it, then D* Lite takes over until the destination
+        with self.obstacles_lock:
+            moved, self.obstacles_moved = self.obstacles_moved, set()
+        if not self.path:
+            self.drop_route()
+        elif self.route is not None or (moved and self.path_is_blocked(moved)):
+            self.plan_route()
+
+    def renew_reservations(self):
+        # WHCA*: the path is only reserved for a window of time steps, so it is planned again halfway through.
+        # the planner skips the renewal while an llm thread is planning, then it is tried again at the next waypoint
+        if not self.timers['renew reservations'].active and self.route is None and len(self.path) > 1:
+            path = self.pathfinder.renew_path(start={'x': self.pos.x, 'y': self.pos.y}, end=self.destination, agent=self)
+            if path is not None:
+                self.path = self.smooth(path)
+                self.timers['renew reservations'].activate()
+
     def update_steps(self):
-        if not self.path or self.stepx != 0 or self.stepy != 0:
+        if self.stepx != 0 or self.stepy != 0 or self.timers['wait'].active:
+            return
+        self.avoid_obstacles()
+        if not self.path:
             return
-        endx, endy = self.path.pop(0)   # Get the next location in the path found
+        self.renew_reservations()
+        waypoint = self.path.popleft()  # Get the next location in the path found
+        if waypoint is None:            # Wait a time step for another npc to pass
+            self.timers['wait'].activate()
+            return
+        endx, endy = waypoint
         startx, starty = self.pos.x, self.pos.y
         
         # Compute step distances
         self.stepx = abs(endx-startx)
         self.stepy = abs(endy-starty)
+        length = (self.stepx ** 2 + self.stepy ** 2) ** 0.5 or 1
+        self.step_speed = (self.speed * self.stepx / length, self.speed * self.stepy / length)
         
         # Determine movement direction
-        self.direction.x = 1 if endx > startx else -1
-        self.direction.y = 1 if endy > starty else -1
+        self.direction.x = (endx > startx) - (endx < startx)
+        self.direction.y = (endy > starty) - (endy < starty)
         
         if self.direction.y == 1:
             self.status = 'down'
@@ -331,8 +442,8 @@ class Autonomous_NPC(pygame.sprite.Sprite):
     
     def move(self, dt):
         if self.stepx > 0:
-            move_x = min(self.speed * dt, self.stepx) * self.direction.x
-            self.pos.x = int(self.pos.x + move_x)
+            move_x = min(self.step_speed[0] * dt, self.stepx) * self.direction.x
+            self.pos.x += move_x
             self.hitbox.centerx = round(self.pos.x)
             self.rect.centerx = self.hitbox.centerx
             self.collision('horizontal')
@@ -341,10 +452,11 @@ class Autonomous_NPC(pygame.sprite.Sprite):
             if self.stepx <= 0: 
                 self.stepx = 0
                 self.direction.x = 0
+                self.pos.x = round(self.pos.x)
 
         if self.stepy > 0:
-            move_y = min(self.speed * dt, self.stepy) * self.direction.y
-            self.pos.y = int(self.pos.y + move_y)
+            move_y = min(self.step_speed[1] * dt, self.stepy) * self.direction.y
+            self.pos.y += move_y
             self.hitbox.centery = round(self.pos.y)
             self.rect.centery = self.hitbox.centery
             self.collision('vertical')
@@ -353,9 +465,11 @@ class Autonomous_NPC(pygame.sprite.Sprite):
             if self.stepy <= 0: 
                 self.stepy = 0
                 self.direction.y = 0
+                self.pos.y = round(self.pos.y)
         
         # Update Interaction Sprite around him
         self.interaction_sprite.rect.topleft = (self.rect.x, self.rect.y)
+        self.interaction_sprites.refresh(self.interaction_sprite)
     
     def load_learning(self, filename="config.ini"):
         config = configparser.ConfigParser()
@@ -524,6 +638,7 @@ What is your response?
         self.get_target_pos()
         
         self.move(dt)
+        self.check_arrival()
         self.animate(dt)
         
         if self.npc_attributes.get('role', '') == "Questioner" and getattr(self.question, "status", None) != "not attempted" and not self.timers['generate question'].active and not self.generating_question:
@@ -537,22 +652,32 @@ What is your response?
             self.generating_quest = True
 
 class NPC_Manager:
-    def __init__(self, group, collision_sprites, tree_sprites, interaction_sprites, soil_layer, get_time, get_weather, get_location, get_locations_with_topic, get_player_level, set_is_buffering):
+    def __init__(self, group, collision_sprites, tree_sprites, interaction_sprites, soil_layer, world_grid, get_time, get_weather, get_location, get_locations_with_topic, get_player_level, set_is_buffering):
         self.npcs = pygame.sprite.Group()
-        self.setup(group, collision_sprites, tree_sprites, interaction_sprites, soil_layer, get_time, get_weather, get_location, get_locations_with_topic, get_player_level, set_is_buffering)
+        self.world_grid = world_grid
+        self.path_engine = PathEngine(world_grid)
+        
+        # popular destinations follow flow fields, other trips go to the engine or on big maps the hierarchical planner.
+        # searches and field builds run in the worker processes of the path service
+        self.path_service = PathService(world_grid)
+        self.flow_fields = FlowFieldService(world_grid, self.path_engine, self.path_service, builder = self.path_service)
+        # npcs reserve the tiles they are about to walk on, so their paths do not cross each other
+        self.planner = CooperativePlanner(world_grid, self.flow_fields)
+        self.setup(group, collision_sprites, tree_sprites, interaction_sprites, soil_layer, world_grid, get_time, get_weather, get_location, get_locations_with_topic, get_player_level, set_is_buffering)
     
-    def setup(self, group, collision_sprites, tree_sprites, interaction_sprites, soil_layer, get_time, get_weather, get_location, get_locations_with_topic, get_player_level, set_is_buffering):    
+    def setup(self, group, collision_sprites, tree_sprites, interaction_sprites, soil_layer, world_grid, get_time, get_weather, get_location, get_locations_with_topic, get_player_level, set_is_buffering):    
         # Load NPC profiles from JSON
         with open("npc_profiles.json", "r") as file:
             npc_data = json.load(file)
         
-        tmx_data = load_pygame('./data/map.tmx')
+        map_data = load_map()
         
-        for obj in tmx_data.get_layer_by_name('NPC'):
+        for obj in map_data.objects('NPC'):
             if obj.type == 'NPC':
                 if obj.name in npc_data:
-                    npc = Autonomous_NPC((obj.x, obj.y), npc_data[obj.name], group, collision_sprites, tree_sprites, interaction_sprites, soil_layer, get_time, get_weather, get_location, get_locations_with_topic, get_player_level, set_is_buffering)
+                    npc = Autonomous_NPC((obj.x, obj.y), npc_data[obj.name], group, collision_sprites, tree_sprites, interaction_sprites, soil_layer, world_grid, self.planner, get_time, get_weather, get_location, get_locations_with_topic, get_player_level, set_is_buffering)
                     self.npcs.add(npc)
+                    self.planner.park(npc, npc.pos)
                 else:
                     print("NPC not found in json data")
     
@@ -560,4 +685,31 @@ class NPC_Manager:
         for npc in self.npcs:
             if npc.npc_attributes['name'] == npc_name:
                 return npc
-        return None
\ No newline at end of file
+        return None
+    
+    def get_npc_names(self):
+        return [npc.npc_attributes['name'] for npc in self.npcs]
+    
+    def move_npcs(self, destinations):
+        """
+        Walks several npcs at once on paths planned together, so they do not block each other on the way
+        destinations: {npc name: (x, y)}, npcs earlier in it get the shorter paths. Returns the names of the npcs that cannot get there
+        """
+        trips = {}
+        stuck = []
+        for name, (x, y) in destinations.items():
+            npc = self.get_npc_by_name(name)
+            if npc is None:
+                stuck.append(name)
+            else:
+                trips[npc] = {'x': x, 'y': y}
+        paths = self.planner.plan([(npc, self.world_grid.tile_at(npc.pos), self.world_grid.tile_at((end['x'], end['y']))) for npc, end in trips.items()])
+        for npc, end in trips.items():
+            npc.set_path(path_to_waypoints(paths[npc], end), end['x'], end['y'])
+            if not paths[npc]:
+                stuck.append(npc.npc_attributes['name'])
+        return stuck
+
+    def close(self):
+        # stop the path worker processes when the game quits
+        self.path_service.close()
\ No newline at end of file
@@ -0,0 +1,82 @@
+import pygame
+from collections import OrderedDict
+from settings import *
+
+class ChunkRenderer:
+    """
+    Draws static tile layers from large pre-baked surfaces instead of one sprite per tile.
+    Chunks are baked lazily when they come near the camera and the least recently used ones are evicted.
+    """
+    def __init__(self, chunk_tiles = CHUNK_TILES, max_chunks = MAX_CACHED_CHUNKS):
+        self.display_surface = pygame.display.get_surface()
+        self.chunk_size = chunk_tiles * TILE_SIZE
+        self.max_chunks = max_chunks
+        
+        self.tiles = {}             # (z, chunk x, chunk y) -> [(rect, surf)]
+        self.layers = []            # z values with static tiles, bottom first
+        self.cache = OrderedDict()  # (z, chunk x, chunk y) -> baked surface, least recently used first
+        self.tile_count = 0
+
+    def add_tile(self, pos, surf, z):
+        rect = surf.get_rect(topleft = pos)
+        # a tile larger than the grid can spill into the neighbouring chunks
+        for chunk_x, chunk_y in self.chunks_in(rect):
+            self.tiles.setdefault((z, chunk_x, chunk_y), []).append((rect, surf))
+            self.cache.pop((z, chunk_x, chunk_y), None)     # bake again with the new tile
+        
+        if z not in self.layers:
+            self.layers.append(z)
+            self.layers.sort()
+        self.tile_count += 1
+
+    def chunks_in(self, rect):
+        size = self.chunk_size
+        for chunk_y in range(rect.top // size, (rect.bottom - 1) // size + 1):
+            for chunk_x in range(rect.left // size, (rect.right - 1) // size + 1):
+                yield chunk_x, chunk_y
+
+    def bake(self, key):
+        _, chunk_x, chunk_y = key
+        origin = pygame.math.Vector2(chunk_x * self.chunk_size, chunk_y * self.chunk_size)
+        surf = pygame.Surface((self.chunk_size, self.chunk_size), pygame.SRCALPHA)
+        
+        # same order the tiles had as sprites: by centery, then by creation
+        for rect, tile_surf in sorted(self.tiles[key], key = lambda tile: tile[0].centery):
+            surf.blit(tile_surf, rect.topleft - origin)
+        
+        # fully covered chunks (most of the ground) can skip per pixel alpha blending,
+        # sparse ones (hills, water, house floors) are run length encoded so empty space costs next to nothing
+        if pygame.mask.from_surface(surf, 254).count() == self.chunk_size * self.chunk_size:
+            return surf.convert()
+        surf = surf.convert_alpha()
+        surf.set_alpha(255, pygame.RLEACCEL)
+        return surf
+
+    def get_chunk(self, key):
+        surf = self.cache.get(key)
+        if surf is not None:
+            self.cache.move_to_end(key)
+            return surf
+        
+        surf = self.bake(key)
+        self.cache[key] = surf
+        while len(self.cache) > self.max_chunks:
+            self.cache.popitem(last = False)
+        return surf
+
+    def prefetch(self, camera_rect):
+        """Bake at most one missing chunk around the camera so walking into it does not stall a frame"""
+        near_rect = camera_rect.inflate(self.chunk_size, self.chunk_size)
+        for chunk_x, chunk_y in self.chunks_in(near_rect):
+            for z in self.layers:
+                key = (z, chunk_x, chunk_y)
+                if key in self.tiles and key not in self.cache:
+                    self.get_chunk(key)
+                    return
+
+    def draw_layer(self, z, camera_rect, offset):
+        for chunk_x, chunk_y in self.chunks_in(camera_rect):
+            key = (z, chunk_x, chunk_y)
+            if key in self.tiles:
+                pos = (chunk_x * self.chunk_size - offset.x, chunk_y * self.chunk_size - offset.y)
+                self.display_surface.blit(self.get_chunk(key), pos)
@@ -0,0 +1,50 @@
+import pygame
+from settings import *
+from spatial_hash import SpatialGroup
+
+class Blocker:
+    """
+    Invisible collision tile. Only keeps the rect and the hitbox a Generic of the same size would have,
+    so thousands of them cost no pixel memory and never go through the sprite group machinery.
+    """
+    __slots__ = ('rect', 'hitbox')
+
+    def __init__(self, pos, size = (TILE_SIZE, TILE_SIZE)):
+        self.rect = pygame.Rect(pos, size)
+        self.hitbox = self.rect.copy().inflate(-self.rect.width * 0.2, -self.rect.height * 0.75)
+
+class CollisionGroup(SpatialGroup):
+    """
+    Sprites that block movement, bucketed by hitbox on a tile sized grid
+    so a moving character only tests the blockers around it.
+    Sprites placed as obstacles on world_grid keep their obstacle on the tiles under their hitbox, and lose it when they are killed.
+    """
+    rect_attr = 'hitbox'
+
+    def __init__(self, *sprites, cell_size = TILE_SIZE, world_grid = None):
+        self.world_grid = world_grid
+        super().__init__(*sprites, cell_size = cell_size)
+        self.blockers = []
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        if self.world_grid is not None:
+            self.world_grid.remove_obstacle(sprite)     # rocks of unlocked areas open up for the npcs
+
+    def refresh(self, sprite):
+        super().refresh(sprite)
+        if self.world_grid is not None and sprite in self.world_grid.obstacles:
+            self.world_grid.place_obstacle(sprite, self.world_grid.tiles_under(sprite.hitbox))     # a chopped tree leaves a smaller stump
+
+    def add_blocker(self, blocker):
+        """Index a static Blocker. It is not a sprite, so it only lives in the spatial hash"""
+        self.blockers.append(blocker)
+        self.sequence[blocker] = self.counter
+        self.counter += 1
+        self.spatial_hash.insert(blocker, blocker.hitbox)
+
+    def candidates(self, hitbox):
+        """Blockers that can touch hitbox while it is pushed out of other blockers, in group order"""
+        # resolving a collision moves the hitbox by less than its own size,
+        # so two hitbox lengths around it cover a couple of pushes in a row
+        return self.query(hitbox.inflate(hitbox.width * 4, hitbox.height * 4))
@@ -0,0 +1,138 @@
+"""
+Walks many agents at once on data/map.tmx with its fences, trees, flowers and rocks placed as obstacles like level.Level does,
+once on paths planned one by one (flow fields, as the npcs did before) and once on WHCA* paths planned together against
+the reservation table of pathfinding.CooperativePlanner. Agents take one tile per time step. Counts the times two agents
+stand on one tile or walk through each other, and the walks that run into an obstacle (an npc hands those to D* Lite).
+Then walks single agents guided by pathfinding.PathGuide (no destination popular enough for a flow field),
+nobody is in their way so every one of them that can reach its end has to arrive.
+
+    python cooperative_benchmark.py [agents] [seed]
+"""
+import os, sys, time
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import numpy as np
+import pygame
+from settings import *
+from world_grid import WorldGrid, IMPASSABLE, DYNAMIC_OBSTACLES
+from map_data import load_map
+from path_engine import PathEngine
+from flow_field import FlowFieldService
+from pathfinding import CooperativePlanner
+from pathfinding_benchmark import place_map_obstacles
+
+def open_tiles(world_grid):
+    return [(int(x), int(y)) for y, x in np.argwhere(~world_grid.mask(IMPASSABLE))]
+
+def random_trips(tiles, count, rng):
+    """Distinct start tiles and distinct end tiles anywhere on the map"""
+    starts = rng.choice(len(tiles), count, replace = False)
+    ends = rng.choice(len(tiles), count, replace = False)
+    return [(tiles[a], tiles[b]) for a, b in zip(starts, ends)]
+
+def crossing_trips(tiles, count, rng, radius = 8):
+    """Two crowds around two far apart tiles swapping sides, so their paths share the same streets"""
+    a = tiles[rng.integers(len(tiles))]
+    b = max(tiles, key = lambda tile: abs(tile[0] - a[0]) + abs(tile[1] - a[1]))
+    near_a = [tile for tile in tiles if abs(tile[0] - a[0]) + abs(tile[1] - a[1]) <= radius]
+    near_b = [tile for tile in tiles if abs(tile[0] - b[0]) + abs(tile[1] - b[1]) <= radius]
+    half = min(count // 2, len(near_a), len(near_b))
+    from_a = [near_a[i] for i in rng.choice(len(near_a), half, replace = False)]
+    from_b = [near_b[i] for i in rng.choice(len(near_b), half, replace = False)]
+    return list(zip(from_a, from_b[::-1])) + list(zip(from_b, from_a[::-1]))
+
+def conflicts(walks):
+    """Tiles shared at the same time step and pairs of agents swapping tiles, agents stay on their last tile"""
+    length = max(len(walk) for walk in walks)
+    at = lambda walk, step: walk[min(step, len(walk) - 1)]
+    vertex = swaps = 0
+    for step in range(length):
+        tiles = [at(walk, step) for walk in walks]
+        vertex += len(tiles) - len(set(tiles))
+        if step:
+            moves = {(at(walk, step - 1), tile) for walk, tile in zip(walks, tiles) if at(walk, step - 1) != tile}
+            swaps += sum((b, a) in moves for a, b in moves) // 2
+    return vertex, swaps
+
+def into_obstacles(world_grid, walks, trips):
+    """Walks that step on a dynamic obstacle between their start and their end"""
+    return sum(any(world_grid.get(tile) & DYNAMIC_OBSTACLES for tile in walk if tile not in (start, end)) for walk, (start, end) in zip(walks, trips))
+
+def independent(flow_fields, trips):
+    t0 = time.perf_counter()
+    walks = [flow_fields.field(end).tile_path(start) or [start] for start, end in trips]
+    total = (time.perf_counter() - t0) * 1000
+    return walks, total, [total]
+
+def cooperative(world_grid, flow_fields, trips):
+    """WHCA*: every agent still walking is planned again in one batch every half window, first in line changes every batch so crowds do not lock up"""
+    planner = CooperativePlanner(world_grid, flow_fields)
+    agents = list(range(len(trips)))
+    for agent, (start, end) in enumerate(trips):
+        planner.reservations.park(agent, start)
+
+    walks = [[start] for start, end in trips]
+    batch_times = []
+    step = 0
+    walking = agents
+    # crowds packed around their ends can lock up for good, WHCA* is not complete
+    while walking and step < world_grid.width + world_grid.height + 100 * planner.window:
+        t0 = time.perf_counter()
+        order = walking[len(batch_times) % len(walking):] + walking[:len(batch_times) % len(walking)]
+        paths = planner.plan([(agent, walks[agent][-1], trips[agent][1]) for agent in order], step)
+        batch_times.append((time.perf_counter() - t0) * 1000)
+        for agent in walking:
+            walks[agent].extend(paths[agent][1:planner.window // 2 + 1])
+        # agents that walked their whole path are done, even if they passed their end to let someone through before,
+        # agents that cannot reach their end stop walking
+        walking = [agent for agent in walking if len(paths[agent]) > planner.window // 2 + 1]
+        step += planner.window // 2
+        for agent in agents:
+            walks[agent].extend([walks[agent][-1]] * (step + 1 - len(walks[agent])))
+    return walks, sum(batch_times), batch_times
+
+def lone_agents(world_grid, path_engine, trips):
+    """Every trip walked by an agent on its own with a PathGuide, returns the agents that arrive and the ones that could"""
+    guides = FlowFieldService(world_grid, path_engine, min_requests = float('inf'))
+    arrived = reachable = 0
+    for start, end in trips:
+        if not path_engine.tile_path(start, end):
+            continue
+        reachable += 1
+        walks, _, _ = cooperative(world_grid, guides, [(start, end)])
+        arrived += walks[0][-1] == end
+    return arrived, reachable
+
+def benchmark(name, world_grid, flow_fields, trips):
+    flow_fields.fields.clear()
+    results = (('independent', independent(flow_fields, trips)), ('whca*', cooperative(world_grid, flow_fields, trips)))
+    reachable = sum(bool(flow_fields.field(end).tile_path(start)) for start, end in trips)
+    print(f'{name}: {len(trips)} agents, {reachable} can reach their end')
+    for label, (walks, total, batches) in results:
+        vertex, swaps = conflicts(walks)
+        arrived = [walk for walk, (start, end) in zip(walks, trips) if walk[-1] == end]
+        # a walk is padded with its last tile, so its cost ends where the agent last moved
+        costs = [max((i for i in range(1, len(walk)) if walk[i] != walk[i - 1]), default = 0) for walk in arrived]
+        waits = sum(cost - sum(walk[i] != walk[i - 1] for i in range(1, cost + 1)) for walk, cost in zip(arrived, costs))
+        print(f'  {label:12} plan {total:8.1f} ms ({np.mean(batches):6.1f} ms/batch, max {max(batches):6.1f})   conflicts {vertex:4} shared tiles {swaps:3} swaps')
+        print(f'  {"":12} arrived {len(arrived):3}   sum of costs {sum(costs):5}   makespan {max(costs, default = 0):4}   waits {waits:4}   into obstacles {into_obstacles(world_grid, walks, trips):3}')
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    rng = np.random.default_rng(int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    map_data = load_map()
+    world_grid = WorldGrid.from_map(map_data)
+    place_map_obstacles(world_grid, map_data)
+    path_engine = PathEngine(world_grid)
+    flow_fields = FlowFieldService(world_grid, path_engine, max_fields = count * 2)
+    tiles = open_tiles(world_grid)
+
+    benchmark('data/map.tmx with obstacles, random trips', world_grid, flow_fields, random_trips(tiles, count, rng))
+    benchmark('data/map.tmx with obstacles, two crowds crossing', world_grid, flow_fields, crossing_trips(tiles, count, rng))
+
+    t0 = time.perf_counter()
+    arrived, reachable = lone_agents(world_grid, path_engine, random_trips(tiles, count, rng))
+    print(f'data/map.tmx with obstacles, lone agents on path guides: {arrived} of {reachable} arrive ({(time.perf_counter() - t0) * 1000:.0f} ms)')
@@ -3,6 +3,8 @@ import pyperclip
 import re, threading
 from quest import QuestStatus
 from settings import *
+from text_cache import text_cache
+from text_layout import text_layout
 
 from dotenv import load_dotenv, find_dotenv
 load_dotenv(find_dotenv())
@@ -14,7 +16,7 @@ class Dialogue_Menu:
         
         # general setup
         self.display_surface = pygame.display.get_surface()
-        self.font = pygame.font.Font('./font/LycheeSoda.ttf', 30)
+        self.font = text_cache.font('./font/LycheeSoda.ttf', 30)
 
         self.active = False
         self.can_open_chat = True  # Flag to prevent immediate re-opening
@@ -60,20 +62,21 @@ class Dialogue_Menu:
         # Render and display NPC dialogue
         if self.npc:
             # Wrap text to fit inside the chatbox
-            wrapped_text = self.wrap_text(f"{self.npc.npc_attributes['name']}: {self.message}", chatbox_rect.width - 40)
+            text = f"{self.npc.npc_attributes['name']}: {self.message}"
+            wrapped_text = text_layout.wrap(text, self.font, chatbox_rect.width - 40)
+            line_height = self.font.get_height() + 5  # Space between lines
             
-            # Render each line inside the chatbox
+            # Render the wrapped lines inside the chatbox
             y_offset = chatbox_rect.y + 20  # Start position for text inside box
-            for line in wrapped_text:
-                npc_surface = self.font.render(line, True, WHITE)
-                self.display_surface.blit(npc_surface, (chatbox_rect.x + 20, y_offset))
-                y_offset += self.font.get_height() + 5  # Space between lines
+            paragraph = text_layout.paragraph(text, self.font, chatbox_rect.width - 40, WHITE, line_height)
+            self.display_surface.blit(paragraph, (chatbox_rect.x + 20, y_offset))
+            y_offset += len(wrapped_text) * line_height
                 
             # Display quest rewards if have quest
             if self.quest_active and self.npc_has_quest():
                 rewards = self.npc.quest.rewards
                 rewards_str = ", ".join(f"{k}: {v}" for reward in rewards for k, v in reward.items())
-                npc_surface = self.font.render(f"Rewards: {rewards_str}", True, YELLOW)
+                npc_surface = text_cache.render(self.font, f"Rewards: {rewards_str}", True, YELLOW)
                 self.display_surface.blit(npc_surface, (chatbox_rect.x + 20, y_offset))
 
     def draw_input_box(self):
@@ -84,7 +87,7 @@ class Dialogue_Menu:
         pygame.draw.rect(self.display_surface, BLACK, input_box_rect, width=3, border_radius=10)
 
         # Render and display the player's input text
-        input_surface = self.font.render(self.input_text, True, BLACK)
+        input_surface = text_cache.render(self.font, self.input_text, True, BLACK)
         self.display_surface.blit(input_surface, (input_box_rect.x + 10, input_box_rect.y + 10))
 
         # Cursor blinking
@@ -114,7 +117,7 @@ class Dialogue_Menu:
             pygame.draw.rect(self.display_surface, GREEN, (self.BOX_X, self.BOX_Y, filled_width, self.BOX_HEIGHT), border_radius=5)
             
         # Render progress text
-        progress_text = self.font.render(f"{progress} / {target}", True, BLACK)
+        progress_text = text_cache.render(self.font, f"{progress} / {target}", True, BLACK)
         text_x = self.BOX_X + self.BOX_WIDTH // 2 - progress_text.get_width() // 2
         text_y = self.BOX_Y + self.BOX_HEIGHT // 2 - progress_text.get_height() // 2
         self.display_surface.blit(progress_text, (text_x, text_y))
@@ -238,7 +241,7 @@ class Dialogue_Menu:
             text_color=BLACK)
         
         # Display Gold
-        money_text = self.font.render(f'Money: {self.player.money}', True, BLACK)
+        money_text = text_cache.render(self.font, f'Money: {self.player.money}', True, BLACK)
         self.display_surface.blit(money_text, (CHATBOX_MARGIN, SCREEN_HEIGHT - CHATBOX_HEIGHT - CHATBOX_MARGIN - INPUT_BOX_HEIGHT - 110))
     
     def draw_info_box(self):
@@ -257,7 +260,7 @@ class Dialogue_Menu:
         button_rect = pygame.Rect(x, y, width, height)
         pygame.draw.rect(self.display_surface, background_color, button_rect, border_radius=border_radius)
         pygame.draw.rect(self.display_surface, border_color, button_rect, width=3, border_radius=border_radius)
-        button_text = self.font.render(text, True, text_color)
+        button_text = text_cache.render(self.font, text, True, text_color)
         self.display_surface.blit(
             button_text,
             (button_rect.centerx - button_text.get_width() // 2, button_rect.centery - button_text.get_height() // 2),  # Center text
@@ -399,27 +402,6 @@ class Dialogue_Menu:
                         self.message = ""           # Remove quest name from message
                         self.close_npc_chat()
         
-    def wrap_text(self, text, max_width):
-        """Splits text into multiple lines based on available width."""
-        words = text.split()  # Split text into individual words
-        lines = []
-        current_line = ""
-
-        for word in words:
-            # Check if adding this word exceeds the width
-            test_line = f"{current_line} {word}".strip()
-            if self.font.size(test_line)[0] < max_width:
-                current_line = test_line
-            else:
-                lines.append(current_line)  # Store current line and start a new one
-                current_line = word  # Start with the new word
-
-        # Append last line
-        if current_line:
-            lines.append(current_line)
-
-        return lines  
-
     def start_npc_chat(self, player, npc_name, quest = False, question = False):
         if not self.can_open_chat:
             return
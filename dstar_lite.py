@@ -0,0 +1,138 @@
+import heapq
+import threading
+from settings import *
+from world_grid import TileFlag, DYNAMIC_OBSTACLES
+
+INF = float('inf')
+
+class DStarLite:
+    """
+    D* Lite (Koenig and Likhachev) for one npc walking to one goal tile. It searches backwards from the goal,
+    so when tiles change under a moving npc only the distances those tiles affect are repaired,
+    instead of searching again from scratch. 4 directional movement with uniform costs, like pathfinding.a_star.
+
+    Collision tiles and dynamic obstacles (trees, other npcs, plants, event sprites) block the way.
+    Nothing blocks the tile the npc stands on, and dynamic obstacles do not block the goal.
+    Changes reported by the world grid are queued and applied on the next repair().
+    """
+    def __init__(self, world_grid, start, goal, blocking = TileFlag.COLLISION | DYNAMIC_OBSTACLES):
+        self.world_grid = world_grid
+        self.blocking = int(blocking)
+        self.start = start
+        self.goal = goal
+        self.last = start       # start when the key modifier was last updated
+
+        self.g = {}
+        self.rhs = {goal: 0}
+        self.key_modifier = 0
+        self.open_set = [(self.heuristic(start, goal), 0, goal)]
+        self.queued = {goal: (self.heuristic(start, goal), 0)}     # tile -> key it is queued with, stale heap entries are skipped
+        self.expanded = 0       # tiles expanded since the planner was created
+
+        self.changed = set()
+        self.lock = threading.RLock()   # the world grid can report changes from the llm threads
+        self.world_grid.subscribe(self.tiles_changed, TileFlag(self.blocking))
+        self.compute_shortest_path()
+
+    def close(self):
+        """Stops listening to the world grid"""
+        self.world_grid.unsubscribe(self.tiles_changed)
+
+    def heuristic(self, a, b):
+        return abs(a[0] - b[0]) + abs(a[1] - b[1])
+
+    def is_blocked(self, tile):
+        x, y = tile
+        if not self.world_grid.in_bounds(x, y):
+            return True
+        if tile == self.start:
+            return False
+        blocking = self.blocking & ~DYNAMIC_OBSTACLES if tile == self.goal else self.blocking
+        return bool(self.world_grid.flags[y, x] & blocking)
+
+    def neighbors(self, tile):
+        x, y = tile
+        return ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1))
+
+    def cost(self, a, b):
+        return INF if self.is_blocked(a) or self.is_blocked(b) else 1
+
+    def calculate_key(self, tile):
+        best = min(self.g.get(tile, INF), self.rhs.get(tile, INF))
+        return (best + self.heuristic(self.start, tile) + self.key_modifier, best)
+
+    def update_vertex(self, tile):
+        if tile != self.goal:
+            self.rhs[tile] = min((self.cost(tile, neighbor) + self.g.get(neighbor, INF) for neighbor in self.neighbors(tile)), default = INF)
+        self.queued.pop(tile, None)
+        if self.g.get(tile, INF) != self.rhs.get(tile, INF):
+            key = self.calculate_key(tile)
+            self.queued[tile] = key
+            heapq.heappush(self.open_set, (*key, tile))
+
+    def top_key(self):
+        # drop heap entries that were requeued or removed since they were pushed
+        while self.open_set:
+            k1, k2, tile = self.open_set[0]
+            if self.queued.get(tile) == (k1, k2):
+                return (k1, k2)
+            heapq.heappop(self.open_set)
+        return (INF, INF)
+
+    def compute_shortest_path(self):
+        start = self.start
+        while self.top_key() < self.calculate_key(start) or self.rhs.get(start, INF) > self.g.get(start, INF):
+            k1, k2, tile = heapq.heappop(self.open_set)
+            del self.queued[tile]
+            self.expanded += 1
+            new_key = self.calculate_key(tile)
+            g, rhs = self.g.get(tile, INF), self.rhs.get(tile, INF)
+            if (k1, k2) < new_key:
+                self.queued[tile] = new_key
+                heapq.heappush(self.open_set, (*new_key, tile))
+            elif g > rhs:
+                self.g[tile] = rhs
+                for neighbor in self.neighbors(tile):
+                    self.update_vertex(neighbor)
+            else:
+                self.g[tile] = INF
+                self.update_vertex(tile)
+                for neighbor in self.neighbors(tile):
+                    self.update_vertex(neighbor)
+
+    def tiles_changed(self, flags, tiles):
+        with self.lock:
+            self.changed.update(tiles)
+
+    def repair(self, start = None):
+        """Moves the planner to the npc's current tile and applies the tile changes queued since the last repair"""
+        with self.lock:
+            changed, self.changed = self.changed, set()
+            if start is not None and start != self.start:
+                # the tile the npc stood on is not exempt from blocking anymore, the new one is
+                changed.update((self.start, start))
+                self.start = start
+                self.key_modifier += self.heuristic(self.last, start)
+                self.last = start
+            if not changed:
+                return False
+
+            for tile in changed:
+                self.update_vertex(tile)
+                for neighbor in self.neighbors(tile):
+                    self.update_vertex(neighbor)
+            self.compute_shortest_path()
+            return True
+
+    def tile_path(self):
+        """Every tile from the npc to the goal (both included), [] if the goal cannot be reached"""
+        with self.lock:
+            # the search can stop before it settles g of the start, its rhs already holds the distance
+            current = self.start
+            if self.rhs.get(current, INF) == INF:
+                return []
+            path = [current]
+            while current != self.goal and len(path) <= self.world_grid.width * self.world_grid.height:
+                current = min(self.neighbors(current), key = lambda neighbor: self.cost(current, neighbor) + self.g.get(neighbor, INF))
+                path.append(current)
+            return path if current == self.goal else []
@@ -1,5 +1,5 @@
 import pygame
-from support import import_folder
+from asset_manager import asset_manager
 from sprites import Generic, Interaction
 from quest import InteractQuest
 from random import choice
@@ -14,9 +14,7 @@ class FireSprite(Generic):
         
         # Animation
         SCALE_FACTOR = 2.5
-        self.animation = [pygame.transform.scale(img, 
-                            (img.get_width() * SCALE_FACTOR, img.get_height() * SCALE_FACTOR)) 
-                            for img in import_folder('./graphics/objects/fire')]
+        self.animation = asset_manager.frames('./graphics/objects/fire', scale = SCALE_FACTOR)
         self.frame_index = 0
         self.image = self.animation[self.frame_index]
         
@@ -52,9 +50,7 @@ class CoinSprite(Generic):
         
         # Animation
         SCALE_FACTOR = 2.5
-        self.animation = [pygame.transform.scale(img, 
-                            (img.get_width() * SCALE_FACTOR, img.get_height() * SCALE_FACTOR)) 
-                            for img in import_folder('./graphics/objects/coin')]
+        self.animation = asset_manager.frames('./graphics/objects/coin', scale = SCALE_FACTOR)
         self.frame_index = 0
         self.image = self.animation[self.frame_index]
         
@@ -90,7 +86,7 @@ class SnowPuddleSprite(Generic):
         self.pos = pos
         
         # Animation
-        self.image = choice(import_folder('./graphics/objects/snow_puddle'))   
+        self.image = choice(asset_manager.frames('./graphics/objects/snow_puddle'))   
         super().__init__(pos, self.image, self.all_sprites)
         self.interaction_sprite = None
         
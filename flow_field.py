@@ -0,0 +1,185 @@
+import heapq
+import numpy as np
+import threading
+from collections import OrderedDict
+from math import sqrt
+from settings import *
+from world_grid import IMPASSABLE
+from pathfinding import path_to_waypoints, PathGuide
+
+class FlowField:
+    """
+    Distance to one target tile from every tile of the map, and the next tile to step on towards it.
+    Works on the padded flat indices of a PathEngine occupancy array.
+    """
+    def __init__(self, target, distances, next_tiles, stride, version):
+        self.target = target
+        self.distances = distances      # flat float array, inf where the target cannot be reached
+        self.next_tiles = next_tiles    # flat int array, -1 at the target and where it cannot be reached
+        self.stride = stride
+        self.version = version          # version of the impassable tiles it was built from
+
+    def index(self, tile):
+        return (tile[1] + 1) * self.stride + tile[0] + 1
+
+    def tile(self, index):
+        y, x = divmod(int(index), self.stride)
+        return (x - 1, y - 1)
+
+    def distance(self, tile):
+        return float(self.distances[self.index(tile)])
+
+    def next_tile(self, tile):
+        """The tile to step on from tile, None at the target or if it cannot be reached"""
+        index = self.next_tiles[self.index(tile)]
+        return self.tile(index) if index >= 0 else None
+
+    def tile_path(self, start):
+        """Every tile from start to the target, [] if the target cannot be reached"""
+        index = self.index(start)
+        if self.distances[index] == np.inf:
+            return []
+        next_tiles = self.next_tiles
+        path = [start]
+        index = next_tiles[index]
+        while index >= 0:
+            path.append(self.tile(index))
+            index = next_tiles[index]
+        return path
+
+def build_flow_field(engine, target, version):
+    """Reverse Dijkstra from target over the occupancy array of a path engine"""
+    engine.update_occupancy()
+    blocked, stride = engine.blocked, engine.stride
+    if engine.diagonal:
+        steps = [(dx + dy * stride, sqrt(2) if dx and dy else 1, dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+    else:
+        steps = [(step, 1, 0, 0) for step in (-1, 1, -stride, stride)]
+
+    size = len(blocked)
+    distances = [np.inf] * size
+    next_tiles = [-1] * size
+    target_index = engine.index(target)
+    if target_index is not None and not blocked[target_index]:
+        distances[target_index] = 0
+        open_set = [(0, target_index)]
+        while open_set:
+            distance, current = heapq.heappop(open_set)
+            if distance > distances[current]:
+                continue    # already reached through a shorter path
+            for step, cost, dx, dy in steps:
+                neighbor = current - step   # the step that leads from neighbor to current
+                if blocked[neighbor]:
+                    continue
+                if dx and dy and not engine.can_step_diagonally(neighbor, dx, dy):
+                    continue
+                temp_distance = distance + cost
+                if temp_distance < distances[neighbor]:
+                    distances[neighbor] = temp_distance
+                    next_tiles[neighbor] = current
+                    heapq.heappush(open_set, (temp_distance, neighbor))
+
+    return FlowField(target, np.array(distances), np.array(next_tiles, dtype = np.int32), stride, version)
+
+class FlowFieldService:
+    """
+    Flow fields for the destinations npcs walk to again and again. A field is a reverse Dijkstra search
+    from the destination, so once it is built any number of npcs follow it without searching.
+    Destinations become popular by being registered with add_destination or asked for FLOW_FIELD_MIN_REQUESTS times,
+    other destinations go to the fallback planner (the path engine unless given). The least recently used fields are dropped past max_fields,
+    and every field is dropped when the impassable tiles change.
+    Fields are built by builder if given (a path_service.PathService), on the calling thread otherwise.
+    """
+    def __init__(self, world_grid, path_engine, fallback = None, max_fields = FLOW_FIELD_CACHE_SIZE, min_requests = FLOW_FIELD_MIN_REQUESTS, builder = None):
+        self.world_grid = world_grid
+        self.path_engine = path_engine
+        self.fallback = fallback or path_engine     # anything with tile_path(start, end)
+        self.builder = builder                      # anything with submit_field(target) returning a Future of a FlowField
+        self.max_fields = max_fields
+        self.min_requests = min_requests
+        self.fields = OrderedDict()     # target tile -> FlowField
+        self.destinations = set()       # registered target tiles
+        self.requests = {}              # target tile -> times it was asked for
+        self.lock = threading.Lock()    # npcs ask for paths from the llm threads
+        self.world_grid.subscribe(self.collision_changed, IMPASSABLE)
+
+        # counters for stats()
+        self.hits = 0
+        self.builds = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def add_destination(self, pos):
+        """Registers a world position npcs often walk to. Positions on blocked tiles use the closest open tile"""
+        tile = self.world_grid.closest_open_tile(self.world_grid.tile_at(pos))
+        if tile is None:
+            return None
+        self.destinations.add(tile)
+        return tile
+
+    def collision_changed(self, flags, tiles):
+        with self.lock:
+            if self.fields:
+                self.invalidations += 1
+            self.fields.clear()
+
+    def field(self, target):
+        """Flow field towards target tile, built on first use"""
+        version = self.world_grid.version(IMPASSABLE)
+        with self.lock:
+            field = self.fields.get(target)
+            if field is not None and field.version == version:
+                self.hits += 1
+                self.fields.move_to_end(target)
+                return field
+            if self.builder is None:
+                field = build_flow_field(self.path_engine, target, version)
+                self.store(field)
+                return field
+
+        # a worker process builds it without holding the lock, or the gil, against the other npcs
+        field = self.builder.submit_field(target).result()
+        with self.lock:
+            self.store(field)
+        return field
+
+    def store(self, field):
+        self.fields[field.target] = field
+        self.fields.move_to_end(field.target)
+        self.builds += 1
+        if len(self.fields) > self.max_fields:
+            self.fields.popitem(last = False)
+            self.evictions += 1
+
+    def is_popular(self, target):
+        with self.lock:
+            self.requests[target] = self.requests.get(target, 0) + 1
+            return target in self.fields or target in self.destinations or self.requests[target] >= self.min_requests
+
+    def tile_path(self, start, end):
+        """Every tile from start to end (both included), [] if end cannot be reached"""
+        if not (self.world_grid.in_bounds(*start) and self.world_grid.in_bounds(*end)):
+            return []
+        if self.is_popular(end):
+            return self.field(end).tile_path(start)
+        return self.fallback.tile_path(start, end)
+
+    def guide(self, start, end):
+        """Heuristic of a cooperative search from start to end: the flow field of a popular destination, a PathGuide along the fallback's path otherwise"""
+        if self.is_popular(end):
+            return self.field(end)
+        return PathGuide(self.world_grid, self.fallback.tile_path(start, end))
+
+    def find_path(self, start, end):
+        """Same as pathfinding.find_path: tile centre waypoints after the start tile, ending on the exact end position"""
+        return path_to_waypoints(self.tile_path(self.world_grid.tile_at((start['x'], start['y'])), self.world_grid.tile_at((end['x'], end['y']))), end)
+
+    def stats(self):
+        return {
+            'fields': len(self.fields),
+            'max_fields': self.max_fields,
+            'destinations': len(self.destinations),
+            'hits': self.hits,
+            'builds': self.builds,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations}
@@ -1,11 +1,11 @@
 import pygame
-from pytmx.util_pygame import load_pygame
 from enum import Enum
 from sprites import Generic
 from event_sprites import FireSprite, CoinSprite, SnowPuddleSprite
 from quest import InteractQuest
 from settings import *
 from timer import Timer
+from world_grid import TileFlag
 import threading
 
 from langgraph.graph import MessagesState
@@ -29,7 +29,7 @@ EVENT = {
 }
 
 class Grid:
-    def __init__(self, player, all_sprites, interaction_sprites, get_npc_by_name, start_event, get_locations):
+    def __init__(self, player, all_sprites, interaction_sprites, world_grid, get_npc_by_name, start_event, get_locations, get_npc_names, move_npcs):
         self.display_surface = pygame.display.get_surface()
         self.player = player
         self.all_sprites = all_sprites
@@ -37,30 +37,24 @@ class Grid:
         self.get_npc_by_name = get_npc_by_name
         self.start_event = start_event
         self.get_locations = get_locations
-        self.create_collision_grid()
+        self.get_npc_names = get_npc_names
+        self.move_npcs = move_npcs
+        
+        # shared tile flags, event sprites mark the tile they stand on until they are gone
+        self.world_grid = world_grid
+        self.h_tiles, self.v_tiles = world_grid.width, world_grid.height
+        self.event_sprites = {}     # sprite -> tile
         self.build_graph()
         
         self.event_timer = Timer(15000, self.trigger_event) # Timer need to be at least 15s, for llm to generate event and quest
         self.event_timer.activate()
         self.target_npc = self.get_npc_by_name("Alice")
     
-    def create_collision_grid(self):
-        # Use for calculating path for movement
-        tmx_data = load_pygame('./data/map.tmx')
-        self.h_tiles, self.v_tiles = tmx_data.width, tmx_data.height
-
-        self.grid = [[[] for _ in range(self.h_tiles)] for _ in range(self.v_tiles)]
-        for x, y, _ in load_pygame('./data/map.tmx').get_layer_by_name('Collision').tiles():
-            self.grid[y][x].append(GridItem.COLLISION)
-            # black_surface = pygame.Surface((TILE_SIZE, TILE_SIZE))
-            # black_surface.fill((0, 0, 0))
-            # Generic((x * TILE_SIZE, y * TILE_SIZE), black_surface, self.all_sprites)
-    
     def get_current_grid(self) -> list:
         """
         Get the 2D grid of the current game world
         """
-        return self.grid
+        return self.world_grid.flags.tolist()
     
     def add_to_grid(self, sprite: int, positions: list) -> str:
         """
@@ -74,11 +68,17 @@ class Grid:
             x, y = pos
             
             if sprite == GridItem.FIRE_SPRITE.value:
-                FireSprite((x, y), [self.all_sprites, self.interaction_sprites], self.player)
+                event_sprite = FireSprite((x, y), [self.all_sprites, self.interaction_sprites], self.player)
             elif sprite == GridItem.COIN_SPRITE.value:
-                CoinSprite((x, y), [self.all_sprites, self.interaction_sprites], self.player)
+                event_sprite = CoinSprite((x, y), [self.all_sprites, self.interaction_sprites], self.player)
             elif sprite == GridItem.SNOW_PUDDLE_SPRITE.value:
-                SnowPuddleSprite((x, y), [self.all_sprites, self.interaction_sprites], self.player)
+                event_sprite = SnowPuddleSprite((x, y), [self.all_sprites, self.interaction_sprites], self.player)
+            else:
+                continue
+            
+            tile = self.world_grid.tile_at(event_sprite.rect.center)
+            self.event_sprites[event_sprite] = tile
+            self.world_grid.set(tile, TileFlag.EVENT)
         
         return {GridItem(sprite).name}
     
@@ -114,8 +114,21 @@ class Grid:
         quest = InteractQuest(self.target_npc.npc_attributes['name'], quest_name, quest_description, interaction_object.lower(), rewards, target_quantity)
         self.target_npc.assign_quest(quest)
     
+    def gather_npcs(self, npc_names: list, positions: list) -> str:
+        """
+        Send several NPCs to an event at once, they walk there together without blocking each other
+        
+        Args:
+            npc_names: names of the NPCs to send, the first ones get the shortest ways
+            positions: a list of positions with (x-coordinate, y-coordinate) tuple, one for each NPC. An example is [(2,3), (6,7)]
+        """
+        stuck = self.move_npcs({name: tuple(pos) for name, pos in zip(npc_names, positions)})
+        if stuck:
+            return f"There is no way to their position for {', '.join(stuck)}"
+        return "The NPCs are on their way"
+    
     def build_graph(self):
-        tools = [self.add_to_grid, self.generate_event, self.generate_quest_for_npc]
+        tools = [self.add_to_grid, self.generate_event, self.generate_quest_for_npc, self.gather_npcs]
         llm = ChatOpenAI(model="gpt-4o")
         llm_with_tools = llm.bind_tools(tools, parallel_tool_calls=False)
         
@@ -133,6 +146,8 @@ class Grid:
         {self.get_locations()}
         Avoid generating events in two different locations at the same time (e.g. in shop house and maplewood village)
         
+        NPCs can gather around an event, give each of them their own position. The NPCs are: {self.get_npc_names()}
+        
         For quest generation, here is how player can interact with the event. For large locations, can specify the directions (e.g. northeast, south)
         {EVENT}
         """)
@@ -183,7 +198,16 @@ class Grid:
         timer = threading.Timer(delay, self.process_input, args=[query])
         timer.start()
 
+    def clear_finished_events(self):
+        # free the tiles of event sprites the player has dealt with
+        for event_sprite, tile in list(self.event_sprites.items()):
+            if not event_sprite.alive():
+                del self.event_sprites[event_sprite]
+                if tile not in self.event_sprites.values():
+                    self.world_grid.clear(tile, TileFlag.EVENT)
+
     def update(self):
+        self.clear_finished_events()
         self.event_timer.update()
         
         if not self.event_timer.active:
@@ -0,0 +1,263 @@
+import heapq
+from collections import deque
+from settings import *
+from world_grid import IMPASSABLE
+from pathfinding import path_to_waypoints
+
+class HierarchicalPathfinder:
+    """
+    HPA*: the map is split into square clusters of cluster_size tiles. Open stretches of the border between
+    two clusters get one or two entrance tiles, and the entrances of a cluster are linked by their walking distance
+    inside it. A path is searched on that small graph of entrances first, then only the cluster crossings it
+    uses are walked tile by tile. Paths are close to the shortest, not always the shortest.
+
+    Entrances are placed on every border up front. The links inside a cluster are only worked out the first time
+    a search goes through it, and are dropped again when impassable tiles of the cluster change.
+    Works with 4 directional movement, like pathfinding.a_star.
+    """
+    def __init__(self, world_grid, cluster_size = HPA_CLUSTER_SIZE):
+        self.world_grid = world_grid
+        self.cluster_size = cluster_size
+        self.cols = -(-world_grid.width // cluster_size)
+        self.rows = -(-world_grid.height // cluster_size)
+
+        # abstract graph
+        self.borders = {}       # border -> [(tile, tile on the other side)]
+        self.inter = {}         # entrance tile -> set of entrance tiles across a border
+        self.intra = {}         # cluster -> {entrance tile: {entrance tile: distance inside the cluster}}, built on first use
+
+        self.blocked = None
+        self.dirty = {(cx, cy) for cx in range(self.cols) for cy in range(self.rows)}
+        self.expanded = 0       # abstract nodes and tiles expanded by the last search
+        self.world_grid.subscribe(self.collision_changed, IMPASSABLE)
+
+    # clusters
+    def cluster_of(self, tile):
+        return (tile[0] // self.cluster_size, tile[1] // self.cluster_size)
+
+    def cluster_rect(self, cluster):
+        """(left, top, right, bottom) tiles of a cluster, right and bottom excluded"""
+        size = self.cluster_size
+        left, top = cluster[0] * size, cluster[1] * size
+        return (left, top, min(left + size, self.world_grid.width), min(top + size, self.world_grid.height))
+
+    def cluster_borders(self, cluster):
+        # ('v', cx, cy) is the border between (cx, cy) and (cx + 1, cy), ('h', cx, cy) between (cx, cy) and (cx, cy + 1)
+        cx, cy = cluster
+        borders = []
+        if cx > 0: borders.append(('v', cx - 1, cy))
+        if cx < self.cols - 1: borders.append(('v', cx, cy))
+        if cy > 0: borders.append(('h', cx, cy - 1))
+        if cy < self.rows - 1: borders.append(('h', cx, cy))
+        return borders
+
+    def border_clusters(self, border):
+        side, cx, cy = border
+        return ((cx, cy), (cx + 1, cy) if side == 'v' else (cx, cy + 1))
+
+    def collision_changed(self, flags, tiles):
+        self.dirty.update(self.cluster_of(tile) for tile in tiles)
+
+    def update(self):
+        """Rebuilds the entrances of every cluster touched by a change of impassable tiles and forgets their links"""
+        if not self.dirty:
+            return
+        self.blocked = self.world_grid.row_lists(IMPASSABLE)
+        dirty, self.dirty = self.dirty, set()
+
+        borders = {border for cluster in dirty for border in self.cluster_borders(cluster)}
+        for border in borders:
+            self.build_border(border)
+
+        # new entrances on a border change the clusters on both sides of it
+        for cluster in dirty | {cluster for border in borders for cluster in self.border_clusters(border)}:
+            self.intra.pop(cluster, None)
+
+    def build_border(self, border):
+        side, cx, cy = border
+        size, blocked = self.cluster_size, self.blocked
+        if side == 'v':
+            x = (cx + 1) * size - 1
+            pairs = [((x, y), (x + 1, y)) for y in range(cy * size, min((cy + 1) * size, self.world_grid.height))]
+        else:
+            y = (cy + 1) * size - 1
+            pairs = [((x, y), (x, y + 1)) for x in range(cx * size, min((cx + 1) * size, self.world_grid.width))]
+
+        # stretches of the border that are open on both sides
+        runs, run = [], []
+        for a, b in pairs:
+            if not blocked[a[1]][a[0]] and not blocked[b[1]][b[0]]:
+                run.append((a, b))
+            elif run:
+                runs.append(run)
+                run = []
+        if run:
+            runs.append(run)
+
+        # narrow stretches get one entrance in the middle, wide ones an entrance at both ends
+        entrances = []
+        for run in runs:
+            if len(run) < HPA_WIDE_ENTRANCE:
+                entrances.append(run[len(run) // 2])
+            else:
+                entrances.extend((run[0], run[-1]))
+
+        for a, b in self.borders.get(border, []):
+            self.unlink(a, b)
+        for a, b in entrances:
+            self.inter.setdefault(a, set()).add(b)
+            self.inter.setdefault(b, set()).add(a)
+        self.borders[border] = entrances
+
+    def unlink(self, a, b):
+        for tile, other in ((a, b), (b, a)):
+            partners = self.inter.get(tile)
+            if partners is not None:
+                partners.discard(other)
+                if not partners:
+                    del self.inter[tile]
+
+    def links(self, cluster):
+        """Walking distances between the entrances of a cluster"""
+        links = self.intra.get(cluster)
+        if links is None:
+            entrances = {tile for border in self.cluster_borders(cluster) for pair in self.borders.get(border, []) for tile in pair if self.cluster_of(tile) == cluster}
+            links = self.intra[cluster] = {}
+            for entrance in entrances:
+                links[entrance] = self.cluster_distances(entrance, cluster, entrances - {entrance})
+        return links
+
+    def cluster_distances(self, source, cluster, targets):
+        """Breadth first search from source inside a cluster, returns the distance to every target it reaches"""
+        left, top, right, bottom = self.cluster_rect(cluster)
+        blocked = self.blocked
+        distances = {source: 0}
+        found = {}
+        remaining = len(targets) - (source in targets)
+        queue = deque([source])
+        while queue and remaining:
+            current = queue.popleft()
+            self.expanded += 1
+            x, y = current
+            distance = distances[current] + 1
+            for neighbor in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+                nx, ny = neighbor
+                if left <= nx < right and top <= ny < bottom and neighbor not in distances and not blocked[ny][nx]:
+                    distances[neighbor] = distance
+                    queue.append(neighbor)
+                    if neighbor in targets:
+                        found[neighbor] = distance
+                        remaining -= 1
+        return found
+
+    def cluster_path(self, start, end, cluster):
+        """A* from start to end without leaving the cluster, [] if the cluster alone does not connect them"""
+        left, top, right, bottom = self.cluster_rect(cluster)
+        blocked = self.blocked
+        open_set = [(heuristic(start, end), 0, start)]
+        g_score = {start: 0}
+        came_from = {start: None}
+        closed = set()
+        while open_set:
+            _, _, current = heapq.heappop(open_set)
+            if current in closed:
+                continue
+            if current == end:
+                return self.trace(came_from, end)
+            closed.add(current)
+            self.expanded += 1
+
+            x, y = current
+            temp_g_score = g_score[current] + 1
+            for neighbor in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+                nx, ny = neighbor
+                if left <= nx < right and top <= ny < bottom and not blocked[ny][nx] and temp_g_score < g_score.get(neighbor, float('inf')):
+                    g_score[neighbor] = temp_g_score
+                    came_from[neighbor] = current
+                    h = heuristic(neighbor, end)
+                    heapq.heappush(open_set, (temp_g_score + h, h, neighbor))
+        return []
+
+    # search
+    def find_path(self, start, end):
+        """Same as pathfinding.find_path: tile centre waypoints after the start tile, ending on the exact end position"""
+        return path_to_waypoints(self.tile_path(self.world_grid.tile_at((start['x'], start['y'])), self.world_grid.tile_at((end['x'], end['y']))), end)
+
+    def tile_path(self, start, end):
+        """Every tile from start to end (both included), [] if end cannot be reached"""
+        self.update()
+        self.expanded = 0
+        if not (self.world_grid.in_bounds(*start) and self.world_grid.in_bounds(*end)) or self.world_grid.is_blocked(end):
+            return []
+        if start == end:
+            return [start]
+
+        # a trip inside one cluster does not need the abstract graph, if the cluster alone connects it
+        start_cluster, end_cluster = self.cluster_of(start), self.cluster_of(end)
+        if start_cluster == end_cluster:
+            path = self.cluster_path(start, end, start_cluster)
+            if path:
+                return path
+
+        # link start and end to the entrances of their clusters for this search only
+        start_edges = self.cluster_distances(start, start_cluster, set(self.links(start_cluster)))
+        end_edges = self.cluster_distances(end, end_cluster, set(self.links(end_cluster)))
+
+        abstract_path = self.abstract_search(start, end, start_edges, end_edges)
+        if not abstract_path:
+            return []
+        return self.refine(abstract_path)
+
+    def abstract_search(self, start, end, start_edges, end_edges):
+        """A* over the entrance graph, returns the entrances from start to end"""
+        open_set = [(heuristic(start, end), 0, start)]
+        g_score = {start: 0}
+        came_from = {start: None}
+        closed = set()
+        while open_set:
+            _, _, current = heapq.heappop(open_set)
+            if current in closed:
+                continue
+            if current == end:
+                return self.trace(came_from, end)
+            closed.add(current)
+            self.expanded += 1
+
+            edges = list(self.links(self.cluster_of(current)).get(current, {}).items())
+            edges.extend((partner, 1) for partner in self.inter.get(current, ()))
+            if current == start:
+                edges.extend(start_edges.items())
+            if current in end_edges:
+                edges.append((end, end_edges[current]))
+
+            for neighbor, cost in edges:
+                if neighbor in closed:
+                    continue
+                temp_g_score = g_score[current] + cost
+                if temp_g_score < g_score.get(neighbor, float('inf')):
+                    g_score[neighbor] = temp_g_score
+                    came_from[neighbor] = current
+                    h = heuristic(neighbor, end)
+                    heapq.heappush(open_set, (temp_g_score + h, h, neighbor))
+        return []
+
+    def refine(self, abstract_path):
+        """Walks the tiles of every hop of the abstract path"""
+        path = [abstract_path[0]]
+        for current, target in zip(abstract_path, abstract_path[1:]):
+            if heuristic(current, target) == 1 and self.cluster_of(current) != self.cluster_of(target):
+                path.append(target)     # crossing a border
+                continue
+            path.extend(self.cluster_path(current, target, self.cluster_of(current))[1:])
+        return path
+
+    def trace(self, came_from, current):
+        path = []
+        while current is not None:
+            path.append(current)
+            current = came_from[current]
+        return path[::-1]
+
+def heuristic(a, b):
+    """Manhattan distance heuristic"""
+    return abs(a[0] - b[0]) + abs(a[1] - b[1])
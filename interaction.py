@@ -0,0 +1,20 @@
+from settings import *
+from spatial_hash import SpatialGroup
+
+class InteractionGroup(SpatialGroup):
+    """
+    Interaction areas bucketed on a grid. Areas that move with their owner (npcs)
+    have to be passed to refresh() after their rect changed.
+    """
+    def __init__(self, *sprites, cell_size = TILE_SIZE * 2):
+        super().__init__(*sprites, cell_size = cell_size)
+
+    def collide(self, rect):
+        """Interaction areas overlapping rect, closest first (ties keep group order)"""
+        with self.lock:
+            self.flush()
+            collided = [sprite for sprite in self.spatial_hash.query(rect) if rect.colliderect(sprite.rect)]
+        if len(collided) > 1:
+            x, y = rect.center
+            collided.sort(key = lambda sprite: ((sprite.rect.centerx - x) ** 2 + (sprite.rect.centery - y) ** 2, self.sequence.get(sprite, 0)))
+        return collided
@@ -1,11 +1,12 @@
 import pygame 
+import numpy as np
 from settings import *
 from player import Player
 from overlay import Overlay
 from sprites import Generic, Water, WildFlower, Tree, Interaction, Particle
 from support import *
 from random import randint
-from pytmx.util_pygame import load_pygame
+from map_data import load_map
 from transition import Transition
 from soil import SoilLayer
 from sky import Rain, Sky
@@ -18,6 +19,12 @@ from announcer import Announcer
 from notification import NotificationManager
 from quest_menu import QuestMenu
 from location import Location_Manager
+from spatial_hash import SpatialGroup
+from collision import CollisionGroup, Blocker
+from interaction import InteractionGroup
+from render_queue import RenderQueue
+from chunk_renderer import ChunkRenderer
+from world_grid import WorldGrid, TileFlag
 
 class Level:
     def __init__(self):
@@ -25,11 +32,13 @@ class Level:
         # get the display surface
         self.display_surface = pygame.display.get_surface()
 
+        self.world_grid = WorldGrid.from_map()             # tile flags shared by soil, npcs and the game master
+
         # sprite groups
         self.all_sprites = CameraGroup()                    # sprites to be drawn
-        self.collision_sprites = pygame.sprite.Group()      # sprites with collision
+        self.collision_sprites = CollisionGroup(world_grid = self.world_grid)     # sprites with collision, npcs route around them
         self.tree_sprites = pygame.sprite.Group()           # interaction with tree sprites
-        self.interaction_sprites = pygame.sprite.Group()    # empty space for interactions
+        self.interaction_sprites = InteractionGroup()       # empty space for interactions
         self.location_sprites = pygame.sprite.Group()
   
         self.announcer = Announcer()
@@ -40,7 +49,7 @@ class Level:
         self.raining = False
         self.sky = Sky()
 
-        self.soil_layer = SoilLayer(self.all_sprites)
+        self.soil_layer = SoilLayer(self.all_sprites, self.world_grid)
         self.location = Location_Manager()
         self.guide_active = False
         self.setup()
@@ -63,7 +72,7 @@ class Level:
         # Timer for npc
         self.npc_timer = Timer(500)
         
-        self.grid = Grid(self.player, self.all_sprites, self.interaction_sprites, self.npc_manager.get_npc_by_name, self.announcer.start_event, self.location.get_locations)
+        self.grid = Grid(self.player, self.all_sprites, self.interaction_sprites, self.world_grid, self.npc_manager.get_npc_by_name, self.announcer.start_event, self.location.get_locations, self.npc_manager.get_npc_names, self.npc_manager.move_npcs)
         
         self.player_level = 1
         
@@ -75,7 +84,7 @@ class Level:
         
 
     def setup(self):
-        tmx_data = load_pygame('./data/map.tmx')
+        map_data = load_map()
         
         # Autonomous NPC
         self.npc_manager = NPC_Manager(
@@ -84,6 +93,7 @@ class Level:
                                 tree_sprites = self.tree_sprites,
                                 interaction_sprites = self.interaction_sprites,
                                 soil_layer = self.soil_layer,
+                                world_grid = self.world_grid,
                                 get_time = self.get_time,
                                 get_weather = self.get_weather,
                                 get_location = self.location.get_location,
@@ -95,7 +105,7 @@ class Level:
         self.dialogue = Dialogue_Menu(get_npc_by_name = self.npc_manager.get_npc_by_name, set_is_buffering = self.set_is_buffering)
         
         # Player
-        for obj in tmx_data.get_layer_by_name('Player'):
+        for obj in map_data.objects('Player'):
             if obj.name == 'Start':
                 self.player = Player(
                     pos = (obj.x,obj.y), 
@@ -122,24 +132,24 @@ class Level:
         
         # house 
         for layer in ['HouseFloor', 'HouseFurnitureBottom']:
-            for x, y, surf in tmx_data.get_layer_by_name(layer).tiles():
-                Generic((x * TILE_SIZE, y * TILE_SIZE), surf, self.all_sprites, LAYERS['house bottom'])
+            for x, y, surf in map_data.tiles(layer):
+                self.all_sprites.chunk_renderer.add_tile((x * TILE_SIZE, y * TILE_SIZE), surf, LAYERS['house bottom'])
 
         for layer in ['HouseWalls', 'HouseFurnitureTop']:
-            for x, y, surf in tmx_data.get_layer_by_name(layer).tiles():
+            for x, y, surf in map_data.tiles(layer):
                 Generic((x * TILE_SIZE, y * TILE_SIZE), surf, self.all_sprites)
     
         # fence
-        for x, y, surf in tmx_data.get_layer_by_name('Fence').tiles():
+        for x, y, surf in map_data.tiles('Fence'):
             Generic((x * TILE_SIZE,y * TILE_SIZE), surf, [self.all_sprites, self.collision_sprites])
     
         # water
         water_frames = import_folder('./graphics/water')
-        for x, y, surf in tmx_data.get_layer_by_name('Water').tiles():
+        for x, y, surf in map_data.tiles('Water'):
             Water((x * TILE_SIZE,y * TILE_SIZE), water_frames, self.all_sprites)
     
         # trees 
-        for obj in tmx_data.get_layer_by_name('Trees'):
+        for obj in map_data.objects('Trees'):
             Tree(
                 pos = (obj.x, obj.y), 
                 surf = obj.image, 
@@ -148,35 +158,43 @@ class Level:
                 player_add = self.player.add_to_inventory)
 
         # wildflowers 
-        for obj in tmx_data.get_layer_by_name('Decoration'):
+        for obj in map_data.objects('Decoration'):
             WildFlower((obj.x, obj.y), obj.image, [self.all_sprites, self.collision_sprites])
     
         # collion tiles
-        for x, y, surf in tmx_data.get_layer_by_name('Collision').tiles():
-            Generic((x * TILE_SIZE, y * TILE_SIZE), pygame.Surface((TILE_SIZE, TILE_SIZE)), self.collision_sprites)
+        for x, y, surf in map_data.tiles('Collision'):
+            self.collision_sprites.add_blocker(Blocker((x * TILE_SIZE, y * TILE_SIZE)))
         
-        # Ground
-        for x, y, surf in tmx_data.get_layer_by_name('Ground').tiles():
-            Generic((x * TILE_SIZE,y * TILE_SIZE), surf, self.all_sprites, LAYERS['ground'])
-            
-        # Water
-        for x, y, surf in tmx_data.get_layer_by_name('Water').tiles():
-            Generic((x * TILE_SIZE,y * TILE_SIZE), surf, self.all_sprites, LAYERS['water'])
-
-        # Hills
-        for x, y, surf in tmx_data.get_layer_by_name('Hills').tiles():
-            Generic((x * TILE_SIZE,y * TILE_SIZE), surf, self.all_sprites, LAYERS['hills'])
+        # Ground, water and hills are static, so they are baked into chunks instead of sprites
+        for layer, z in [('Ground', LAYERS['ground']), ('Water', LAYERS['water']), ('Hills', LAYERS['hills'])]:
+            for x, y, surf in map_data.tiles(layer):
+                self.all_sprites.chunk_renderer.add_tile((x * TILE_SIZE, y * TILE_SIZE), surf, z)
         
         # Trader
-        for obj in tmx_data.get_layer_by_name('NPC'):
+        for obj in map_data.objects('NPC'):
             if obj.type == 'Trader':
                 Generic((obj.x, obj.y), obj.image, self.all_sprites)
 
         # Rock
-        for x, y, surf in tmx_data.get_layer_by_name('Rock').tiles():
+        for x, y, surf in map_data.tiles('Rock'):
             Generic((x * TILE_SIZE, y * TILE_SIZE), surf, [self.all_sprites, self.location_sprites, self.collision_sprites])
             Interaction((x * TILE_SIZE, y * TILE_SIZE), (TILE_SIZE, TILE_SIZE), [self.location_sprites, self.interaction_sprites], {"name": "Location"}, "Area Locked")
 
+        # fences, trees, flowers and rocks are not on the Collision layer, npcs route around them as obstacles.
+        # the collision group moves an obstacle with the hitbox of its sprite and removes it when the sprite is killed
+        for sprite in self.collision_sprites.sprites():
+            self.world_grid.place_obstacle(sprite, self.world_grid.tiles_under(sprite.hitbox))
+
+        # places npcs keep walking to get a flow field, on open tiles now that the obstacles are placed
+        for location in self.location.locations.values():
+            self.npc_manager.flow_fields.add_destination(location.polygon.centroid.coords[0])
+        farm = self.world_grid.tiles(TileFlag.FARMABLE)
+        if farm:
+            self.npc_manager.flow_fields.add_destination(np.mean(farm, axis = 0) * TILE_SIZE)
+        for obj in map_data.objects('Player'):
+            if obj.name == 'Trader':
+                self.npc_manager.flow_fields.add_destination((obj.x, obj.y))
+
         # # Ground Sprite (Floor)
         # Generic(
         #     pos = (0,0),
@@ -194,13 +212,11 @@ class Level:
         return self.shop_active
 
     def plant_collision(self):
-        if self.soil_layer.plant_sprites:
-            for plant in self.soil_layer.plant_sprites.sprites():
-                if plant.harvestable and plant.rect.colliderect(self.player.hitbox):
-                    self.player.add_to_inventory(plant.plant_type, "resource", 1)
-                    plant.kill()
-                    Particle(plant.rect.topleft, plant.image, self.all_sprites, z = LAYERS['main'])
-                    self.soil_layer.grid[plant.rect.centery // TILE_SIZE][plant.rect.centerx // TILE_SIZE].remove('P')
+        for plant in self.soil_layer.plants_touching(self.player.hitbox):
+            if plant.harvestable:
+                self.player.add_to_inventory(plant.plant_type, "resource", 1)
+                self.soil_layer.harvest(plant)
+                Particle(plant.rect.topleft, plant.image, self.all_sprites, z = LAYERS['main'])
 
     def get_time(self):
         return self.sky.get_time()
@@ -259,6 +275,7 @@ class Level:
         
         # weather
         self.raining = randint(0,10) > 7    # randomise rain effect
+        self.soil_layer.set_raining(self.raining)
 
         # night to day transition
         self.sky.reset()
@@ -269,6 +286,9 @@ class Level:
                 apple.kill()
             tree.create_fruit()
 
+    def close(self):
+        self.npc_manager.close()
+
     def run(self,dt,events):
         
         # drawing logic
@@ -297,7 +317,6 @@ class Level:
         # rain
         if self.raining:
             self.rain.update()
-            self.soil_layer.water_all()
         
         # day to night transition
         # self.sky.display(dt)
@@ -338,32 +357,98 @@ class Level:
         #     self.npc_timer.activate()
         # self.npc_timer.update()
         
-class CameraGroup(pygame.sprite.Group):
+class CameraGroup(SpatialGroup):
     def __init__(self):
         super().__init__()
         self.display_surface = pygame.display.get_surface()
         self.offset = pygame.math.Vector2()
+        
+        # draw order
+        self.render_queue = RenderQueue(self.sequence)
+        self.moving_sprites = {}    # sprites that moved during the last update, sorted every frame
+        
+        # static tile layers drawn from baked chunks
+        self.chunk_renderer = ChunkRenderer()
+    
+    def flush(self):
+        with self.lock:
+            indexed = super().flush()
+            for sprite in indexed:
+                if self.in_view_region(sprite):
+                    self.render_queue.insert(sprite)
+        return indexed
+    
+    def remove_internal(self, sprite):
+        with self.lock:
+            super().remove_internal(sprite)
+            self.render_queue.discard(sprite)
+            self.moving_sprites.pop(sprite, None)
+    
+    def refresh(self, sprite):
+        # rect or z changed, so the sprite needs a new key
+        with self.lock:
+            self.render_queue.discard(sprite)
+            super().refresh(sprite)
+            if sprite not in self.moving_sprites and self.in_view_region(sprite):
+                self.render_queue.insert(sprite)
+    
+    def in_view_region(self, sprite):
+        return self.render_queue.region is not None and self.spatial_hash.in_range(sprite, self.render_queue.region)
+    
+    def update(self, dt):
+        super().update(dt)
+        
+        # keep the spatial hash in sync with sprites that moved
+        with self.lock:
+            moved = set(self.reindex())
+            resting = [sprite for sprite in self.moving_sprites if sprite not in moved]
+            for sprite in moved:
+                if sprite not in self.moving_sprites:
+                    self.render_queue.discard(sprite)
+                    self.moving_sprites[sprite] = None
+            for sprite in resting:
+                del self.moving_sprites[sprite]
+                if self.in_view_region(sprite):
+                    self.render_queue.insert(sprite)
     
     def custom_draw(self, player):
         # Ensures player is always at the center of the screen
         self.offset.x = player.rect.centerx - SCREEN_WIDTH / 2
         self.offset.y = player.rect.centery - SCREEN_HEIGHT / 2
         
-        for layer in LAYERS.values(): # Draw the sprites from the bottom layer first
-            for sprite in sorted(self.sprites(), key= lambda sprite: sprite.rect.centery): # Fake 3D: Sprite at lower y-axis stand behind sprite at higher y-axis
-                if sprite.z == layer:
-                    offset_rect = sprite.rect.copy()
-                    offset_rect.center -= self.offset
-                    self.display_surface.blit(sprite.image, offset_rect)
-                    
-                    # anaytics
-                    # if isinstance(sprite, Autonomous_NPC):
-                    #     pygame.draw.rect(self.display_surface,'red',offset_rect,5)     
-                    
-                    # if isinstance(sprite, Player):
-                    #     pygame.draw.rect(self.display_surface,'red',offset_rect,5)
-                    #     hitbox_rect = player.hitbox.copy()
-                    #     hitbox_rect.center = offset_rect.center
-                    #     pygame.draw.rect(self.display_surface,'green',hitbox_rect,5)
-                    #     target_pos = offset_rect.center + PLAYER_TOOL_OFFSET[player.status.split('_')[0]]
-                    #     pygame.draw.circle(self.display_surface,'blue',target_pos,5)
\ No newline at end of file
+        # Only the sprites overlapping the camera need to be drawn
+        camera_rect = pygame.Rect(self.offset.x, self.offset.y, SCREEN_WIDTH, SCREEN_HEIGHT)
+        with self.lock:    # sprites killed from the llm threads wait until the draw order is taken
+            self.flush()
+            region = self.spatial_hash.cell_range(camera_rect)
+            if region != self.render_queue.region:
+                resting = [sprite for sprite in self.spatial_hash.query_cells(region) if sprite not in self.moving_sprites]
+                self.render_queue.rebuild(region, resting)
+            moving = [sprite for sprite in self.moving_sprites if sprite.rect.colliderect(camera_rect)]
+            ordered = list(self.render_queue.ordered(moving))
+        
+        # A chunk layer goes on top of the sprites sharing its z, like the tile sprites it replaces did
+        chunk_layers = list(self.chunk_renderer.layers)
+        for sprite in ordered: # Draw the sprites from the bottom layer first
+            while chunk_layers and chunk_layers[0] < sprite.z:
+                self.chunk_renderer.draw_layer(chunk_layers.pop(0), camera_rect, self.offset)
+            if sprite.rect.colliderect(camera_rect):
+                offset_rect = sprite.rect.copy()
+                offset_rect.center -= self.offset
+                self.display_surface.blit(sprite.image, offset_rect)
+                
+                # anaytics
+                # if isinstance(sprite, Autonomous_NPC):
+                #     pygame.draw.rect(self.display_surface,'red',offset_rect,5)     
+                
+                # if isinstance(sprite, Player):
+                #     pygame.draw.rect(self.display_surface,'red',offset_rect,5)
+                #     hitbox_rect = player.hitbox.copy()
+                #     hitbox_rect.center = offset_rect.center
+                #     pygame.draw.rect(self.display_surface,'green',hitbox_rect,5)
+                #     target_pos = offset_rect.center + PLAYER_TOOL_OFFSET[player.status.split('_')[0]]
+                #     pygame.draw.circle(self.display_surface,'blue',target_pos,5)
+        
+        for layer in chunk_layers:
+            self.chunk_renderer.draw_layer(layer, camera_rect, self.offset)
+        self.chunk_renderer.prefetch(camera_rect)
\ No newline at end of file
@@ -1,8 +1,14 @@
 from shapely.geometry import Point, Polygon
-from pytmx.util_pygame import load_pygame
+import shapely
+import numpy as np
+from map_data import load_map
 import json, configparser
 from settings import *
 
+# location raster values that are not an index into Location_Manager.location_list
+NO_LOCATION = -1
+BOUNDARY_CELL = -2      # more than one answer inside the cell, ask the polygons
+
 """"
 Two main requirements
 1. Check if player is inside a location
@@ -30,6 +36,7 @@ class Location_Manager:
     def __init__(self):
         self.locations = {}
         self.set_up()
+        self.build_raster()
         for _, (_, location) in enumerate(self.locations.items()):
             print(location.name, location.polygon, location.description, location.topic)
     
@@ -37,31 +44,64 @@ class Location_Manager:
         topics = self.load_topics()
         location_data = self.load_and_replace_json("locations.json", topics)
         
-        tmx_data = load_pygame('./data/map.tmx')
+        map_data = load_map()
         
-        for obj in tmx_data.get_layer_by_name('Location'):
+        for obj in map_data.objects('Location'):
             if obj.name not in self.locations:
                 data = location_data.get(obj.name, {})  # safe access
                 description = data.get("description", "")
                 topic = data.get("topic", "")
                 level_unlock = data.get("level_unlock", 1)
-                self.locations[obj.name] = Location(obj.name, [(p.x, p.y) for p in obj.as_points], description, topic, level_unlock)
+                self.locations[obj.name] = Location(obj.name, list(obj.points), description, topic, level_unlock)
             else:
-                self.locations[obj.name].add_tile_positions([(p.x, p.y) for p in obj.as_points])  
-    
-    def check_player_location(self, player):
-        player_pos = (int(player.rect.centerx), int(player.rect.centery))
-        for location in self.locations.values():
-            if location.check_pos(player_pos):
-                # Update player current location
-                player.location = location
-                return
+                self.locations[obj.name].add_tile_positions(list(obj.points))  
     
-    def get_location(self, pos):
-        for location in self.locations.values():
+    def build_raster(self):
+        """
+        Precompute which location every cell of the map lies in, so lookups are an array index.
+        A cell gets a location only when it is strictly inside it and clear of every location checked before it,
+        cells crossed by a polygon edge fall back to the polygon tests.
+        """
+        map_data = load_map()
+        size = LOCATION_RASTER_SIZE
+        self.location_list = list(self.locations.values())
+        rows = -(-map_data.height * TILE_SIZE // size)
+        cols = -(-map_data.width * TILE_SIZE // size)
+
+        ys, xs = np.mgrid[0:rows, 0:cols] * size
+        cells = shapely.box(xs, ys, xs + size, ys + size)
+
+        self.raster = np.full((rows, cols), NO_LOCATION, dtype = np.int16)
+        undecided = np.ones((rows, cols), dtype = bool)
+        for index, location in enumerate(self.location_list):
+            inside = shapely.contains_properly(location.polygon, cells) & undecided
+            touching = shapely.intersects(location.polygon, cells) & undecided
+            self.raster[inside] = index
+            self.raster[touching & ~inside] = BOUNDARY_CELL
+            undecided &= ~touching
+
+    def find_location(self, pos):
+        for location in self.location_list:
             if location.check_pos(pos):
                 return location
         return None
+
+    def check_player_location(self, player):
+        location = self.get_location((int(player.rect.centerx), int(player.rect.centery)))
+        if location:
+            # Update player current location
+            player.location = location
+    
+    def get_location(self, pos):
+        col = int(pos[0] // LOCATION_RASTER_SIZE)
+        row = int(pos[1] // LOCATION_RASTER_SIZE)
+        if 0 <= row < self.raster.shape[0] and 0 <= col < self.raster.shape[1]:
+            index = self.raster[row, col]
+            if index >= 0:
+                return self.location_list[index]
+            if index == NO_LOCATION:
+                return None
+        return self.find_location(pos)
     
     def get_locations(self):
         res = []
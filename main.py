@@ -1,4 +1,4 @@
-import pygame, sys
+import pygame, sys, multiprocessing
 from settings import *
 from level import Level
 
@@ -16,6 +16,7 @@ class Game:
             events = pygame.event.get()  # Collect all events
             for event in events:
                 if event.type == pygame.QUIT:
+                    self.level.close()
                     pygame.quit()
                     sys.exit()
 
@@ -26,5 +27,7 @@ class Game:
 
 
 if __name__ == "__main__":
+    # the path workers are spawned from the frozen executable of the pyinstaller build
+    multiprocessing.freeze_support()
     game = Game()
     game.run()
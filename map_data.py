@@ -0,0 +1,262 @@
+from collections import namedtuple
+from pytmx import TiledTileLayer, TiledObjectGroup
+from pytmx.util_pygame import load_pygame
+import numpy as np
+import pygame
+import json, os, threading
+from xml.etree import ElementTree
+from settings import *
+
+# Read-only copy of the object fields the game uses
+MapObject = namedtuple('MapObject', ['name', 'type', 'x', 'y', 'width', 'height', 'image', 'points'])
+
+# Packed object record of the compiled bundle, strings index into the string table of meta.json
+OBJECT_DTYPE = np.dtype([
+    ('layer', np.int32), ('name', np.int32), ('type', np.int32),
+    ('x', np.float64), ('y', np.float64), ('width', np.float64), ('height', np.float64),
+    ('gid', np.int32), ('point_start', np.int32), ('point_count', np.int32)])
+
+BUNDLE_VERSION = 2
+
+class MapData:
+    """
+    Tile map parsed once per process and shared by every consumer.
+    Tile layers are arrays of gids (0 = empty) and gids index into the tile images.
+    Layers are handed out as tuples and frozensets so no consumer can change what the others see.
+    """
+    def __init__(self, width, height, layers, object_layers, images, object_gids, sources):
+        self.width = width
+        self.height = height
+        self.layers = layers                  # layer name -> (height, width) array of gids
+        self.object_layers = object_layers    # layer name -> (MapObject, ...)
+        self.images = images                  # gid -> surface, or a callable building it on first use
+        self.object_gids = object_gids        # layer name -> gid of each object image (0 = none)
+        self.sources = sources                # files the map was built from
+        self.positions = {}                   # layer name -> frozenset of (x, y)
+        self.tile_cache = {}                  # layer name -> ((x, y, surf), ...)
+        for layer in self.layers.values():
+            layer.setflags(write = False)
+
+    @classmethod
+    def from_tmx(cls, path):
+        tmx_data = load_pygame(path)
+        layers = {}
+        object_layers = {}
+
+        for layer in tmx_data.layers:
+            if isinstance(layer, TiledTileLayer):
+                layers[layer.name] = np.array(layer.data, dtype = np.int32)
+            elif isinstance(layer, TiledObjectGroup):
+                object_layers[layer.name] = tuple(
+                    MapObject(obj.name, obj.type, obj.x, obj.y, obj.width, obj.height, obj.image, tuple((p.x, p.y) for p in obj.as_points))
+                    for obj in layer)
+
+        # objects only keep their surface, remember the gid it came from for the bundle
+        gids = {id(image): gid for gid, image in enumerate(tmx_data.images) if image is not None}
+        object_gids = {name: tuple(gids.get(id(obj.image), 0) for obj in objects) for name, objects in object_layers.items()}
+        return cls(tmx_data.width, tmx_data.height, layers, object_layers, dict(enumerate(tmx_data.images)), object_gids, tmx_sources(path, tmx_data))
+
+    @classmethod
+    def from_bundle(cls, bundle_path):
+        with open(os.path.join(bundle_path, 'meta.json')) as file:
+            meta = json.load(file)
+        if meta['version'] != BUNDLE_VERSION:
+            raise ValueError(f'unsupported map bundle version {meta["version"]}')
+
+        def load(name):
+            return np.load(os.path.join(bundle_path, name), mmap_mode = 'r')
+
+        gid_layers = load('layers.npy')
+        layers = {name: np.asarray(gid_layers[index]) for index, name in enumerate(meta['layers'])}
+
+        atlases = {name: load(f'{name}.npy') for name in meta['atlases']}
+        images = {}
+        for gid, (atlas, slot, opaque) in meta['images'].items():
+            images[int(gid)] = cls.image_loader(atlases[atlas], slot, opaque)
+
+        strings = meta['strings']
+        records = load('objects.npy')
+        points = load('points.npy')
+        object_layers = {name: [] for name in meta['object_layers']}
+        for record in records:
+            start, count = int(record['point_start']), int(record['point_count'])
+            object_layers[meta['object_layers'][record['layer']]].append(MapObject(
+                strings[record['name']] if record['name'] >= 0 else None,
+                strings[record['type']] if record['type'] >= 0 else None,
+                float(record['x']), float(record['y']), float(record['width']), float(record['height']),
+                int(record['gid']),     # swapped for the surface once the images exist
+                tuple((float(x), float(y)) for x, y in points[start:start + count])))
+
+        object_gids = {name: tuple(obj.image for obj in objects) for name, objects in object_layers.items()}
+        map_data = cls(meta['width'], meta['height'], layers, {}, images, object_gids, meta['sources'])
+        map_data.object_layers = {name: tuple(obj._replace(image = map_data.image(obj.image)) for obj in objects) for name, objects in object_layers.items()}
+        return map_data
+
+    @staticmethod
+    def image_loader(atlas, slot, opaque):
+        def build():
+            height, width = atlas.shape[1:3]
+            surf = pygame.image.frombuffer(atlas[slot].tobytes(), (width, height), 'RGBX' if opaque else 'RGBA')
+            # same conversion pytmx picks when it loads the tileset
+            return surf.convert() if opaque else surf.convert_alpha()
+        return build
+
+    def save(self, bundle_path):
+        """Write the map as a compiled bundle that from_bundle() can memory map"""
+        os.makedirs(bundle_path, exist_ok = True)
+        meta_path = os.path.join(bundle_path, 'meta.json')
+        if os.path.exists(meta_path):
+            os.remove(meta_path)    # the bundle is only valid once meta.json is back
+
+        layer_names = list(self.layers)
+        np.save(os.path.join(bundle_path, 'layers.npy'), np.stack([self.layers[name] for name in layer_names]))
+
+        # objects as packed records, strings go to a shared table
+        strings = []
+        string_index = {}
+        def intern(value):
+            if value is None:
+                return -1
+            if value not in string_index:
+                string_index[value] = len(strings)
+                strings.append(value)
+            return string_index[value]
+
+        records = []
+        points = []
+        object_layer_names = list(self.object_layers)
+        for layer_index, name in enumerate(object_layer_names):
+            for obj, gid in zip(self.object_layers[name], self.object_gids[name]):
+                records.append((layer_index, intern(obj.name), intern(obj.type), obj.x, obj.y, obj.width, obj.height, gid, len(points), len(obj.points)))
+                points.extend(obj.points)
+        np.save(os.path.join(bundle_path, 'objects.npy'), np.array(records, dtype = OBJECT_DTYPE))
+        np.save(os.path.join(bundle_path, 'points.npy'), np.array(points, dtype = np.float64).reshape(-1, 2))
+
+        # every used image goes to the atlas of its size as raw RGBA rows
+        used = set(np.unique(np.stack(list(self.layers.values())))) | {gid for gids in self.object_gids.values() for gid in gids}
+        atlases = {}
+        images = {}
+        for gid in sorted(int(gid) for gid in used if gid):
+            surf = self.image(gid)
+            width, height = surf.get_size()
+            pixels = np.frombuffer(pygame.image.tobytes(surf, 'RGBA'), dtype = np.uint8).reshape(height, width, 4)
+            opaque = not surf.get_flags() & pygame.SRCALPHA
+            if opaque:
+                pixels = pixels.copy()
+                pixels[:, :, 3] = 255   # the unused byte of surfaces without alpha is undefined
+            atlas = f'atlas_{width}x{height}'
+            atlases.setdefault(atlas, []).append(pixels)
+            images[gid] = (atlas, len(atlases[atlas]) - 1, opaque)
+        for atlas, frames in atlases.items():
+            np.save(os.path.join(bundle_path, f'{atlas}.npy'), np.stack(frames))
+
+        meta = {
+            'version': BUNDLE_VERSION,
+            'width': self.width,
+            'height': self.height,
+            'layers': layer_names,
+            'object_layers': object_layer_names,
+            'strings': strings,
+            'atlases': list(atlases),
+            'images': images,
+            'sources': self.sources}
+        with open(meta_path, 'w') as file:
+            json.dump(meta, file)
+
+    def image(self, gid):
+        image = self.images.get(gid)
+        if callable(image):
+            image = self.images[gid] = image()
+        return image
+
+    def tiles(self, layer_name):
+        """(x, y, surf) for every tile of a tile layer, in tile coordinates"""
+        if layer_name not in self.tile_cache:
+            layer = self.layers[layer_name]
+            self.tile_cache[layer_name] = tuple((int(x), int(y), self.image(int(layer[y, x]))) for y, x in zip(*np.nonzero(layer)))
+        return self.tile_cache[layer_name]
+
+    def tile_positions(self, layer_name):
+        """Tile coordinates covered by a tile layer"""
+        if layer_name not in self.positions:
+            self.positions[layer_name] = frozenset((int(x), int(y)) for y, x in zip(*np.nonzero(self.layers[layer_name])))
+        return self.positions[layer_name]
+
+    def mask(self, layer_name):
+        """(height, width) bool array of the tiles covered by a tile layer"""
+        return self.layers[layer_name] != 0
+
+    def objects(self, layer_name):
+        return self.object_layers[layer_name]
+
+    def collision_tiles(self):
+        return self.tile_positions('Collision')
+
+def tmx_sources(path, tmx_data):
+    """Files a TMX map is built from: the map, its external .tsx tilesets and every image they use"""
+    directory = os.path.dirname(path)
+    tilesets = [node.get('source') for node in ElementTree.parse(path).getroot().iter('tileset') if node.get('source')]
+    # pytmx replaces the source of a tileset with its image, the tiles of a collection tileset keep theirs in their properties
+    images = [tileset.source for tileset in tmx_data.tilesets if tileset.source]
+    for gid in range(len(tmx_data.images)):
+        properties = tmx_data.get_tile_properties_by_gid(gid)
+        if properties and properties.get('source'):
+            images.append(properties['source'])
+    return [path] + sorted({os.path.join(directory, source) for source in tilesets + images})
+
+def bundle_path_for(path):
+    return os.path.splitext(path)[0] + '.bundle'
+
+def bundle_is_stale(path, bundle_path):
+    meta_path = os.path.join(bundle_path, 'meta.json')
+    if not os.path.exists(meta_path):
+        return True
+    try:
+        with open(meta_path) as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return True
+    if meta.get('version') != BUNDLE_VERSION:
+        return True
+    sources = meta.get('sources', [path])
+    built = os.path.getmtime(meta_path)
+    return any(os.path.exists(source) and os.path.getmtime(source) > built for source in set(sources) | {path})
+
+def compile_map(path = MAP_PATH, bundle_path = None):
+    """Parse the TMX file and write its compiled bundle. Returns the parsed map"""
+    map_data = MapData.from_tmx(path)
+    map_data.save(bundle_path or bundle_path_for(path))
+    return map_data
+
+def read_map(path):
+    bundle_path = bundle_path_for(path)
+    if bundle_is_stale(path, bundle_path):
+        try:
+            return compile_map(path, bundle_path)
+        except OSError as e:
+            print(f"Could not compile map bundle {bundle_path}: {e}")
+            return MapData.from_tmx(path)
+    try:
+        return MapData.from_bundle(bundle_path)
+    except (OSError, ValueError, KeyError, IndexError) as e:
+        print(f"Could not read map bundle {bundle_path}, falling back to {path}: {e}")
+        return MapData.from_tmx(path)
+
+_maps = {}
+_lock = threading.Lock()
+
+def load_map(path = MAP_PATH):
+    """Parsed map for path, loading it on the first call"""
+    with _lock:
+        if path not in _maps:
+            _maps[path] = read_map(path)
+        return _maps[path]
+
+if __name__ == '__main__':
+    # offline compile step: python map_data.py [map.tmx]
+    import sys
+    pygame.init()
+    pygame.display.set_mode((1, 1), pygame.HIDDEN)    # tile surfaces need a display to convert against
+    path = sys.argv[1] if len(sys.argv) > 1 else MAP_PATH
+    compile_map(path)
+    print(f"Compiled {path} to {bundle_path_for(path)}")
@@ -1,5 +1,6 @@
 import pygame
 from settings import *
+from text_cache import text_cache
 from timer import Timer
 
 class Menu:
@@ -9,7 +10,7 @@ class Menu:
         self.player = player
         self.toggle_menu = toggle_menu
         self.display_surface = pygame.display.get_surface()
-        self.font = pygame.font.Font('./font/LycheeSoda.ttf', 30)
+        self.font = text_cache.font('./font/LycheeSoda.ttf', 30)
 
         # text options
         self.width = 400
@@ -39,7 +40,7 @@ class Menu:
         self.total_height = 0
 
         for item in self.options:
-            text_surf = self.font.render(item["name"], False, 'Black')
+            text_surf = text_cache.render(self.font, item["name"], False, 'Black')
             self.text_surfs.append(text_surf)
             self.total_height += text_surf.get_height() + (self.padding * 2)
 
@@ -51,11 +52,11 @@ class Menu:
         self.main_rect = pygame.Rect(self.menu_left, self.menu_top, self.width, self.total_height)
   
         # buy / sell text surface
-        self.buy_text = self.font.render('buy',False,'Black')
-        self.sell_text =  self.font.render('sell',False,'Black')
+        self.buy_text = text_cache.render(self.font, 'buy',False,'Black')
+        self.sell_text =  text_cache.render(self.font, 'sell',False,'Black')
   
     def display_money(self):
-        text_surf = self.font.render(f'${self.player.money}', False, 'Black')
+        text_surf = text_cache.render(self.font, f'${self.player.money}', False, 'Black')
         text_rect = text_surf.get_rect(midbottom = (SCREEN_WIDTH / 2,SCREEN_HEIGHT - 90))
 
         pygame.draw.rect(self.display_surface,'White',text_rect.inflate(10,10),0,6)
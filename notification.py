@@ -1,5 +1,6 @@
 import pygame
 import time
+from text_cache import text_cache
 
 class Notification:
     """A single notification that disappears after a set duration."""
@@ -7,8 +8,8 @@ class Notification:
         self.text = text
         self.duration = duration
         self.start_time = time.time()  # Record when the notification starts
-        self.font = pygame.font.SysFont(None, font_size)
-        self.image = self.font.render(self.text, True, 'white')
+        self.font = text_cache.sys_font(None, font_size)
+        self.image = text_cache.render(self.font, self.text, True, 'white')
         self.rect = self.image.get_rect(topleft=position)
         self.display_surface = pygame.display.get_surface()
 
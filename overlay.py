@@ -1,5 +1,8 @@
 import pygame
 from settings import *
+from text_cache import text_cache
+from text_layout import text_layout
+from asset_manager import asset_manager
 
 # Colors
 BG_COLOR = (0, 0, 0)
@@ -19,15 +22,15 @@ class Overlay:
         # general setup
         self.display_surface = pygame.display.get_surface()
         self.player = player
-        self.small_font = pygame.font.SysFont(None, 24)
-        self.font = pygame.font.SysFont(None, 30)
-        self.large_font = pygame.font.SysFont(None, 40)
+        self.small_font = text_cache.sys_font(None, 24)
+        self.font = text_cache.sys_font(None, 30)
+        self.large_font = text_cache.sys_font(None, 40)
         
         # imports for inventory image
         overlay_path = './graphics/overlay'
         self.items_surf = [
-            pygame.transform.scale(
-                pygame.image.load(f"{overlay_path}/{item['type']}/{item['name']}.png").convert_alpha(),
+            asset_manager.image(
+                f"{overlay_path}/{item['type']}/{item['name']}.png",
                 (SLOT_SIZE - 15, SLOT_SIZE - 15)  # Resize image 
             ) 
             for item in player.inventory
@@ -39,24 +42,24 @@ class Overlay:
         pygame.draw.rect(self.display_surface, BEIGE, background_rect, border_radius=20)
 
         # Player name
-        name_surf = self.large_font.render(self.player.name, True, BLACK)
+        name_surf = text_cache.render(self.large_font, self.player.name, True, BLACK)
         name_rect = name_surf.get_rect(topleft=(30, 20))
         self.display_surface.blit(name_surf, name_rect)
         
         # Player level
-        level_surf = self.font.render(f"Level {self.player.level_system.get_level()}", True, BLACK)
+        level_surf = text_cache.render(self.font, f"Level {self.player.level_system.get_level()}", True, BLACK)
         level_rect = level_surf.get_rect(topleft=(30, 60))
         self.display_surface.blit(level_surf, level_rect)
         
         # Player experience
-        experience_surf = self.font.render(
+        experience_surf = text_cache.render(self.font, 
             f"Exp    {self.player.level_system.get_experience()} / {self.player.level_system.experience_to_next_level()}",
             True, BLACK)
         experience_rect = experience_surf.get_rect(topleft=(30, 95))
         self.display_surface.blit(experience_surf, experience_rect)
         
     def draw_money(self):
-        text_surf = self.font.render(f"Money: {self.player.money}", True, BLACK)
+        text_surf = text_cache.render(self.font, f"Money: {self.player.money}", True, BLACK)
         text_rect = text_surf.get_rect(topleft=(40, SCREEN_HEIGHT-40))
         self.display_surface.blit(text_surf, text_rect)
     
@@ -71,14 +74,13 @@ class Overlay:
         location_name = getattr(self.player.location, "name", None)
         location_topic = getattr(self.player.location, "topic", None)
         
-        background_image = pygame.image.load('./graphics/objects/banner.png').convert_alpha()
-        background_image = pygame.transform.scale(background_image, (box_width, box_height))
+        background_image = asset_manager.image('./graphics/objects/banner.png', (box_width, box_height))
         background_rect = background_image.get_rect(topleft=(box_x, box_y))
         self.display_surface.blit(background_image, background_rect)
         
         if location_topic:
-            name_surf = self.font.render(location_name, True, WHITE)
-            topic_surf = self.small_font.render(f"({location_topic})", True, WHITE)
+            name_surf = text_cache.render(self.font, location_name, True, WHITE)
+            topic_surf = text_cache.render(self.small_font, f"({location_topic})", True, WHITE)
             
             name_rect = name_surf.get_rect(midtop=(background_rect.centerx, background_rect.top + 20))
             topic_rect = topic_surf.get_rect(midtop=(background_rect.centerx, name_rect.bottom + 20))
@@ -91,7 +93,7 @@ class Overlay:
             line_end = (background_rect.right - 20, line_y)
             pygame.draw.line(self.display_surface, WHITE, line_start, line_end, width=2)
         else:
-            name_surf = self.font.render(location_name, True, WHITE)
+            name_surf = text_cache.render(self.font, location_name, True, WHITE)
             name_rect = name_surf.get_rect(center=background_rect.center)
         
         self.display_surface.blit(name_surf, name_rect)
@@ -112,11 +114,8 @@ class Overlay:
         pygame.draw.rect(self.display_surface, GREY, background_rect, border_radius=10)
         
         # Render Quest Description
-        wrapped_text = self.wrap_text(quest.description, box_width - 40)
-        y_offset = box_y + 10
-        for line in wrapped_text:
-            self.create_text(line, box_x + 10, y_offset, size="small", color=BEIGE) 
-            y_offset += 20
+        paragraph = text_layout.paragraph(quest.description, self.small_font, box_width - 40, BEIGE, 20)
+        self.display_surface.blit(paragraph, (box_x + 10, box_y + 10))
         
         # Draw progress bar
         progress_box_height = 30
@@ -131,7 +130,7 @@ class Overlay:
         
         pygame.draw.rect(self.display_surface, BLACK, progress_box_rect, width=3, border_radius=12) # draw progress bar border
         
-        progress_text = self.font.render(f"{progress} / {target}" if progress < target else "completed", True, BLACK)
+        progress_text = text_cache.render(self.font, f"{progress} / {target}" if progress < target else "completed", True, BLACK)
         text_x = box_x + box_width // 2 - progress_text.get_width() // 2
         text_y = (box_y + box_height - progress_box_height) + progress_box_height // 2 - progress_text.get_height() // 2
         self.display_surface.blit(progress_text, (text_x, text_y))
@@ -158,7 +157,7 @@ class Overlay:
                 # Display quantity if applicable
                 item = self.player.inventory[i]
                 if "quantity" in item:
-                    text_surface = self.small_font.render(str(item["quantity"]), True, BLACK)
+                    text_surface = text_cache.render(self.small_font, str(item["quantity"]), True, BLACK)
                     text_rect = text_surface.get_rect()
                     
                     # Position the text in the bottom-right corner of the slot
@@ -172,8 +171,6 @@ class Overlay:
                 pygame.draw.rect(self.display_surface, HIGHLIGHT_COLOR, (x, INVENTORY_Y, SLOT_SIZE, SLOT_SIZE), 3)
     
     def draw_guide(self):
-        background_image = pygame.image.load('./graphics/objects/old_paper.png').convert_alpha()
-        
         # Background box dimensions
         box_width = 1400
         box_x = (SCREEN_WIDTH - box_width) // 2
@@ -181,7 +178,7 @@ class Overlay:
         box_y = 10
         
         # Draw background
-        background_image = pygame.transform.scale(background_image, (box_width, box_height))
+        background_image = asset_manager.image('./graphics/objects/old_paper.png', (box_width, box_height))
         self.display_surface.blit(background_image, (box_x, box_y))
         
         # Can move to settings for dynamic key binding
@@ -208,34 +205,13 @@ class Overlay:
     
     def create_text(self, text, x , y, size="medium", color=BLACK):
         if size == "small":
-            text_surface = self.small_font.render(text, True, color)
+            text_surface = text_cache.render(self.small_font, text, True, color)
         elif size == "medium":
-            text_surface = self.font.render(text, True, color)
+            text_surface = text_cache.render(self.font, text, True, color)
         else:
-            text_surface = self.large_font.render(text, True, color)
+            text_surface = text_cache.render(self.large_font, text, True, color)
         self.display_surface.blit(text_surface, (x, y))
     
-    def wrap_text(self, text, max_width):
-        """Splits text into multiple lines based on available width."""
-        words = text.split()  # Split text into individual words
-        lines = []
-        current_line = ""
-
-        for word in words:
-            # Check if adding this word exceeds the width
-            test_line = f"{current_line} {word}".strip()
-            if self.small_font.size(test_line)[0] < max_width:
-                current_line = test_line
-            else:
-                lines.append(current_line)  # Store current line and start a new one
-                current_line = word  # Start with the new word
-
-        # Append last line
-        if current_line:
-            lines.append(current_line)
-
-        return lines
-    
     def draw_progress_bar(self, quest, offset_y):
         # Draw progress bar
         progress_box_margin = 10
@@ -256,7 +232,7 @@ class Overlay:
             pygame.draw.rect(self.display_surface, GREEN, (progress_box_x, progress_box_y, filled_width, progress_box_height), border_radius=12)
         
         # Render progress text
-        progress_text = self.font.render(f"{progress} / {target}", True, BLACK)
+        progress_text = text_cache.render(self.font, f"{progress} / {target}", True, BLACK)
         text_x = self.quest_x + self.quest_width // 2 - progress_text.get_width() // 2
         text_y = progress_box_y + progress_box_height // 2 - progress_text.get_height() // 2
         self.display_surface.blit(progress_text, (text_x, text_y))
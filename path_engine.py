@@ -0,0 +1,311 @@
+import heapq
+import numpy as np
+from math import sqrt
+from settings import *
+from world_grid import IMPASSABLE
+from pathfinding import path_to_waypoints
+
+SQRT2 = sqrt(2)
+
+class PathEngine:
+    """
+    Jump point search on a flat occupancy array built from the impassable tiles of the world grid.
+    On uniform cost grids every run of open tiles in one direction is equivalent, so the search
+    only stops at the tiles where a turn may be needed and expands far fewer nodes than a*.
+    Paths come back one tile at a time, the same as pathfinding.a_star.
+
+    diagonal allows 8 directional movement. A diagonal step needs both tiles beside it to be open,
+    or only one of them with corner_cutting (squeezing between two blocked corners is never allowed).
+    """
+    def __init__(self, world_grid, diagonal = False, corner_cutting = False):
+        self.world_grid = world_grid
+        self.diagonal = diagonal
+        self.corner_cutting = corner_cutting
+        self.version = None
+        self.expanded = 0       # nodes expanded by the last search
+        self.update_occupancy()
+
+    def update_occupancy(self):
+        """Rebuilds the occupancy array if the impassable tiles changed since the last search"""
+        version = self.world_grid.version(IMPASSABLE)
+        if version == self.version:
+            return
+
+        # a border of blocked tiles around the map, so the search never has to check bounds
+        padded = np.pad(self.world_grid.mask(IMPASSABLE), 1, constant_values = True)
+        self.occupancy = padded.astype(np.uint8).ravel()
+        self.stride = padded.shape[1]
+        self.blocked = self.occupancy.tobytes()     # indexing bytes from python is much faster than indexing numpy
+        self.build_jump_tables(padded)
+        self.version = version
+
+    def build_jump_tables(self, blocked):
+        """
+        For 4 directional movement, the tile every straight run from a tile stops at (the first jump point or wall),
+        worked out for the whole map at once so a jump during the search is a lookup instead of a walk
+        """
+        height, width = blocked.shape
+        open_tiles = ~blocked
+
+        def shifted(tiles, dy, dx):
+            # shifted(tiles, dy, dx)[y, x] is tiles[y + dy, x + dx], blocked past the edges
+            result = np.ones_like(tiles) if tiles is blocked else np.zeros_like(tiles)
+            result[max(-dy, 0):height - max(dy, 0), max(-dx, 0):width - max(dx, 0)] = tiles[max(dy, 0):height - max(-dy, 0), max(dx, 0):width - max(-dx, 0)]
+            return result
+
+        def first_stop(stops, axis, forward):
+            # index along axis of the nearest stop at or after (forward) or before every tile
+            positions = np.arange(stops.shape[axis]).reshape((-1, 1) if axis == 0 else (1, -1))
+            if forward:
+                nearest = np.where(stops, positions, stops.shape[axis])
+                return np.flip(np.minimum.accumulate(np.flip(nearest, axis), axis = axis), axis)
+            return np.maximum.accumulate(np.where(stops, positions, -1), axis = axis)
+
+        rows = np.arange(height).reshape(-1, 1)
+        cols = np.arange(width).reshape(1, -1)
+
+        # horizontal runs stop at walls and where a wall beside them ends (same rules as the walk in jump)
+        stops = {}
+        for dx in (1, -1):
+            forced = (shifted(open_tiles, -1, 0) & shifted(blocked, -1, -dx)) | (shifted(open_tiles, 1, 0) & shifted(blocked, 1, -dx))
+            stops[dx] = rows * width + first_stop(blocked | (open_tiles & forced), 1, dx > 0)
+
+        # vertical runs also stop wherever one of the horizontal runs from that tile finds a jump point
+        flat_blocked = blocked.ravel()
+        right_of = np.take(stops[1].ravel(), np.minimum(rows * width + cols + 1, height * width - 1))
+        left_of = np.take(stops[-1].ravel(), np.maximum(rows * width + cols - 1, 0))
+        branches = ~flat_blocked[right_of] | ~flat_blocked[left_of]
+        for dy in (1, -1):
+            forced = (shifted(open_tiles, 0, -1) & shifted(blocked, -dy, -1)) | (shifted(open_tiles, 0, 1) & shifted(blocked, -dy, 1))
+            stops[dy * width] = first_stop(blocked | (open_tiles & (forced | branches)), 0, dy > 0) * width + cols
+
+        # runs of open tiles in a row share a number, so a horizontal run between two tiles is clear if they match
+        self.row_runs = memoryview(np.cumsum(blocked, axis = 1).astype(np.int32).ravel())
+        self.stops = {step: memoryview(stop.astype(np.int32).ravel()) for step, stop in stops.items()}
+
+    def index(self, tile):
+        x, y = tile
+        if not self.world_grid.in_bounds(x, y):
+            return None
+        return (y + 1) * self.stride + x + 1
+
+    def tile(self, index):
+        y, x = divmod(index, self.stride)
+        return (x - 1, y - 1)
+
+    def find_path(self, start, end):
+        """Same as pathfinding.find_path: tile centre waypoints after the start tile, ending on the exact end position"""
+        return path_to_waypoints(self.tile_path(self.world_grid.tile_at((start['x'], start['y'])), self.world_grid.tile_at((end['x'], end['y']))), end)
+
+    def tile_path(self, start, end):
+        """Every tile from start to end (both included), [] if end cannot be reached"""
+        jump_points = self.search(start, end)
+        if not jump_points:
+            return []
+
+        # jumps only go straight or diagonally, so fill in the tiles between jump points one step at a time
+        path = [jump_points[0]]
+        for x, y in jump_points[1:]:
+            px, py = path[-1]
+            dx, dy = sign(x - px), sign(y - py)
+            while (px, py) != (x, y):
+                px, py = px + dx, py + dy
+                path.append((px, py))
+        return path
+
+    def search(self, start, end):
+        """Jump points from start to end, [] if end cannot be reached"""
+        self.update_occupancy()
+        self.expanded = 0
+        start_index, end_index = self.index(start), self.index(end)
+        if start_index is None or end_index is None or self.blocked[end_index]:
+            return []
+        if start_index == end_index:
+            return [start]
+
+        heuristic = self.distance
+        open_set = [(heuristic(start_index, end_index), 0, start_index)]
+        g_score = {start_index: 0}
+        came_from = {start_index: None}
+        closed = set()
+
+        while open_set:
+            _, _, current = heapq.heappop(open_set)
+            if current in closed:
+                continue    # already expanded through a shorter path
+            if current == end_index:
+                path = []
+                while current is not None:
+                    path.append(self.tile(current))
+                    current = came_from[current]
+                return path[::-1]
+            closed.add(current)
+            self.expanded += 1
+
+            for jump_point in self.successors(current, came_from[current], end_index):
+                if jump_point in closed:
+                    continue
+                temp_g_score = g_score[current] + self.distance(current, jump_point)
+                if temp_g_score < g_score.get(jump_point, float('inf')):
+                    g_score[jump_point] = temp_g_score
+                    came_from[jump_point] = current
+                    h = heuristic(jump_point, end_index)
+                    heapq.heappush(open_set, (temp_g_score + h, h, jump_point))
+
+        return []   # No path found
+
+    def distance(self, a, b):
+        """Manhattan distance for 4 directional movement, octile distance for 8 directional"""
+        ay, ax = divmod(a, self.stride)
+        by, bx = divmod(b, self.stride)
+        dx, dy = abs(ax - bx), abs(ay - by)
+        if not self.diagonal:
+            return dx + dy
+        return max(dx, dy) + (SQRT2 - 1) * min(dx, dy)
+
+    def successors(self, node, parent, end):
+        jump = self.jump_diagonal if self.diagonal else self.jump
+        for dx, dy in self.directions(node, parent):
+            jump_point = jump(node, dx, dy, end)
+            if jump_point is not None:
+                yield jump_point
+
+    def directions(self, node, parent):
+        """Directions worth jumping in from node, pruned by the direction it was reached from"""
+        blocked, stride = self.blocked, self.stride
+        if parent is None:
+            if not self.diagonal:
+                return [(dx, dy) for dx, dy in ((-1, 0), (1, 0), (0, -1), (0, 1)) if not blocked[node + dx + dy * stride]]
+            directions = [(dx, dy) for dx, dy in ((-1, 0), (1, 0), (0, -1), (0, 1)) if not blocked[node + dx + dy * stride]]
+            for dx, dy in ((-1, -1), (1, -1), (-1, 1), (1, 1)):
+                if self.can_step_diagonally(node, dx, dy):
+                    directions.append((dx, dy))
+            return directions
+
+        py, px = divmod(parent, stride)
+        y, x = divmod(node, stride)
+        dx, dy = sign(x - px), sign(y - py)
+        open_x = not blocked[node + dx]             # next tile sideways
+        open_y = not blocked[node + dy * stride]    # next tile up or down
+
+        if not self.diagonal:
+            # straight runs can turn at their ends, vertical runs have already checked every horizontal branch
+            if dx:
+                candidates = ((0, -1), (0, 1), (dx, 0))
+            else:
+                candidates = ((-1, 0), (1, 0), (0, dy))
+            return [(cx, cy) for cx, cy in candidates if not blocked[node + cx + cy * stride]]
+
+        directions = []
+        if dx and dy:
+            if open_y: directions.append((0, dy))
+            if open_x: directions.append((dx, 0))
+            if self.can_step_diagonally(node, dx, dy): directions.append((dx, dy))
+            if self.corner_cutting:
+                # forced neighbours behind the blocked corners
+                if blocked[node - dx] and open_y: directions.append((-dx, dy))
+                if blocked[node - dy * stride] and open_x: directions.append((dx, -dy))
+            return directions
+
+        if self.corner_cutting:
+            # forced diagonals next to a tile that is blocked beside the run
+            if dx and open_x:
+                directions.append((dx, 0))
+                if blocked[node + stride]: directions.append((dx, 1))
+                if blocked[node - stride]: directions.append((dx, -1))
+            elif dy and open_y:
+                directions.append((0, dy))
+                if blocked[node + 1]: directions.append((1, dy))
+                if blocked[node - 1]: directions.append((-1, dy))
+            return directions
+
+        # without corner cutting a diagonal needs both sides open, so any open side may start a new run
+        if dx:
+            open_up, open_down = not blocked[node - stride], not blocked[node + stride]
+            if open_x:
+                directions.append((dx, 0))
+                if open_up: directions.append((dx, -1))
+                if open_down: directions.append((dx, 1))
+            if open_up: directions.append((0, -1))
+            if open_down: directions.append((0, 1))
+        else:
+            open_left, open_right = not blocked[node - 1], not blocked[node + 1]
+            if open_y:
+                directions.append((0, dy))
+                if open_left: directions.append((-1, dy))
+                if open_right: directions.append((1, dy))
+            if open_left: directions.append((-1, 0))
+            if open_right: directions.append((1, 0))
+        return directions
+
+    def can_step_diagonally(self, node, dx, dy):
+        blocked, stride = self.blocked, self.stride
+        if blocked[node + dx + dy * stride]:
+            return False
+        if self.corner_cutting:
+            return not (blocked[node + dx] and blocked[node + dy * stride])
+        return not (blocked[node + dx] or blocked[node + dy * stride])
+
+    def jump(self, node, dx, dy, end):
+        """Follows a straight run from node for 4 directional movement, returns the first jump point or None"""
+        stride = self.stride
+        step = dx + dy * stride
+        first = node + step
+        stop = self.stops[step][first]
+        low, high = (first, stop) if step > 0 else (stop, first)
+
+        if dx:
+            # the end on this run
+            if low <= end <= high and end // stride == first // stride:
+                return end
+        else:
+            # the tile on the end's row, if a horizontal run from it reaches the end
+            tile = end - end % stride + first % stride
+            if low <= tile <= high and not self.blocked[tile] and self.row_runs[tile] == self.row_runs[end]:
+                return tile
+        return None if self.blocked[stop] else stop
+
+    def jump_diagonal(self, node, dx, dy, end):
+        """Walks from node in one of 8 directions, returns the first jump point or None"""
+        blocked, stride = self.blocked, self.stride
+        step = dx + dy * stride
+        corner_cutting = self.corner_cutting
+        current = node
+        while True:
+            # take the step
+            if blocked[current + step]:
+                return None
+            if dx and dy:
+                side_x, side_y = blocked[current + dx], blocked[current + dy * stride]
+                if (side_x and side_y) if corner_cutting else (side_x or side_y):
+                    return None
+            current += step
+            if current == end:
+                return current
+
+            # forced neighbours
+            if corner_cutting:
+                if dx and dy:
+                    if (not blocked[current - dx + dy * stride] and blocked[current - dx]) or (not blocked[current + dx - dy * stride] and blocked[current - dy * stride]):
+                        return current
+                elif dx:
+                    if (not blocked[current + dx + stride] and blocked[current + stride]) or (not blocked[current + dx - stride] and blocked[current - stride]):
+                        return current
+                else:
+                    if (not blocked[current + 1 + dy * stride] and blocked[current + 1]) or (not blocked[current - 1 + dy * stride] and blocked[current - 1]):
+                        return current
+            elif not (dx and dy):
+                if dx:
+                    if (not blocked[current - stride] and blocked[current - dx - stride]) or (not blocked[current + stride] and blocked[current - dx + stride]):
+                        return current
+                else:
+                    if (not blocked[current - 1] and blocked[current - step - 1]) or (not blocked[current + 1] and blocked[current - step + 1]):
+                        return current
+
+            # diagonal runs stop wherever one of their straight runs would find a jump point
+            if dx and dy:
+                if self.jump_diagonal(current, dx, 0, end) is not None or self.jump_diagonal(current, 0, dy, end) is not None:
+                    return current
+
+def sign(value):
+    return (value > 0) - (value < 0)
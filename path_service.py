@@ -0,0 +1,158 @@
+import time
+import threading
+import multiprocessing
+import numpy as np
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from settings import *
+from world_grid import WorldGrid, TileFlag, IMPASSABLE
+from path_engine import PathEngine
+from hpa import HierarchicalPathfinder
+from flow_field import build_flow_field
+from pathfinding import path_to_waypoints
+
+# planners of a worker process for the impassable tiles it was sent last
+worker_planners = {}
+
+def worker_planner(shape, version, packed):
+    planners = worker_planners.get(version)
+    if planners is None:
+        height, width = shape
+        world_grid = WorldGrid(width, height)
+        # the planners only need to know which tiles are impassable, they all come back as collision
+        world_grid.flags[np.unpackbits(packed, count = width * height).reshape(shape).astype(bool)] = int(TileFlag.COLLISION)
+        engine = PathEngine(world_grid)
+        hierarchical = HierarchicalPathfinder(world_grid) if width * height >= HPA_MIN_MAP_TILES else None
+        worker_planners.clear()
+        planners = worker_planners[version] = (engine, hierarchical)
+    return planners
+
+def plan_tile_path(shape, version, packed, start, end):
+    """Runs in a worker process: every tile from start to end, and the seconds the search took"""
+    engine, hierarchical = worker_planner(shape, version, packed)
+    t0 = time.perf_counter()
+    path = (hierarchical or engine).tile_path(start, end)
+    return path, time.perf_counter() - t0
+
+def plan_flow_field(shape, version, packed, target):
+    """Runs in a worker process: the flow field towards target, and the seconds the build took"""
+    engine, hierarchical = worker_planner(shape, version, packed)
+    t0 = time.perf_counter()
+    field = build_flow_field(engine, target, version)
+    return field, time.perf_counter() - t0
+
+class PathService:
+    """
+    Path searches in a pool of worker processes, so long searches do not hold the gil against the game loop.
+    submit() and submit_field() return Futures. Identical requests that are still running share one Future,
+    and finished tile paths are kept by (start tile, end tile, impassable tiles version) for the next request.
+    Workers get the impassable tiles with every request and keep planners for the last version they were sent.
+    """
+    def __init__(self, world_grid, workers = PATH_SERVICE_WORKERS, cache_size = PATH_SERVICE_CACHE_SIZE):
+        self.world_grid = world_grid
+        self.workers = workers
+        self.cache_size = cache_size
+        self.executor = None            # started with the first search
+        self.lock = threading.Lock()
+        self.paths = OrderedDict()      # (start, end, version) -> tile path
+        self.in_flight = {}             # request key -> Future
+        self.packed = (None, None)      # (version, impassable tiles packed into bits)
+
+        # counters for stats()
+        self.requests = 0
+        self.hits = 0
+        self.coalesced = 0
+        self.searches = 0
+        self.latencies = deque(maxlen = PATH_SERVICE_SAMPLES)      # ms from submit to result
+        self.search_times = deque(maxlen = PATH_SERVICE_SAMPLES)   # ms spent searching in the worker
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait = False, cancel_futures = True)
+
+    def impassable_tiles(self, version):
+        if self.packed[0] != version:
+            self.packed = (version, np.packbits(self.world_grid.mask(IMPASSABLE)))
+        return self.packed[1]
+
+    def submit(self, start, end):
+        """Future of every tile from start to end (both included), [] if end cannot be reached. Do not change the list"""
+        version = self.world_grid.version(IMPASSABLE)
+        key = (start, end, version)
+        with self.lock:
+            path = self.paths.get(key)
+            if path is not None:
+                self.requests += 1
+                self.hits += 1
+                self.paths.move_to_end(key)
+                future = Future()
+                future.set_result(path)
+                return future
+        return self.run(key, plan_tile_path, start, end)
+
+    def submit_field(self, target):
+        """Future of the flow_field.FlowField towards target"""
+        return self.run(('field', target, self.world_grid.version(IMPASSABLE)), plan_flow_field, target)
+
+    def run(self, key, task, *args):
+        with self.lock:
+            self.requests += 1
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+
+            # the caller gets its own future, so the worker's (result, time) pair stays inside the service
+            future = self.in_flight[key] = Future()
+            if self.executor is None:
+                # spawned workers do not inherit the display and the llm threads of the game
+                self.executor = ProcessPoolExecutor(self.workers, mp_context = multiprocessing.get_context('spawn'))
+            version = key[-1]
+            work = self.executor.submit(task, self.world_grid.flags.shape, version, self.impassable_tiles(version), *args)
+        submitted = time.perf_counter()
+        work.add_done_callback(lambda work: self.finished(key, future, work, submitted))
+        return future
+
+    def finished(self, key, future, work, submitted):
+        with self.lock:
+            del self.in_flight[key]
+            self.searches += 1
+            self.latencies.append((time.perf_counter() - submitted) * 1000)
+            if work.cancelled() or work.exception() is not None:
+                error = work.exception() if not work.cancelled() else RuntimeError('path service closed')
+            else:
+                error = None
+                result, seconds = work.result()
+                self.search_times.append(seconds * 1000)
+                if key[0] != 'field':
+                    self.paths[key] = result
+                    if len(self.paths) > self.cache_size:
+                        self.paths.popitem(last = False)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def tile_path(self, start, end):
+        """Same as PathEngine.tile_path, searched in a worker process"""
+        if not (self.world_grid.in_bounds(*start) and self.world_grid.in_bounds(*end)):
+            return []
+        return list(self.submit(start, end).result())
+
+    def find_path(self, start, end):
+        """Same as pathfinding.find_path: tile centre waypoints after the start tile, ending on the exact end position"""
+        return path_to_waypoints(self.tile_path(self.world_grid.tile_at((start['x'], start['y'])), self.world_grid.tile_at((end['x'], end['y']))), end)
+
+    def stats(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            return {
+                'queue_depth': len(self.in_flight),
+                'requests': self.requests,
+                'hits': self.hits,
+                'coalesced': self.coalesced,
+                'searches': self.searches,
+                'cached_paths': len(self.paths),
+                'latency_ms': sum(latencies) / len(latencies) if latencies else 0,
+                'latency_p95_ms': latencies[int(len(latencies) * 0.95)] if latencies else 0,
+                'search_ms': sum(self.search_times) / len(self.search_times) if self.search_times else 0}
@@ -1,14 +1,19 @@
 import pygame
 import heapq
+import threading
+from collections import deque
 from settings import *
+from world_grid import TileFlag, IMPASSABLE, DYNAMIC_OBSTACLES
 
-def a_star(grid, start, end, tile_size):
-    """A* pathfinding algorithm using collision grid and tile size"""
+def a_star(world_grid, start, end, tile_size, stats = None):
+    """A* pathfinding algorithm around the impassable tiles of the world grid, using tile size.
+    The number of nodes taken off the open set is counted in stats['expanded'] if a dict is given"""
 
     start_grid = (int(start['x'] // TILE_SIZE), int(start['y'] // TILE_SIZE))
     end_grid = (int(end['x'] // TILE_SIZE), int(end['y'] // TILE_SIZE))
 
-    rows, cols = len(grid), len(grid[0])
+    blocked = world_grid.row_lists(IMPASSABLE)
+    rows, cols = world_grid.height, world_grid.width
     open_set = []
     heapq.heappush(open_set, (0, start_grid))  # (f-score, (grid_x, grid_y))
 
@@ -18,6 +23,8 @@ def a_star(grid, start, end, tile_size):
 
     while open_set:
         _, current = heapq.heappop(open_set)
+        if stats is not None:
+            stats['expanded'] = stats.get('expanded', 0) + 1
 
         if current == end_grid:
             return reconstruct_path(came_from, current)
@@ -30,7 +37,7 @@ def a_star(grid, start, end, tile_size):
                 continue
             
             # Check if the tile is blocked
-            if "C" in grid[neighbor[1]][neighbor[0]]:
+            if blocked[neighbor[1]][neighbor[0]]:
                 continue  # Skip blocked tiles
 
             temp_g_score = g_score[current] + 1  # Assume uniform movement cost
@@ -64,29 +71,349 @@ def convert_pathgrid_to_coordinates(path):
         res.append((x, y))
     return res
 
-def find_path(grid, start, end):
-    path = a_star(grid, start, end, TILE_SIZE)
+def path_to_waypoints(path, end):
     if not path:
         return []
 
     path_coordinates = convert_pathgrid_to_coordinates(path)
+    # A tile repeated by a cooperative path is a wait of one time step
+    waypoints = [None if tile == previous else coordinate for previous, tile, coordinate in zip(path, path[1:], path_coordinates[1:])]
     # Return the original destination coordinate and exclude the start destination coordinate
-    return path_coordinates[1:-1] + [(end['x'], end['y'])]
+    return waypoints[:-1] + [(end['x'], end['y'])]
 
-# Testing
-# from pytmx.util_pygame import load_pygame
+def find_path(world_grid, start, end):
+    return path_to_waypoints(a_star(world_grid, start, end, TILE_SIZE), end)
 
-# pygame.init()
-# screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+def swept_rows(a, b, half_width = 0, half_height = 0):
+    """
+    Tiles a box of the given half size touches while its centre moves straight from world point a to b,
+    as (row, first column, last column). A box without size gives the tiles the line itself crosses
+    """
+    (ax, ay), (bx, by) = a, b
+    top = int((min(ay, by) - half_height) // TILE_SIZE)
+    bottom = int((max(ay, by) + half_height) // TILE_SIZE)
+    for row in range(top, bottom + 1):
+        # the stretch of the centre line whose box reaches into this row
+        y0 = max(min(ay, by), row * TILE_SIZE - half_height)
+        y1 = min(max(ay, by), (row + 1) * TILE_SIZE + half_height)
+        if ay == by:
+            x0, x1 = min(ax, bx), max(ax, bx)
+        else:
+            x0, x1 = sorted((ax + (y0 - ay) * (bx - ax) / (by - ay), ax + (y1 - ay) * (bx - ax) / (by - ay)))
+        yield row, int((x0 - half_width) // TILE_SIZE), int((x1 + half_width) // TILE_SIZE)
 
-# ground = pygame.image.load('./graphics/world/ground.png')
-# h_tiles = ground.get_width() // TILE_SIZE
-# v_tiles = ground.get_height() // TILE_SIZE
-# grid = [[[] for col in range(h_tiles)] for row in range(v_tiles)]
+def box_can_slide(blocked, a, b, half_width, half_height, avoid = ()):
+    """True if a box of the given half size centred on world point a can slide straight to b touching only open tiles outside avoid"""
+    rows, cols = len(blocked), len(blocked[0])
+    for row, left, right in swept_rows(a, b, half_width, half_height):
+        if row < 0 or row >= rows or left < 0 or right >= cols or any(blocked[row][left:right + 1]):
+            return False
+        if avoid and any((x, row) in avoid for x in range(left, right + 1)):
+            return False
+    return True
 
-# for x, y, _ in load_pygame('./data/map.tmx').get_layer_by_name('Collision').tiles():
-#     grid[y][x].append('C')  # Marking collision tiles
+def smooth_path(world_grid, start, waypoints, half_width, half_height, blocking = TileFlag.COLLISION | DYNAMIC_OBSTACLES, avoid = ()):
+    """
+    String pulling: keeps only the waypoints a box of the given half size cannot skip by walking straight from the previous one
+    past open tiles. start is the world position the path is walked from. None waits stay where they are,
+    and shortcuts do not touch avoid (the tiles other npcs reserved), so where npcs share tiles they keep to their time steps.
+    Returns a deque of the remaining waypoints
+    """
+    blocked = world_grid.row_lists(blocking)
+    smoothed = deque()
+    anchor = start
+    i = 0
+    while i < len(waypoints):
+        if waypoints[i] is None:
+            smoothed.append(None)
+            i += 1
+            continue
+        # walk to the furthest waypoint in sight, before the next wait
+        j = i
+        while j + 1 < len(waypoints) and waypoints[j + 1] is not None and box_can_slide(blocked, anchor, waypoints[j + 1], half_width, half_height, avoid):
+            j += 1
+        smoothed.append(waypoints[j])
+        anchor = waypoints[j]
+        i = j + 1
+    return smoothed
 
-# start = {'x': 1561.0, 'y': 1772.0}
-# end = {'x': 1561, 'y': 1256}
-# print(find_path(grid, start, end))
\ No newline at end of file
+class ReservationTable:
+    """
+    Space-time reservations for cooperative pathfinding: which agent stands on a tile at a time step.
+    An agent parks on the last tile of its path from the step it gets there.
+    """
+    def __init__(self):
+        self.cells = {}     # (tile, step) -> agent
+        self.steps = {}     # agent -> [(tile, step)] it reserved
+        self.parked = {}    # tile -> (agent, first step)
+        self.parking = {}   # agent -> tile
+
+    def owner(self, tile, step):
+        agent = self.cells.get((tile, step))
+        if agent is None:
+            parked = self.parked.get(tile)
+            if parked is not None and step >= parked[1]:
+                agent = parked[0]
+        return agent
+
+    def is_free(self, tile, step, agent = None):
+        return self.owner(tile, step) in (None, agent)
+
+    def can_move(self, agent, tile, neighbor, step):
+        """True if agent can go from tile at step to neighbor at step + 1 (or wait, for neighbor == tile) without meeting anyone"""
+        if not self.is_free(neighbor, step + 1, agent):
+            return False
+        # two agents swapping tiles would walk through each other
+        other = self.owner(neighbor, step)
+        return other in (None, agent) or self.owner(tile, step + 1) != other
+
+    def reserve(self, agent, tile_path, step, park = True, free_only = False):
+        """Reserves one tile of tile_path per step from step on (skipping the ones others hold, with free_only), and parks agent on the last one"""
+        self.release(agent)
+        cells = [(tile, step + offset) for offset, tile in enumerate(tile_path)]
+        if free_only:
+            cells = [cell for cell in cells if self.is_free(*cell)]
+        for cell in cells:
+            self.cells[cell] = agent
+        self.steps[agent] = cells
+        if tile_path and park:
+            self.park(agent, tile_path[-1], step + len(tile_path) - 1)
+
+    def park(self, agent, tile, step = 0):
+        self.unpark(agent)
+        if tile not in self.parked:
+            self.parked[tile] = (agent, step)
+            self.parking[agent] = tile
+
+    def unpark(self, agent):
+        tile = self.parking.pop(agent, None)
+        if tile is not None and self.parked.get(tile, (None,))[0] == agent:
+            del self.parked[tile]
+
+    def release(self, agent):
+        """Drops every reservation of agent"""
+        for cell in self.steps.pop(agent, ()):
+            if self.cells.get(cell) == agent:
+                del self.cells[cell]
+        self.unpark(agent)
+
+    def tiles_of_others(self, agent):
+        """Every tile an agent other than agent reserved or parks on"""
+        tiles = {tile for (tile, step), owner in self.cells.items() if owner != agent}
+        tiles.update(tile for tile, (owner, step) in self.parked.items() if owner != agent)
+        return tiles
+
+    def expire(self, step):
+        """Forgets the reservations for steps before step"""
+        for agent, cells in self.steps.items():
+            if cells and cells[0][1] < step:
+                for cell in cells:
+                    if cell[1] < step and self.cells.get(cell) == agent:
+                        del self.cells[cell]
+                self.steps[agent] = [cell for cell in cells if cell[1] >= step]
+
+def cooperative_a_star(world_grid, reservations, agent, start, end, field, step = 0, window = COOPERATIVE_WINDOW, stats = None):
+    """
+    Windowed hierarchical cooperative A* (WHCA*) for one agent. For the first window time steps it searches tiles and time together,
+    stepping or waiting so that it never meets a tile another agent reserved, then follows field without reservations.
+    field is anything with distance(tile) and tile_path(tile) towards end, a flow_field.FlowField or a PathGuide, and is the heuristic of the search.
+    Inside the window it also goes around dynamic obstacles (but never treats start or end as blocked by one), beyond it field decides.
+    Returns one tile per time step from start to end, a tile repeats while the agent waits. [] if end cannot be reached
+    """
+    if not (world_grid.in_bounds(*start) and world_grid.in_bounds(*end)) or field.distance(start) == float('inf'):
+        return []
+    blocked = world_grid.row_lists(TileFlag.COLLISION | DYNAMIC_OBSTACLES)
+    distance = field.distance
+
+    open_set = [(distance(start), distance(start), 0, start)]    # (f-score, steps left, time step, tile), every step and every wait costs 1
+    came_from = {(start, 0): None}
+    deepest = (0, start)
+    while open_set:
+        _, _, time, current = heapq.heappop(open_set)
+        if stats is not None:
+            stats['expanded'] = stats.get('expanded', 0) + 1
+        deepest = max(deepest, (time, current), key = lambda state: (state[0], -distance(state[1])))
+
+        # end is only reached if nobody walks over it while the agent waits there
+        if current == end and all(reservations.is_free(end, step + later, agent) for later in range(time, window + 1)):
+            return cooperative_path(came_from, (current, time))
+        # every state at the window costs the same window steps, so the first one popped has the fewest steps left:
+        # the one that got furthest along, an agent only waits out the window when nothing closer could be reached
+        if time == window:
+            return cooperative_path(came_from, (current, time)) + field.tile_path(current)[1:]
+
+        x, y = current
+        for neighbor in ((x, y), (x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+            if (neighbor, time + 1) in came_from or not world_grid.in_bounds(*neighbor):
+                continue
+            if blocked[neighbor[1]][neighbor[0]] and neighbor != start and neighbor != end:
+                continue
+            if not reservations.can_move(agent, current, neighbor, step + time):
+                continue
+            h = distance(neighbor)
+            if h == float('inf'):
+                continue
+            came_from[(neighbor, time + 1)] = (current, time)
+            heapq.heappush(open_set, (time + 1 + h, h, time + 1, neighbor))     # ties go to the state closer to end
+
+    # the other agents box it in before the end of the window, it gets as far as it can without meeting them
+    time, current = deepest
+    return cooperative_path(came_from, (current, time)) + field.tile_path(current)[1:]
+
+def cooperative_path(came_from, state):
+    path = []
+    while state is not None:
+        path.append(state[0])
+        state = came_from[state]
+    return path[::-1]
+
+class PathGuide:
+    """
+    Heuristic of a cooperative search towards the end of one static tile path, for destinations without a flow field.
+    A tile on the path is as far from the end as the rest of the path, any other tile walks back onto the path first.
+    The walking distances spread out from the path (a Dijkstra seeded with the steps left at every path tile)
+    only as far as the search asks for them.
+    """
+    def __init__(self, world_grid, tile_path):
+        self.world_grid = world_grid
+        self.path = tile_path
+        self.remaining = {tile: len(tile_path) - 1 - i for i, tile in enumerate(tile_path)}     # path tile -> steps left to the end
+        self.blocked = world_grid.row_lists(IMPASSABLE)
+        self.distances = {}                                                                     # tile -> steps to the end, for the tiles settled so far
+        self.toward_path = {}                                                                   # tile -> next tile back onto the path, a path tile points at itself
+        self.frontier = [(remaining, tile, tile) for tile, remaining in self.remaining.items()] # (steps to the end, tile, tile it came from)
+        heapq.heapify(self.frontier)
+
+    def distance(self, tile):
+        """Steps from tile to the end, walking back onto the path and along it. inf if the path cannot be reached"""
+        while tile not in self.distances and self.frontier:
+            self.settle()
+        return self.distances.get(tile, float('inf'))
+
+    def settle(self):
+        distance, tile, came_from = heapq.heappop(self.frontier)
+        if tile in self.distances:
+            return
+        self.distances[tile] = distance
+        self.toward_path[tile] = came_from
+        x, y = tile
+        if self.blocked[y][x] and tile not in self.remaining:
+            return      # an npc standing on an obstacle can still walk off it, but nobody walks through it
+        for neighbor in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+            if neighbor not in self.distances and self.world_grid.in_bounds(*neighbor):
+                heapq.heappush(self.frontier, (distance + 1, neighbor, tile))
+
+    def tile_path(self, start):
+        """Every tile from start to the end, back onto the path by the shortest way first. [] if the path cannot be reached"""
+        if self.distance(start) == float('inf'):
+            return []
+        way_back = [start]
+        while self.toward_path[way_back[-1]] != way_back[-1]:
+            way_back.append(self.toward_path[way_back[-1]])
+        return way_back + self.path[len(self.path) - self.remaining[way_back[-1]]:]
+
+class CooperativePlanner:
+    """
+    Plans npc paths with WHCA* against one shared ReservationTable, so npcs walking at the same time do not run into each other.
+    A time step is the NPC_STEP_TIME an npc takes to walk one tile. Paths are planned against the reservations of every other npc,
+    plan() takes a batch of trips and plans them in order, renew_path() plans the last trip of an npc again on the way.
+    The static pathfinder (a flow_field.FlowFieldService) gives the heuristic, a flow field only for popular destinations,
+    and the paths of single trips without an agent.
+    """
+    def __init__(self, world_grid, pathfinder, window = COOPERATIVE_WINDOW, step_time = NPC_STEP_TIME):
+        self.world_grid = world_grid
+        self.pathfinder = pathfinder
+        self.window = window
+        self.step_time = step_time
+        self.reservations = ReservationTable()
+        self.lock = threading.Lock()    # npcs plan from the llm threads
+        self.heuristics = {}            # agent -> (end tile, field) of its last plan
+        self.expanded = 0               # tiles expanded by the last plan()
+
+    def current_step(self):
+        return pygame.time.get_ticks() // self.step_time
+
+    def park(self, agent, pos):
+        """An agent standing on pos until it is planned"""
+        with self.lock:
+            self.reservations.park(agent, self.world_grid.tile_at(pos))
+
+    def hold(self, agent, tile_path):
+        """
+        Reserves the next window steps of a path planned without the other agents (a D* Lite route) where nobody else has,
+        so they keep planning around the agent. Never waits: the old reservations stay while another npc is planning
+        """
+        if not self.lock.acquire(blocking = False):
+            return
+        try:
+            step = self.current_step()
+            self.reservations.expire(step)
+            self.reservations.reserve(agent, tile_path[:self.window + 1], step, park = len(tile_path) <= self.window + 1, free_only = True)
+        finally:
+            self.lock.release()
+
+    def reserved_by_others(self, agent):
+        with self.lock:
+            return self.reservations.tiles_of_others(agent)
+
+    def plan(self, trips, step = None):
+        """Conflict free tile paths for [(agent, start tile, end tile)] from step on (now by default). Returns {agent: tiles, one per time step}"""
+        # a trip to a fence or a tree ends on the closest tile beside it
+        trips = [(agent, start, self.world_grid.closest_open_tile(end) if self.world_grid.in_bounds(*end) else end) for agent, start, end in trips]
+
+        # fields and static paths can take a while, the other npcs keep planning in the meantime
+        fields = {}
+        for agent, start, end in trips:
+            if end is not None and self.world_grid.in_bounds(*start) and self.world_grid.in_bounds(*end):
+                fields[agent] = self.pathfinder.guide(start, end)
+
+        with self.lock:
+            return self.plan_trips(trips, fields, self.current_step() if step is None else step)
+
+    def plan_trips(self, trips, fields, step):
+        # the lock is held. fields: {agent: heuristic towards its end}
+        self.reservations.expire(step)
+
+        # agents that cannot get anywhere stay where they are, the others hold their tile until their turn to move
+        for agent, start, end in trips:
+            field = fields.get(agent)
+            if field is None or field.distance(start) == float('inf'):
+                fields.pop(agent, None)
+                self.heuristics.pop(agent, None)
+                self.reservations.reserve(agent, [start], step)
+            else:
+                self.reservations.reserve(agent, [start, start], step, park = False)
+
+        stats = {}
+        paths = {}
+        for agent, start, end in trips:
+            if agent not in fields:
+                paths[agent] = []
+                continue
+            paths[agent] = cooperative_a_star(self.world_grid, self.reservations, agent, start, end, fields[agent], step, self.window, stats = stats)
+            self.reservations.reserve(agent, paths[agent] or [start], step)
+            self.heuristics[agent] = (end, fields[agent])
+        self.expanded = stats.get('expanded', 0)
+        return paths
+
+    def find_path(self, start, end, agent = None):
+        """Same as pathfinding.find_path. With an agent the path steers clear of the other agents, a None waypoint waits one time step"""
+        if agent is None:
+            return self.pathfinder.find_path(start, end)
+        start_tile, end_tile = self.world_grid.tile_at((start['x'], start['y'])), self.world_grid.tile_at((end['x'], end['y']))
+        return path_to_waypoints(self.plan([(agent, start_tile, end_tile)])[agent], end)
+
+    def renew_path(self, start, end, agent):
+        """
+        find_path for an agent on its way to end again, against the latest reservations and with the heuristic of its last plan.
+        Runs on the game loop, so it never waits: None while another npc is planning or if the agent has no plan to renew
+        """
+        heuristic = self.heuristics.get(agent)
+        if heuristic is None or not self.lock.acquire(blocking = False):
+            return None
+        try:
+            end_tile, field = heuristic
+            paths = self.plan_trips([(agent, self.world_grid.tile_at((start['x'], start['y'])), end_tile)], {agent: field}, self.current_step())
+        finally:
+            self.lock.release()
+        return path_to_waypoints(paths[agent], end)
@@ -0,0 +1,161 @@
+"""
+Compares pathfinding.a_star with the jump point search of path_engine.PathEngine
+and the hierarchical planner of hpa.HierarchicalPathfinder on data/map.tmx and on large synthetic maps.
+Then counts the waypoints of npc paths across data/map.tmx before and after the string pulling of pathfinding.smooth_path.
+
+    python pathfinding_benchmark.py [queries] [seed]
+"""
+import os, sys, time
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import numpy as np
+import pygame
+from settings import *
+from world_grid import WorldGrid, TileFlag, DYNAMIC_OBSTACLES
+from map_data import load_map
+from sprites import Generic, WildFlower
+from pathfinding import a_star, path_to_waypoints, smooth_path
+from path_engine import PathEngine
+from hpa import HierarchicalPathfinder
+from dstar_lite import DStarLite
+
+def scattered_map(size, density, rng):
+    """Open field with single blocked tiles dropped at random"""
+    world_grid = WorldGrid(size, size)
+    world_grid.flags[rng.random((size, size)) < density] = TileFlag.COLLISION
+    return world_grid
+
+def rooms_map(size, room, rng):
+    """Square rooms with walls between them and a couple of doors in every wall"""
+    world_grid = WorldGrid(size, size)
+    walls = np.zeros((size, size), dtype = bool)
+    walls[::room, :] = True
+    walls[:, ::room] = True
+    for y in range(0, size, room):
+        for x in range(0, size, room):
+            for _ in range(2):
+                walls[y, min(x + rng.integers(1, room), size - 1)] = False     # door in the top wall
+                walls[min(y + rng.integers(1, room), size - 1), x] = False     # door in the left wall
+    world_grid.flags[walls] = TileFlag.COLLISION
+    return world_grid
+
+def open_tiles(world_grid, count, rng):
+    tiles = [(int(x), int(y)) for y, x in np.argwhere(~world_grid.mask(TileFlag.COLLISION))]
+    return [(tiles[rng.integers(len(tiles))], tiles[rng.integers(len(tiles))]) for _ in range(count)]
+
+def centre(tile):
+    return {'x': tile[0] * TILE_SIZE + TILE_SIZE / 2, 'y': tile[1] * TILE_SIZE + TILE_SIZE / 2}
+
+def timed(search, queries):
+    times, lengths = [], []
+    for start, end in queries:
+        t0 = time.perf_counter()
+        path = search(start, end)
+        times.append(time.perf_counter() - t0)
+        lengths.append(len(path))
+    return times, lengths
+
+def benchmark(name, world_grid, queries):
+    print(f'{name}: {world_grid.width}x{world_grid.height} tiles, {len(queries)} queries')
+    a_star_expanded = []
+    def search_a_star(start, end):
+        stats = {}
+        path = a_star(world_grid, centre(start), centre(end), TILE_SIZE, stats)
+        a_star_expanded.append(stats.get('expanded', 0))
+        return path
+    results = {'a_star': timed(search_a_star, queries), 'a_star expanded': a_star_expanded}
+
+    # the hierarchical planner places its entrances up front and links clusters the first time a search crosses them,
+    # so it runs the queries once to warm up and is timed on the second run
+    hierarchical = HierarchicalPathfinder(world_grid)
+    t0 = time.perf_counter()
+    hierarchical.update()
+    entrance_time = (time.perf_counter() - t0) * 1000
+    t0 = time.perf_counter()
+    for start, end in queries:
+        hierarchical.tile_path(start, end)
+    warm_up_time = (time.perf_counter() - t0) * 1000
+
+    for label, planner in (('jps', PathEngine(world_grid)), ('jps 8 dir', PathEngine(world_grid, diagonal = True)), ('hpa*', hierarchical)):
+        expanded = []
+        def search(start, end):
+            path = planner.tile_path(start, end)
+            expanded.append(planner.expanded)
+            return path
+        results[label] = timed(search, queries)
+        results[label + ' expanded'] = expanded
+
+    for label in ('a_star', 'jps', 'jps 8 dir', 'hpa*'):
+        times = np.array(results[label][0]) * 1000
+        print(f'  {label:10} mean {times.mean():8.2f} ms   p95 {np.percentile(times, 95):8.2f} ms   max {times.max():8.2f} ms   {np.mean(results[label + " expanded"]):9.1f} nodes expanded')
+    print(f'  hpa* entrances placed in {entrance_time:.1f} ms, first run with cluster links {warm_up_time:.1f} ms')
+
+    # 4 directional jps must find paths exactly as long as a*, hpa* a little longer
+    mismatches = sum(a != b for a, b in zip(results['a_star'][1], results['jps'][1]))
+    print(f'  path length mismatches between a_star and jps: {mismatches}')
+    found = [(b, a) for a, b in zip(results['a_star'][1], results['hpa*'][1]) if a and b]
+    if found:
+        print(f'  hpa* path length / a_star path length: mean {np.mean([b / a for b, a in found]):.3f}   max {max(b / a for b, a in found):.3f}')
+
+def place_map_obstacles(world_grid, map_data):
+    """Fences, rocks, trees and flowers as obstacles on their hitboxes, like level.Level places its collision sprites"""
+    sprites = [Generic((x * TILE_SIZE, y * TILE_SIZE), surf, []) for layer in ('Fence', 'Rock') for x, y, surf in map_data.tiles(layer)]
+    sprites += [Generic((obj.x, obj.y), obj.image, []) for obj in map_data.objects('Trees')]
+    sprites += [WildFlower((obj.x, obj.y), obj.image, []) for obj in map_data.objects('Decoration')]
+    for sprite in sprites:
+        world_grid.place_obstacle(sprite, world_grid.tiles_under(sprite.hitbox))
+
+def cross_map_trips(world_grid, count, rng):
+    """Trips between open tiles at least a third of the map apart"""
+    tiles = [(int(x), int(y)) for y, x in np.argwhere(~world_grid.mask(TileFlag.COLLISION | DYNAMIC_OBSTACLES))]
+    trips = []
+    while len(trips) < count:
+        start, end = tiles[rng.integers(len(tiles))], tiles[rng.integers(len(tiles))]
+        if abs(start[0] - end[0]) + abs(start[1] - end[1]) >= (world_grid.width + world_grid.height) / 3:
+            trips.append((start, end))
+    return trips
+
+def walked_length(start, waypoints):
+    points = [start] + [waypoint for waypoint in waypoints if waypoint is not None]
+    return sum(((bx - ax) ** 2 + (by - ay) ** 2) ** 0.5 for (ax, ay), (bx, by) in zip(points, points[1:]))
+
+def smoothing_benchmark(name, world_grid, trips, half_width = 23, half_height = 27):
+    """Waypoints of the paths npcs walk around obstacles (D* Lite tiles), before and after string pulling with the npc hitbox"""
+    before, after, lengths_before, lengths_after, times = [], [], [], [], []
+    for start, end in trips:
+        route = DStarLite(world_grid, start, end)
+        tiles = route.tile_path()
+        route.close()
+        if not tiles:
+            continue
+        origin, destination = centre(start), centre(end)
+        waypoints = path_to_waypoints(tiles, destination)
+        t0 = time.perf_counter()
+        smoothed = smooth_path(world_grid, (origin['x'], origin['y']), waypoints, half_width, half_height)
+        times.append((time.perf_counter() - t0) * 1000)
+        before.append(len(waypoints))
+        after.append(len(smoothed))
+        lengths_before.append(walked_length((origin['x'], origin['y']), waypoints))
+        lengths_after.append(walked_length((origin['x'], origin['y']), smoothed))
+
+    print(f'{name}: {len(trips)} trips across the map, {len(before)} reachable around the obstacles, hitbox {half_width * 2}x{half_height * 2} px')
+    print(f'  waypoints per path   before mean {np.mean(before):6.1f} max {max(before):4}   after mean {np.mean(after):6.1f} max {max(after):4}   ({1 - sum(after) / sum(before):.0%} fewer)')
+    print(f'  walked length        before mean {np.mean(lengths_before):7.0f} px   after mean {np.mean(lengths_after):7.0f} px')
+    print(f'  string pulling       mean {np.mean(times):6.2f} ms   max {max(times):6.2f} ms')
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    rng = np.random.default_rng(int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    world_grid = WorldGrid.from_map()
+    benchmark('data/map.tmx', world_grid, open_tiles(world_grid, count, rng))
+
+    for name, world_grid in (('scattered 20%', scattered_map(256, 0.2, rng)), ('rooms', rooms_map(256, 16, rng)), ('scattered 20%', scattered_map(512, 0.2, rng)), ('rooms', rooms_map(1024, 32, rng))):
+        benchmark(name, world_grid, open_tiles(world_grid, max(count // 5, 1), rng))
+
+    map_data = load_map()
+    world_grid = WorldGrid.from_map(map_data)
+    place_map_obstacles(world_grid, map_data)
+    smoothing_benchmark('data/map.tmx with obstacles', world_grid, cross_map_trips(world_grid, count, rng))
@@ -109,21 +109,13 @@ class Player(pygame.sprite.Sprite):
     
     def use_seed(self):
         # print(f"seed use: {self.selected_item['name']}")
-        if self.selected_item['quantity'] > 0:
-            self.soil_layer.plant_seed(self.target_pos, self.selected_item['name'])
+        # a seed is only used up if there is tilled soil to plant it in
+        if self.selected_item['quantity'] > 0 and self.soil_layer.plant_seed(self.target_pos, self.selected_item['name']):
             self.selected_item['quantity'] -= 1
 
     def import_assets(self):
-        self.animations = {'up': [],'down': [],'left': [],'right': [],
-                    'right_idle':[],'left_idle':[],'up_idle':[],'down_idle':[],
-                    'right_hoe':[],'left_hoe':[],'up_hoe':[],'down_hoe':[],
-                    'right_axe':[],'left_axe':[],'up_axe':[],'down_axe':[],
-                    'right_water':[],'left_water':[],'up_water':[],'down_water':[]}
-
-        # Import image surface into animations dict
-        for animation in self.animations.keys():
-            full_path = './graphics/character/' + animation
-            self.animations[animation] = import_folder(full_path)
+        # Frames are loaded once and shared by every character
+        self.animations = import_animations('./graphics/character/', CHARACTER_ANIMATIONS)
 
     def animate(self, dt):
         # Two key issues to note:
@@ -191,7 +183,7 @@ class Player(pygame.sprite.Sprite):
             
             # interact with interaction sprites
             if keys[pygame.K_n] and not self.timers['interact'].active:
-                collided_interaction_sprites = [s for s in self.interaction_sprites if self.hitbox.colliderect(s.rect)]
+                collided_interaction_sprites = self.interaction_sprites.collide(self.hitbox)
                 if collided_interaction_sprites:
                     if collided_interaction_sprites[0].prop['name'] == 'Trader':
                         self.toggle_shop()
@@ -210,7 +202,7 @@ class Player(pygame.sprite.Sprite):
                     self.timers['interact'].activate()
             
             if keys[pygame.K_m] and not self.timers['interact'].active:
-                collided_interaction_sprites = [s for s in self.interaction_sprites if self.hitbox.colliderect(s.rect)]
+                collided_interaction_sprites = self.interaction_sprites.collide(self.hitbox)
                 if collided_interaction_sprites:
                     if collided_interaction_sprites[0].prop['name'] == "NPC":
                         npc_name = collided_interaction_sprites[0].prop['npc_name']
@@ -300,7 +292,8 @@ class Player(pygame.sprite.Sprite):
             timer.update()
 
     def collision(self, direction):
-        for sprite in self.collision_sprites.sprites():
+        # only the blockers around the hitbox can collide with it
+        for sprite in self.collision_sprites.candidates(self.hitbox):
             if hasattr(sprite, 'hitbox'):
                 if sprite.hitbox.colliderect(self.hitbox):
                     if direction == 'horizontal':
@@ -340,7 +333,7 @@ class Player(pygame.sprite.Sprite):
         
     def get_tool_tip(self):
         # Check for collision with interaction sprites. If yes, display tool tip
-        collided_sprites = [s for s in self.interaction_sprites if self.hitbox.colliderect(s.rect)]
+        collided_sprites = self.interaction_sprites.collide(self.hitbox)
         if collided_sprites:
             if collided_sprites[0].prop['name'] == "Location":
                 self.tooltip.update_color(RED)
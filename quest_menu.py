@@ -1,5 +1,7 @@
 import pygame
 from settings import *
+from text_cache import text_cache
+from text_layout import text_layout
 
 class QuestMenu:
     """Displays the player's active quests when 'E' is pressed."""
@@ -7,8 +9,8 @@ class QuestMenu:
     def __init__(self, player):
         self.player = player  # Reference to player's quests
         self.display_surface = pygame.display.get_surface()
-        self.font = pygame.font.SysFont(None, 32)
-        self.title_font = pygame.font.SysFont(None, 40, bold=True)
+        self.font = text_cache.sys_font(None, 32)
+        self.title_font = text_cache.sys_font(None, 40, bold=True)
 
         self.is_open = False  # Menu starts closed
         self.max_displayed_quests = 3  # Limit quests shown
@@ -30,41 +32,18 @@ class QuestMenu:
                          (self.quest_x, offset_y, self.quest_width, self.quest_height), 3, border_radius=15)
         
         # Render Quest Name
-        name_surface = self.font.render(quest.name, True, (255, 200, 0))
+        name_surface = text_cache.render(self.font, quest.name, True, (255, 200, 0))
         name_rect = name_surface.get_rect(topleft=(self.quest_x + 20, offset_y + 20))
         self.display_surface.blit(name_surface, name_rect)
         
         # Render Quest Description
-        wrapped_text = self.wrap_text(quest.description, self.quest_width - 40)
         offset_y_for_description = offset_y + 60  # Start position for text inside box
-        for line in wrapped_text:
-            npc_surface = self.font.render(line, True, WHITE)
-            self.display_surface.blit(npc_surface, (self.quest_x + 20, offset_y_for_description))
-            offset_y_for_description += self.font.get_height() + 5  # Space between lines
+        line_height = self.font.get_height() + 5  # Space between lines
+        paragraph = text_layout.paragraph(quest.description, self.font, self.quest_width - 40, WHITE, line_height)
+        self.display_surface.blit(paragraph, (self.quest_x + 20, offset_y_for_description))
         
         self.draw_progress_bar(quest, offset_y)
 
-    def wrap_text(self, text, max_width):
-        """Splits text into multiple lines based on available width."""
-        words = text.split()  # Split text into individual words
-        lines = []
-        current_line = ""
-
-        for word in words:
-            # Check if adding this word exceeds the width
-            test_line = f"{current_line} {word}".strip()
-            if self.font.size(test_line)[0] < max_width:
-                current_line = test_line
-            else:
-                lines.append(current_line)  # Store current line and start a new one
-                current_line = word  # Start with the new word
-
-        # Append last line
-        if current_line:
-            lines.append(current_line)
-
-        return lines  
-
     def draw_progress_bar(self, quest, offset_y):
         # Draw progress bar
         progress_box_margin = 10
@@ -85,7 +64,7 @@ class QuestMenu:
             pygame.draw.rect(self.display_surface, GREEN, (progress_box_x, progress_box_y, filled_width, progress_box_height), border_radius=12)
         
         # Render progress text
-        progress_text = self.font.render(f"{quest.target_item}: {progress} / {target}", True, BLACK)
+        progress_text = text_cache.render(self.font, f"{quest.target_item}: {progress} / {target}", True, BLACK)
         text_x = self.quest_x + self.quest_width // 2 - progress_text.get_width() // 2
         text_y = progress_box_y + progress_box_height // 2 - progress_text.get_height() // 2
         self.display_surface.blit(progress_text, (text_x, text_y))
@@ -97,7 +76,7 @@ class QuestMenu:
 
         # Draw Title
         title_y = 50
-        title_surface = self.title_font.render("Quest Menu", True, (255, 255, 255))
+        title_surface = text_cache.render(self.title_font, "Quest Menu", True, (255, 255, 255))
         title_rect = title_surface.get_rect(center=(SCREEN_WIDTH // 2, title_y))
         self.display_surface.blit(title_surface, title_rect)
 
@@ -0,0 +1,55 @@
+from bisect import bisect_left
+import heapq
+
+class RenderQueue:
+    """
+    Draw order of the sprites around the camera, keyed by (z, centery).
+    Sprites at rest are kept sorted between frames and only move in or out of the queue when they are
+    added, killed, start or stop moving, or when the camera enters a new region of the spatial hash.
+    Moving sprites are sorted every frame and merged in.
+    """
+    def __init__(self, sequence):
+        self.sequence = sequence    # sprite -> insertion number, breaks ties in group order
+        self.region = None          # cell range the resting sprites were collected from
+        self.keys = []
+        self.sprites = []
+        self.entries = {}           # sprite -> key it is stored with
+
+    def key(self, sprite):
+        # Fake 3D: Sprite at lower y-axis stand behind sprite at higher y-axis
+        # (a sprite killed from another thread has already lost its insertion number)
+        return (sprite.z, sprite.rect.centery, self.sequence.get(sprite, 0))
+
+    def rebuild(self, region, sprites):
+        entries = sorted(((self.key(sprite), sprite) for sprite in sprites), key = first)
+        self.region = region
+        self.keys = [key for key, _ in entries]
+        self.sprites = [sprite for _, sprite in entries]
+        self.entries = dict(zip(self.sprites, self.keys))
+
+    def insert(self, sprite):
+        if sprite in self.entries:
+            return
+        key = self.key(sprite)
+        index = bisect_left(self.keys, key)
+        self.keys.insert(index, key)
+        self.sprites.insert(index, sprite)
+        self.entries[sprite] = key
+
+    def discard(self, sprite):
+        key = self.entries.pop(sprite, None)
+        if key is None:
+            return
+        index = bisect_left(self.keys, key)
+        del self.keys[index]
+        del self.sprites[index]
+
+    def ordered(self, moving_sprites):
+        """Resting and moving sprites merged into draw order"""
+        moving = sorted(((self.key(sprite), sprite) for sprite in moving_sprites), key = first)
+        for _, sprite in heapq.merge(zip(self.keys, self.sprites), moving, key = first):
+            yield sprite
+
+def first(entry):
+    # sort (key, sprite) pairs by key only, sprites do not compare
+    return entry[0]
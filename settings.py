@@ -5,11 +5,49 @@ SCREEN_WIDTH = 1280
 SCREEN_HEIGHT = 720
 TILE_SIZE = 64
 
+# map
+MAP_PATH = './data/map.tmx'
+
+# size of a cell of the location lookup raster
+LOCATION_RASTER_SIZE = TILE_SIZE // 2
+
+# static map chunks
+CHUNK_TILES = 8             # width and height of a baked chunk in tiles
+MAX_CACHED_CHUNKS = 64      # baked chunk surfaces kept in memory (1 MB each)
+
+# loaded and scaled images kept by the asset manager
+ASSET_CACHE_BYTES = 64 * 1024 * 1024
+
+# rendered text surfaces kept by the text cache
+TEXT_CACHE_SIZE = 512
+TEXT_LAYOUT_CACHE_SIZE = 64   # wrapped paragraphs kept by the text layout
+
+# npc pathfinding
+FLOW_FIELD_CACHE_SIZE = 32      # destinations with a flow field kept in memory
+FLOW_FIELD_MIN_REQUESTS = 3     # times a destination is walked to before it gets a flow field
+HPA_CLUSTER_SIZE = 16           # width and height in tiles of a cluster of the hierarchical pathfinder
+HPA_WIDE_ENTRANCE = 6           # border openings at least this wide get an entrance at both ends
+HPA_MIN_MAP_TILES = 200 * 200   # maps with at least this many tiles plan trips without a flow field hierarchically
+COOPERATIVE_WINDOW = 16         # time steps of its path an npc reserves so the other npcs walk around it
+NPC_STEP_TIME = 320             # ms an npc takes to walk one tile at speed 200, a time step of the reservations
+NPC_MOVE_TIMEOUT = 60           # s the move_to tool of an npc waits for it to arrive
+PATH_SERVICE_WORKERS = 2        # processes searching paths and building flow fields for the npcs
+PATH_SERVICE_CACHE_SIZE = 256   # tile paths kept by the path service
+PATH_SERVICE_SAMPLES = 256      # latest requests the path service latency figures are taken over
+
 # overlay positions 
 OVERLAY_POSITIONS = {
     'tool' : (40, SCREEN_HEIGHT - 15), 
     'seed': (70, SCREEN_HEIGHT - 5)}
 
+# animation folders under graphics/character, shared by the player and the npcs
+CHARACTER_ANIMATIONS = [
+    'up', 'down', 'left', 'right',
+    'right_idle', 'left_idle', 'up_idle', 'down_idle',
+    'right_hoe', 'left_hoe', 'up_hoe', 'down_hoe',
+    'right_axe', 'left_axe', 'up_axe', 'down_axe',
+    'right_water', 'left_water', 'up_water', 'down_water']
+
 PLAYER_TOOL_OFFSET = {
     'left': Vector2(-50,40),
     'right': Vector2(50,40),
@@ -1,7 +1,8 @@
 import pygame
 from settings import *
-from pytmx.util_pygame import load_pygame
+from world_grid import TileFlag
 from support import *
+from asset_manager import asset_manager
 from random import choice
 
 '''
@@ -11,6 +12,9 @@ requirements
 3. if the soil has a plant
 '''
 
+# soil graphic of a tilled tile, indexed by its tilled neighbours: top 1 | right 2 | bottom 4 | left 8
+SOIL_TILE_TYPES = ('o', 'b', 'l', 'bl', 't', 'tb', 'tl', 'tbr', 'r', 'br', 'lr', 'lrb', 'tr', 'tbl', 'lrt', 'x')
+
 class SoilTile(pygame.sprite.Sprite):
     def __init__(self, pos, surf, groups):
         super().__init__(groups)
@@ -30,7 +34,7 @@ class Plant(pygame.sprite.Sprite):
 
         # setup
         self.plant_type = plant_type
-        self.frames = import_folder(f'./graphics/fruit/{plant_type}')
+        self.frames = asset_manager.frames(f'./graphics/fruit/{plant_type}')
         self.soil = soil
         self.check_watered = check_watered
 
@@ -62,7 +66,11 @@ class Plant(pygame.sprite.Sprite):
             self.rect = self.image.get_rect(midbottom = self.soil.rect.midbottom + pygame.math.Vector2(0,self.y_offset))
 
 class SoilLayer:
-    def __init__(self, all_sprites):
+    def __init__(self, all_sprites, world_grid):
+
+        # farmable, tilled, watered and planted tiles live in the shared world grid
+        self.world_grid = world_grid
+        self.world_grid.subscribe(self.tilled_changed, TileFlag.TILLED)
 
         # sprite groups
         self.all_sprites = all_sprites
@@ -70,13 +78,17 @@ class SoilLayer:
         self.water_sprites = pygame.sprite.Group()
         self.plant_sprites = pygame.sprite.Group()
 
+        # the sprites of every tile, so a tool or seed used on a position goes straight to its tile
+        self.soil_tiles = {}    # tile -> SoilTile
+        self.water_tiles = {}   # tile -> WaterTile
+        self.plants = {}        # tile -> Plant
+
+        self.raining = False    # while it rains newly tilled tiles are watered as well
+
         # graphics
         self.soil_surfs = import_folder_dict('./graphics/soil/')
         self.water_surfs = import_folder('./graphics/soil_water/')
 
-        self.create_soil_grid()
-        self.create_hit_rects()
-        
         # sounds
         self.hoe_sound = pygame.mixer.Sound('./audio/hoe.wav')
         self.hoe_sound.set_volume(0.1)
@@ -87,136 +99,110 @@ class SoilLayer:
         self.plant_sound = pygame.mixer.Sound('./audio/plant.wav') 
         self.plant_sound.set_volume(0.2)
 
-    def create_soil_grid(self):   
-        tmx_data = load_pygame('./data/map.tmx')
-        h_tiles, v_tiles = tmx_data.width, tmx_data.height
-        
-        self.grid = [[[] for col in range(h_tiles)] for row in range(v_tiles)]
-        for x, y, _ in tmx_data.get_layer_by_name('Farmable').tiles():
-            self.grid[y][x].append('F')
-
-    def create_hit_rects(self):
-        self.hit_rects = []
-        for index_row, row in enumerate(self.grid):
-            for index_col, cell in enumerate(row):
-                if 'F' in cell:
-                    x = index_col * TILE_SIZE
-                    y = index_row * TILE_SIZE
-                    rect = pygame.Rect(x,y,TILE_SIZE, TILE_SIZE)
-                    self.hit_rects.append(rect)
-  
+    def tilled_changed(self, flags, tiles):
+        # only the changed tiles and their neighbours can need another graphic
+        around = {(x + dx, y + dy) for x, y in tiles for dx, dy in ((0, 0), (0, -1), (1, 0), (0, 1), (-1, 0))}
+        self.update_soil_tiles(around)
+        if self.raining:
+            self.water_all()
+
+    def set_raining(self, raining):
+        """Rain waters every tilled tile once when it starts, instead of checking them every frame"""
+        self.raining = raining
+        if raining:
+            self.water_all()
+
     def get_hit(self, target_pos):
-        for rect in self.hit_rects:
-            if rect.collidepoint(target_pos):
-                x = rect.x // TILE_SIZE
-                y = rect.y // TILE_SIZE
-
-                if 'F' in self.grid[y][x] and not 'X' in self.grid[y][x]:
-                    self.grid[y][x].append('X')
-                    self.create_soil_tiles()
-                    self.hoe_sound.play()
+        """Tills the farmable tile at target_pos. Returns False if there is nothing to till"""
+        tile = self.world_grid.tile_at(target_pos)
+        if self.world_grid.is_farmable(tile) and self.world_grid.set(tile, TileFlag.TILLED):
+            self.hoe_sound.play()
+            return True
+        return False
     
     def water(self, target_pos):
-        for soil_sprite in self.soil_sprites.sprites():
-            if soil_sprite.rect.collidepoint(target_pos):
-                
-                x = soil_sprite.rect.x // TILE_SIZE
-                y = soil_sprite.rect.y // TILE_SIZE
-                self.grid[y][x].append('W')
-                
-                pos = soil_sprite.rect.topleft
-                surf = choice(self.water_surfs)
-                WaterTile(pos, surf, [self.all_sprites, self.water_sprites])
-                
-                self.watering_sound.play()
+        """Waters the tilled tile at target_pos. Returns False if there is no tilled soil there"""
+        tile = self.world_grid.tile_at(target_pos)
+        if tile not in self.soil_tiles:
+            return False
+
+        # watering a tile twice does not stack another water tile on it
+        if self.world_grid.set(tile, TileFlag.WATERED):
+            self.add_water_tile(tile)
+        self.watering_sound.play()
+        return True
     
     def water_all(self):
-        for index_row, row in enumerate(self.grid):
-            for index_col, cell in enumerate(row):
-                if 'X' in cell and 'W' not in cell:
-                    cell.append('W')
-                    x = index_col * TILE_SIZE
-                    y = index_row * TILE_SIZE
-                    WaterTile((x,y), choice(self.water_surfs), [self.all_sprites, self.water_sprites])
+        # one array operation over the grid, water tiles only for the tiles it changed
+        for tile in self.world_grid.set_region(TileFlag.WATERED, only = TileFlag.TILLED):
+            self.add_water_tile(tile)
+
+    def add_water_tile(self, tile):
+        self.water_tiles[tile] = WaterTile((tile[0] * TILE_SIZE, tile[1] * TILE_SIZE), choice(self.water_surfs), [self.all_sprites, self.water_sprites])
      
     def remove_water(self):
 
         # destroy all water sprites
-        for sprite in self.water_sprites.sprites():
-            sprite.kill()
+        for water_tile in self.water_tiles.values():
+            water_tile.kill()
+        self.water_tiles.clear()
 
         # clean up the grid
-        for row in self.grid:
-            for cell in row:
-                if 'W' in cell:
-                    cell.remove('W')
+        self.world_grid.set_region(TileFlag.WATERED, False)
     
     def check_watered(self, pos):
-        x = pos[0] // TILE_SIZE
-        y = pos[1] // TILE_SIZE
-        cell = self.grid[y][x]
-        is_watered = 'W' in cell
-        return is_watered
+        return self.world_grid.is_watered(self.world_grid.tile_at(pos))
     
     def plant_seed(self, target_pos, seed):
-        for soil_sprite in self.soil_sprites.sprites():
-            if soil_sprite.rect.collidepoint(target_pos):
-
-                x = soil_sprite.rect.x // TILE_SIZE
-                y = soil_sprite.rect.y // TILE_SIZE
-
-                if 'P' not in self.grid[y][x]:
-                    self.grid[y][x].append('P')
-                    Plant(seed, [self.all_sprites, self.plant_sprites], soil_sprite, self.check_watered)
-                    self.plant_sound.play()
-                    print('seed planted')
+        """Plants seed on the tilled tile at target_pos. Returns False if there is no tilled soil there or it has a plant already"""
+        tile = self.world_grid.tile_at(target_pos)
+        soil_tile = self.soil_tiles.get(tile)
+        if soil_tile is None or not self.world_grid.set(tile, TileFlag.PLANTED):
+            return False
+
+        self.plants[tile] = Plant(seed, [self.all_sprites, self.plant_sprites], soil_tile, self.check_watered)
+        self.plant_sound.play()
+        print('seed planted')
+        return True
+
+    def plants_touching(self, rect):
+        """Plants whose image overlaps rect, looked up on the tiles around it. Grown plants reach above their soil tile"""
+        plants = (self.plants.get(tile) for tile in self.world_grid.tiles_under(pygame.Rect(rect).inflate(TILE_SIZE * 2, TILE_SIZE * 4)))
+        return [plant for plant in plants if plant is not None and plant.rect.colliderect(rect)]
+
+    def harvest(self, plant):
+        """Takes a plant off its tile"""
+        tile = self.world_grid.tile_at(plant.soil.rect.topleft)
+        plant.kill()
+        self.plants.pop(tile, None)
+        self.world_grid.clear(tile, TileFlag.PLANTED)
     
     def update_plants(self):
         for plant in self.plant_sprites.sprites():
             plant.grow()
+            self.all_sprites.refresh(plant)     # growing changes the plant rect
     
-    def create_soil_tiles(self):
-        print("created soil tile")
-        self.soil_sprites.empty()   # clears any previously drawn soil tiles
-        for index_row, row in enumerate(self.grid):
-            for index_col, cell in enumerate(row):
-                if 'X' in cell:
-                    
-                    # soil tiling graphics
-                    t = 'X' in self.grid[index_row - 1][index_col]
-                    b = 'X' in self.grid[index_row + 1][index_col]
-                    r = 'X' in row[index_col + 1]
-                    l = 'X' in row[index_col - 1]
-
-                    tile_type = 'o'
-
-                    # all sides
-                    if all((t,r,b,l)): tile_type = 'x'
-
-                    # horizontal tiles only
-                    if l and not any((t,r,b)): tile_type = 'r'
-                    if r and not any((t,l,b)): tile_type = 'l'
-                    if r and l and not any((t,b)): tile_type = 'lr'
-
-                    # vertical only 
-                    if t and not any((r,l,b)): tile_type = 'b'
-                    if b and not any((r,l,t)): tile_type = 't'
-                    if b and t and not any((r,l)): tile_type = 'tb'
-
-                    # corners 
-                    if l and b and not any((t,r)): tile_type = 'tr'
-                    if r and b and not any((t,l)): tile_type = 'tl'
-                    if l and t and not any((b,r)): tile_type = 'br'
-                    if r and t and not any((b,l)): tile_type = 'bl'
-
-                    # T shapes
-                    if all((t,b,r)) and not l: tile_type = 'tbr'
-                    if all((t,b,l)) and not r: tile_type = 'tbl'
-                    if all((l,r,t)) and not b: tile_type = 'lrb'
-                    if all((l,r,b)) and not t: tile_type = 'lrt'
-     
-                    SoilTile(
-                        pos = (index_col * TILE_SIZE,index_row * TILE_SIZE), 
-                        surf = self.soil_surfs[tile_type], 
-                        groups = [self.all_sprites, self.soil_sprites])
+    def soil_tile_type(self, tile):
+        x, y = tile
+        tilled = lambda neighbour: self.world_grid.has(neighbour, TileFlag.TILLED)
+        return SOIL_TILE_TYPES[tilled((x, y - 1)) | tilled((x + 1, y)) << 1 | tilled((x, y + 1)) << 2 | tilled((x - 1, y)) << 3]
+
+    def update_soil_tiles(self, tiles):
+        """Gives tiles the soil graphic of their tilled neighbours. Tiles keep their SoilTile, only its image changes"""
+        for tile in tiles:
+            soil_tile = self.soil_tiles.get(tile)
+            if not self.world_grid.has(tile, TileFlag.TILLED):
+                if soil_tile is not None:
+                    soil_tile.kill()
+                    del self.soil_tiles[tile]
+                continue
+
+            surf = self.soil_surfs[self.soil_tile_type(tile)]
+            if soil_tile is None:
+                self.soil_tiles[tile] = SoilTile(
+                    pos = (tile[0] * TILE_SIZE, tile[1] * TILE_SIZE),
+                    surf = surf,
+                    groups = [self.all_sprites, self.soil_sprites])
+            else:
+                soil_tile.image = surf
   
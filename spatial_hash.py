@@ -0,0 +1,147 @@
+import threading
+import pygame
+from settings import *
+
+class SpatialHash:
+    """Buckets objects by the grid cells their rect overlaps"""
+    def __init__(self, cell_size = TILE_SIZE * 4):
+        self.cell_size = cell_size
+        self.cells = {}      # (cell x, cell y) -> {obj: None}
+        self.entries = {}    # obj -> cell range it is stored in
+
+    def cell_range(self, rect):
+        # A zero sized rect still belongs to the cell of its top left corner
+        size = self.cell_size
+        return (rect.left // size, rect.top // size, max(rect.right - 1, rect.left) // size, max(rect.bottom - 1, rect.top) // size)
+
+    def insert(self, obj, rect):
+        cell_range = self.cell_range(rect)
+        self.entries[obj] = cell_range
+        for cell in self.iter_cells(cell_range):
+            self.cells.setdefault(cell, {})[obj] = None
+
+    def remove(self, obj):
+        cell_range = self.entries.pop(obj, None)
+        if cell_range is None:
+            return
+        for cell in self.iter_cells(cell_range):
+            bucket = self.cells.get(cell)
+            if bucket is not None:
+                bucket.pop(obj, None)
+                if not bucket:
+                    del self.cells[cell]
+
+    def move(self, obj, rect):
+        """Re-buckets obj. Returns True if it changed cells"""
+        cell_range = self.cell_range(rect)
+        if self.entries.get(obj) == cell_range:
+            return False
+        self.remove(obj)
+        self.insert(obj, rect)
+        return True
+
+    def in_range(self, obj, cell_range):
+        """True if obj is stored in any cell of the cell range"""
+        entry = self.entries.get(obj)
+        if entry is None:
+            return False
+        return entry[0] <= cell_range[2] and cell_range[0] <= entry[2] and entry[1] <= cell_range[3] and cell_range[1] <= entry[3]
+
+    def iter_cells(self, cell_range):
+        left, top, right, bottom = cell_range
+        for cell_y in range(top, bottom + 1):
+            for cell_x in range(left, right + 1):
+                yield (cell_x, cell_y)
+
+    def query_cells(self, cell_range):
+        found = {}
+        for cell in self.iter_cells(cell_range):
+            bucket = self.cells.get(cell)
+            if bucket:
+                found.update(bucket)
+        return list(found)
+
+    def query(self, rect):
+        """Objects stored in the cells overlapping rect (a superset of the exact overlaps)"""
+        return self.query_cells(self.cell_range(rect))
+
+class SpatialGroup(pygame.sprite.Group):
+    """
+    Sprite group that keeps a spatial hash of its members current.
+    Sprites are indexed lazily because most sprites join their groups before their rect exists.
+    Sprites that override update() are assumed to be able to move and are re-indexed by reindex(),
+    any other sprite that changes its rect has to be passed to refresh().
+    """
+    rect_attr = 'rect'
+
+    def __init__(self, *sprites, cell_size = TILE_SIZE * 4):
+        self.spatial_hash = SpatialHash(cell_size)
+        self.pending = {}    # sprites waiting to be indexed
+        self.tracked = {}    # sprite -> copy of the rect it was last indexed with
+        self.sequence = {}   # sprite -> insertion number, keeps query results in group order
+        self.counter = 0
+        self.lock = threading.RLock()    # sprites are added and killed from the llm threads while the main loop indexes them
+        super().__init__(*sprites)
+
+    def add_internal(self, sprite, layer = None):
+        with self.lock:
+            super().add_internal(sprite, layer)
+            self.pending[sprite] = None
+            self.sequence[sprite] = self.counter
+            self.counter += 1
+
+    def remove_internal(self, sprite):
+        with self.lock:
+            super().remove_internal(sprite)
+            self.pending.pop(sprite, None)
+            self.tracked.pop(sprite, None)
+            self.sequence.pop(sprite, None)
+            self.spatial_hash.remove(sprite)
+
+    def flush(self):
+        """Index the sprites added since the last call and return them"""
+        indexed = []
+        with self.lock:
+            for sprite in list(self.pending):
+                rect = getattr(sprite, self.rect_attr, None)
+                if rect is None:
+                    continue    # still being constructed
+                self.pending.pop(sprite, None)
+                self.spatial_hash.insert(sprite, rect)
+                if type(sprite).update is not pygame.sprite.Sprite.update:
+                    self.tracked[sprite] = pygame.Rect(rect)
+                indexed.append(sprite)
+        return indexed
+
+    def refresh(self, sprite):
+        """Re-index a sprite after its rect changed"""
+        with self.lock:
+            if sprite in self.pending or not self.has_internal(sprite):
+                return
+            rect = getattr(sprite, self.rect_attr)
+            self.spatial_hash.move(sprite, rect)
+            last_rect = self.tracked.get(sprite)
+            if last_rect is not None:
+                last_rect.update(rect)
+
+    def reindex(self):
+        """Re-index the sprites that moved since the last call and return them"""
+        moved = []
+        with self.lock:
+            self.flush()
+            for sprite, last_rect in self.tracked.items():
+                rect = getattr(sprite, self.rect_attr)
+                if rect != last_rect:
+                    last_rect.update(rect)
+                    self.spatial_hash.move(sprite, rect)
+                    moved.append(sprite)
+        return moved
+
+    def query(self, rect):
+        """Sprites whose rect may overlap the given rect, in the order they joined the group"""
+        with self.lock:
+            self.flush()
+            # a sprite killed while we sort has no insertion number any more, leave it out
+            ranked = [(self.sequence.get(sprite, -1), sprite) for sprite in self.spatial_hash.query(rect)]
+        ranked.sort(key = lambda item: item[0])
+        return [sprite for rank, sprite in ranked if rank >= 0]
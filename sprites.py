@@ -1,7 +1,8 @@
 import pygame
 from settings import *
+from text_cache import text_cache
 from random import randint, choice
-from support import import_folder
+from asset_manager import asset_manager
 from timer import Timer
 
 class Generic(pygame.sprite.Sprite):
@@ -67,16 +68,16 @@ class Particle(Generic):
 class Tree(Generic):
     def __init__(self, pos, surf, groups, name, player_add):
         super().__init__(pos, surf, groups)
-        self.all_sprites = self.groups()[0]
+        self.all_sprites = groups[0]    # groups() comes from a set, so take it from the list passed in
         
         # tree attributes
         self.health = 5
         self.alive = True
         stump_path = f'./graphics/stumps/{name.lower()}.png'
-        self.stump_surf = pygame.image.load(stump_path).convert_alpha()
+        self.stump_surf = asset_manager.image(stump_path)
         
         # apples
-        self.apple_surf = pygame.image.load('./graphics/fruit/apple.png')
+        self.apple_surf = asset_manager.image('./graphics/fruit/apple.png')
         self.apple_pos = APPLE_POS[name]
         self.apple_sprites = pygame.sprite.Group()
         self.create_fruit()
@@ -112,6 +113,9 @@ class Tree(Generic):
             self.image = self.stump_surf
             self.rect = self.image.get_rect(midbottom = self.rect.midbottom)
             self.hitbox = self.rect.copy().inflate(-10,-self.rect.height * 0.6)
+            for group in self.groups():
+                if hasattr(group, 'refresh'):
+                    group.refresh(self)     # the stump blocks a smaller area
             self.alive = False
             self.player_add('wood', "resource", 1)
 
@@ -134,11 +138,11 @@ class Tree(Generic):
 class TextSprite(pygame.sprite.Sprite):
     def __init__(self, pos, groups, color=WHITE, text="Hello!"):
         super().__init__(groups)
-        font = pygame.font.Font(None, 30)
+        font = text_cache.font(None, 30)
         self.text = text
         self.pos = pos
         self.z = LAYERS['name text']
-        self.image = font.render(self.text, True, color)
+        self.image = text_cache.render(font, self.text, True, color)
         self.rect = self.image.get_rect(center=(self.pos.x, self.pos.y - 40))  # Above the character
 
     def update(self, dt):
@@ -153,10 +157,11 @@ class ToolTipSprite(pygame.sprite.Sprite):
         self.level = level
         self.z = LAYERS['tool tip']
         self.color = color
-        self.font = pygame.font.Font(None, 24)  # Default pygame font, size 24
-        self.image = self.font.render(self.text, True, (255, 255, 255))  # White text
+        self.font = text_cache.font(None, 24)  # Default pygame font, size 24
+        self.image = text_cache.render(self.font, self.text, True, (255, 255, 255))  # White text
         self.rect = self.image.get_rect(topright=(self.player.rect.left + 50, self.player.rect.top + 20 + self.level * 40))  # Position top left abover player
         self.visible = False  # Default: Hidden
+        self.shown = None     # text and color of the current tooltip box
 
     def update(self, dt):
         """Update tooltip position & visibility."""
@@ -173,7 +178,11 @@ class ToolTipSprite(pygame.sprite.Sprite):
 
     def show(self):
         """Show the tooltip."""
-        text_surface = self.font.render(self.text, True, (255, 255, 255))
+        # show() runs every frame, only rebuild the box when its text or color changed
+        if self.visible and self.shown == (self.text, self.color):
+            return
+        self.shown = (self.text, self.color)
+        text_surface = text_cache.render(self.font, self.text, True, (255, 255, 255))
         self.image = pygame.Surface((text_surface.get_width() + 15, text_surface.get_height() + 15))
         self.image.fill(self.color)  # Background Color
         text_rect = text_surface.get_rect(center=(self.image.get_width() // 2, self.image.get_height() // 2))
@@ -199,7 +208,7 @@ class QuestStatusSprite(pygame.sprite.Sprite):
         # Import image surface into animations dict
         file_path = './graphics/objects/quest_status/'
         for animation in self.animations.keys():
-            self.animations[animation] = [pygame.transform.scale(img, (80, 80)) for img in import_folder(file_path + animation)]
+            self.animations[animation] = asset_manager.frames(file_path + animation, size = (80, 80))
 
         # Load first image
         self.frame_index = 0
@@ -235,7 +244,7 @@ class QuestionMarkSprite(pygame.sprite.Sprite):
     def __init__(self, pos, groups):
         
         # Load Image
-        self.image = pygame.image.load('./graphics/objects/question_mark.png').convert_alpha()
+        self.image = asset_manager.image('./graphics/objects/question_mark.png')
         
         # Position the Sprite
         self.pos = pos
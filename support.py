@@ -1,6 +1,6 @@
 from os import walk
 import pygame
-import os
+import os, threading
 
 # when the order of image surface matters
 def import_folder(path):
@@ -26,4 +26,23 @@ def import_folder_dict(path):
             image_surf = pygame.image.load(full_path).convert_alpha()
             surface_dict[image.split('.')[0]] = image_surf
 
-    return surface_dict
\ No newline at end of file
+    return surface_dict
+
+# animation sets loaded so far, keyed by folder and animation names
+animation_cache = {}
+animation_lock = threading.Lock()
+
+# when many sprites share the same animations (player and npcs)
+def import_animations(path, animations):
+    """
+    Frames of each animation folder under path, loaded and converted once per process.
+    The frame lists are shared by every caller and must not be modified.
+    """
+    key = (path, tuple(animations))
+    with animation_lock:
+        if key not in animation_cache:
+            animation_cache[key] = {
+                animation: [surf.convert_alpha() for surf in import_folder(path + animation)]
+                for animation in animations}
+        # each caller gets its own dict so replacing an entry stays local
+        return dict(animation_cache[key])
\ No newline at end of file
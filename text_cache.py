@@ -0,0 +1,71 @@
+from collections import OrderedDict
+import pygame
+import threading
+from settings import *
+
+class TextCache:
+    """
+    Shared fonts and a cache of rendered text surfaces.
+    Surfaces are keyed by (font, size, text, antialias, color) and shared by every caller,
+    so blit them but never draw on them. The least recently used surfaces are dropped past max_entries.
+    """
+    def __init__(self, max_entries = TEXT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.fonts = {}             # (file or system name, size, bold) -> font
+        self.font_keys = {}         # font -> its key in self.fonts
+        self.surfaces = OrderedDict()
+        self.lock = threading.Lock()    # notifications and tooltips can be drawn from the llm threads
+
+        # counters for stats()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def font(self, path, size):
+        """Font from a file, None for the pygame default font (same as pygame.font.Font)"""
+        return self.register(('file', path, size, False), lambda: pygame.font.Font(path, size))
+
+    def sys_font(self, name, size, bold = False):
+        """System font (same as pygame.font.SysFont)"""
+        return self.register(('system', name, size, bold), lambda: pygame.font.SysFont(name, size, bold))
+
+    def register(self, key, create):
+        with self.lock:
+            font = self.fonts.get(key)
+            if font is None:
+                font = self.fonts[key] = create()
+                self.font_keys[font] = key
+            return font
+
+    def render(self, font, text, antialias, color):
+        """Same as font.render(text, antialias, color), rendered once per distinct text"""
+        key = (self.font_keys.get(font, font), text, antialias, color)
+        with self.lock:
+            surf = self.surfaces.get(key)
+            if surf is not None:
+                self.hits += 1
+                self.surfaces.move_to_end(key)
+                return surf
+
+            self.misses += 1
+            surf = self.surfaces[key] = font.render(text, antialias, color)
+            if len(self.surfaces) > self.max_entries:
+                self.surfaces.popitem(last = False)
+                self.evictions += 1
+            return surf
+
+    def clear(self):
+        with self.lock:
+            self.surfaces.clear()
+
+    def stats(self):
+        return {
+            'fonts': len(self.fonts),
+            'entries': len(self.surfaces),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions}
+
+# shared by every module
+text_cache = TextCache()
@@ -0,0 +1,78 @@
+from collections import OrderedDict
+import pygame
+import threading
+from settings import *
+from text_cache import text_cache
+
+class TextLayout:
+    """
+    Word wrapping and pre-rendered paragraphs, worked out once per text.
+    Entries are keyed by the text itself, so changing the text is what invalidates them,
+    and the least recently used entries are dropped past max_entries.
+    """
+    def __init__(self, max_entries = TEXT_LAYOUT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.lines = OrderedDict()          # (text, font, max_width) -> tuple of lines
+        self.paragraphs = OrderedDict()     # (text, font, max_width, color, line_height, antialias) -> surface
+        self.lock = threading.Lock()
+
+    def wrap(self, text, font, max_width):
+        """Splits text into multiple lines based on available width."""
+        key = (text, text_cache.font_keys.get(font, font), max_width)
+        with self.lock:
+            lines = self.lookup(self.lines, key)
+            if lines is None:
+                lines = self.store(self.lines, key, tuple(wrap_words(text, font, max_width)))
+            return lines
+
+    def paragraph(self, text, font, max_width, color, line_height, antialias = True):
+        """The wrapped lines rendered line_height apart on one transparent surface"""
+        key = (text, text_cache.font_keys.get(font, font), max_width, color, line_height, antialias)
+        lines = self.wrap(text, font, max_width)
+        with self.lock:
+            surf = self.lookup(self.paragraphs, key)
+            if surf is None:
+                line_surfs = [text_cache.render(font, line, antialias, color) for line in lines]
+                width = max((line_surf.get_width() for line_surf in line_surfs), default = 0)
+                height = max((index * line_height + line_surf.get_height() for index, line_surf in enumerate(line_surfs)), default = 0)
+                surf = pygame.Surface((width, height), pygame.SRCALPHA)
+                for index, line_surf in enumerate(line_surfs):
+                    # copy the line pixels as they are so blitting the paragraph looks the same as blitting each line
+                    surf.blit(line_surf, (0, index * line_height), special_flags = pygame.BLEND_RGBA_MAX)
+                surf = self.store(self.paragraphs, key, surf)
+            return surf
+
+    def lookup(self, cache, key):
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+    def store(self, cache, key, value):
+        cache[key] = value
+        if len(cache) > self.max_entries:
+            cache.popitem(last = False)
+        return value
+
+def wrap_words(text, font, max_width):
+    words = text.split()  # Split text into individual words
+    lines = []
+    current_line = ""
+
+    for word in words:
+        # Check if adding this word exceeds the width
+        test_line = f"{current_line} {word}".strip()
+        if font.size(test_line)[0] < max_width:
+            current_line = test_line
+        else:
+            lines.append(current_line)  # Store current line and start a new one
+            current_line = word  # Start with the new word
+
+    # Append last line
+    if current_line:
+        lines.append(current_line)
+
+    return lines
+
+# shared by every module
+text_layout = TextLayout()
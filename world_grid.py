@@ -0,0 +1,239 @@
+import numpy as np
+import pygame
+import threading
+from enum import IntFlag
+from settings import *
+from map_data import load_map
+
+class TileFlag(IntFlag):
+    COLLISION = 1       # blocks movement
+    FARMABLE = 2        # soil can be tilled
+    TILLED = 4
+    WATERED = 8
+    PLANTED = 16
+    EVENT = 32          # occupied by a game master event sprite
+    OBSTACLE = 64       # covered by something pathfinding has to go around that is not on the Collision layer (fences, trees, flowers, rocks)
+
+ALL_FLAGS = TileFlag(sum(TileFlag))
+
+# tiles the static planners (a*, jump point search, flow fields, hpa*) never enter. Obstacles are placed once for the
+# fences, trees, flowers and rocks of the map and stay put like the Collision layer
+IMPASSABLE = TileFlag.COLLISION | TileFlag.OBSTACLE
+
+# tiles that can change under a walking npc, its cooperative search and incremental planner go around them
+DYNAMIC_OBSTACLES = TileFlag.OBSTACLE | TileFlag.PLANTED | TileFlag.EVENT
+
+class WorldGrid:
+    """
+    State of every map tile as a bitfield of TileFlags in one numpy array, indexed [y, x].
+    Soil, pathfinding and the game master all read and write it here instead of keeping their own grids.
+    Listeners registered with subscribe() are called with (flag, tiles) after tiles change.
+    """
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.flags = np.zeros((height, width), dtype = np.uint8)
+        self.versions = {flag: 0 for flag in TileFlag}      # bumped every time a flag changes anywhere
+        self.listeners = []                                 # [(flags, callback)]
+        self.lock = threading.Lock()                        # npc tools write from the llm threads
+        self.rows = {}                                      # flag -> (version, nested lists) for row_lists()
+        self.obstacles = {}                                 # obstacle -> tiles it covers
+        self.obstacle_counts = {}                           # tile -> number of obstacles on it
+
+    @classmethod
+    def from_map(cls, map_data = None):
+        map_data = map_data or load_map()
+        world_grid = cls(map_data.width, map_data.height)
+        world_grid.flags[map_data.mask('Collision')] |= int(TileFlag.COLLISION)
+        world_grid.flags[map_data.mask('Farmable')] |= int(TileFlag.FARMABLE)
+        return world_grid
+
+    # tiles
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def tile_at(self, pos):
+        """Tile containing a world position"""
+        return (int(pos[0] // TILE_SIZE), int(pos[1] // TILE_SIZE))
+
+    def has(self, tile, flag):
+        x, y = tile
+        return self.in_bounds(x, y) and bool(self.flags[y, x] & flag)
+
+    def get(self, tile):
+        x, y = tile
+        return TileFlag(int(self.flags[y, x])) if self.in_bounds(x, y) else TileFlag(0)
+
+    def set(self, tile, flag, value = True):
+        """Sets or clears flag on one tile. Returns True if the tile changed"""
+        x, y = tile
+        if not self.in_bounds(x, y):
+            return False
+        flag = int(flag)
+        with self.lock:
+            old = int(self.flags[y, x])
+            new = old | flag if value else old & ~flag
+            if new == old:
+                return False
+            self.flags[y, x] = new
+            changed = TileFlag(int(old ^ new))
+            self.bump(changed)
+        self.notify(changed, [(x, y)])
+        return True
+
+    def clear(self, tile, flag):
+        return self.set(tile, flag, False)
+
+    def is_blocked(self, tile):
+        """Impassable tiles and everything outside the map block movement"""
+        x, y = tile
+        return not self.in_bounds(x, y) or bool(self.flags[y, x] & IMPASSABLE)
+
+    def closest_open_tile(self, tile):
+        """tile itself if it does not block movement, else the closest tile that does not. None if every tile does"""
+        if not self.is_blocked(tile):
+            return tile
+        open_tiles = np.argwhere(~self.mask(IMPASSABLE))
+        if not len(open_tiles):
+            return None
+        y, x = open_tiles[np.argmin(((open_tiles - (tile[1], tile[0])) ** 2).sum(axis = 1))]
+        return (int(x), int(y))
+
+    def is_farmable(self, tile):
+        return self.has(tile, TileFlag.FARMABLE)
+
+    def is_tilled(self, tile):
+        return self.has(tile, TileFlag.TILLED)
+
+    def is_watered(self, tile):
+        return self.has(tile, TileFlag.WATERED)
+
+    def is_planted(self, tile):
+        return self.has(tile, TileFlag.PLANTED)
+
+    def has_event(self, tile):
+        return self.has(tile, TileFlag.EVENT)
+
+    def tiles_under(self, rect):
+        """Tiles a world rect overlaps"""
+        rect = pygame.Rect(rect)
+        left, top = rect.left // TILE_SIZE, rect.top // TILE_SIZE
+        right, bottom = max(rect.right - 1, rect.left) // TILE_SIZE, max(rect.bottom - 1, rect.top) // TILE_SIZE
+        return [(x, y) for y in range(top, bottom + 1) for x in range(left, right + 1) if self.in_bounds(x, y)]
+
+    # dynamic obstacles
+    def place_obstacle(self, obstacle, tiles):
+        """Puts an obstacle on tiles, moving it off the tiles it covered before. OBSTACLE stays set while any obstacle covers a tile"""
+        tiles = frozenset(tile for tile in tiles if self.in_bounds(*tile))
+        old_tiles = self.obstacles.get(obstacle, frozenset())
+        if tiles == old_tiles:
+            return
+        if tiles:
+            self.obstacles[obstacle] = tiles
+        else:
+            self.obstacles.pop(obstacle, None)
+
+        for tile in tiles - old_tiles:
+            self.obstacle_counts[tile] = self.obstacle_counts.get(tile, 0) + 1
+            if self.obstacle_counts[tile] == 1:
+                self.set(tile, TileFlag.OBSTACLE)
+        for tile in old_tiles - tiles:
+            self.obstacle_counts[tile] -= 1
+            if not self.obstacle_counts[tile]:
+                del self.obstacle_counts[tile]
+                self.clear(tile, TileFlag.OBSTACLE)
+
+    def remove_obstacle(self, obstacle):
+        self.place_obstacle(obstacle, ())
+
+    # regions
+    def region(self, rect = None):
+        """Slices of a tile rect (clipped to the map), the whole map for None"""
+        if rect is None:
+            return (slice(0, self.height), slice(0, self.width))
+        rect = pygame.Rect(rect).clip(pygame.Rect(0, 0, self.width, self.height))
+        return (slice(rect.top, rect.bottom), slice(rect.left, rect.right))
+
+    def mask(self, flag, exclude = 0, rect = None):
+        """Boolean array of the tiles that have any of flag and none of exclude"""
+        # plain ints, numpy would widen the array to int64 for an IntFlag
+        flags = self.flags[self.region(rect)]
+        result = (flags & int(flag)) != 0
+        if exclude:
+            result &= (flags & int(exclude)) == 0
+        return result
+
+    def tiles(self, flag, exclude = 0, rect = None):
+        """(x, y) tiles that have any of flag and none of exclude, in row order"""
+        rows, cols = self.region(rect)
+        ys, xs = np.nonzero(self.mask(flag, exclude, rect))
+        return list(zip((xs + cols.start).tolist(), (ys + rows.start).tolist()))
+
+    def count(self, flag, exclude = 0, rect = None):
+        return int(np.count_nonzero(self.mask(flag, exclude, rect)))
+
+    def any(self, flag, exclude = 0, rect = None):
+        return bool(self.mask(flag, exclude, rect).any())
+
+    def set_where(self, flag, where, value = True, rect = None):
+        """
+        Sets or clears flag on every tile where the boolean array is True (shaped like rect).
+        Returns the tiles that changed, in row order
+        """
+        rows, cols = self.region(rect)
+        flag = int(flag)
+        with self.lock:
+            flags = self.flags[rows, cols]     # a view, so writing it writes the grid
+            where = where & (((flags & flag) == 0) if value else ((flags & flag) != 0))
+            if not where.any():
+                return []
+            if value:
+                flags[where] |= flag
+            else:
+                flags[where] &= np.uint8(~flag & 0xFF)
+            self.bump(TileFlag(flag))
+        ys, xs = np.nonzero(where)
+        changed = list(zip((xs + cols.start).tolist(), (ys + rows.start).tolist()))
+        self.notify(TileFlag(flag), changed)
+        return changed
+
+    def set_region(self, flag, value = True, only = 0, rect = None):
+        """Sets or clears flag on the tiles of rect (that have any of only, if given)"""
+        rows, cols = self.region(rect)
+        where = np.ones((rows.stop - rows.start, cols.stop - cols.start), dtype = bool)
+        if only:
+            where = self.mask(only, rect = rect)
+        return self.set_where(flag, where, value, rect)
+
+    def row_lists(self, flag):
+        """
+        Nested lists of booleans ([y][x]) for the tiles that have flag.
+        Faster than the array for one tile at a time lookups (a* neighbours), rebuilt when flag changes
+        """
+        version = self.version(flag)
+        cached = self.rows.get(flag)
+        if cached is None or cached[0] != version:
+            cached = self.rows[flag] = (version, self.mask(flag).tolist())
+        return cached[1]
+
+    # change tracking
+    def bump(self, changed):
+        for flag in TileFlag:
+            if changed & flag:
+                self.versions[flag] += 1
+
+    def version(self, flag):
+        """Sum of the change counters of flag, so any change to one of them changes it"""
+        return sum(version for single, version in self.versions.items() if flag & single)
+
+    def subscribe(self, callback, flags = ALL_FLAGS):
+        """callback(changed_flags, tiles) runs after any of flags changes, on the thread that changed it"""
+        self.listeners.append((flags, callback))
+
+    def unsubscribe(self, callback):
+        self.listeners = [(flags, listener) for flags, listener in self.listeners if listener != callback]
+
+    def notify(self, changed, tiles):
+        for flags, callback in list(self.listeners):
+            if flags & changed:
+                callback(changed & flags, tiles)